@@ -11,7 +11,6 @@ or for third party directories that can be open sourced.
 
 import os
 
-from src.build import analyze_diffs
 from src.build import build_common
 from src.build import lint_source
 from src.build import ninja_generator
@@ -19,6 +18,7 @@ from src.build import ninja_generator_runner
 from src.build import open_source
 from src.build import staging
 from src.build import toolchain
+from src.build import tracking_path_index
 from src.build.build_options import OPTIONS
 
 
@@ -211,12 +211,10 @@ def _generate_lint_ninjas():
   files = lint_source.get_all_files_to_check()
   results = []
   for f in files:
-    with ninja_generator.open_dependency(f, 'r',
-                                         ignore_dependency=True) as source_file:
-      tracking_path = analyze_diffs.compute_tracking_path(None, f, source_file)
-      implicit = implicit_base[:]
-      if tracking_path:
-        implicit.append(tracking_path)
+    tracking_path = tracking_path_index.get_tracking_path(f)
+    implicit = implicit_base[:]
+    if tracking_path:
+      implicit.append(tracking_path)
     out = os.path.join(build_common.OUT_DIR, 'lint', f + '.result')
     n.build(out, 'lint', f, implicit=implicit, use_staging=False)
     results.append(out)
@@ -2,11 +2,11 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-import cPickle
 import collections
 import errno
 import logging
 import marshal
+import multiprocessing
 import os
 import re
 
@@ -18,14 +18,28 @@ from src.build import make_to_ninja
 from src.build import ninja_generator
 from src.build import ninja_generator_runner
 from src.build import open_source
+from src.build import shared_index
 from src.build.build_options import OPTIONS
+from src.build.util import concurrent
 from src.build.util import file_util
 
 
-_CONFIG_CACHE_VERSION = 1
+_CONFIG_CACHE_VERSION = 3
 
 _config_loader = config_loader.ConfigLoader()
 
+# A map from a cache file path to the cache object, which is kept in memory
+# across generate_ninjas() calls in the configure daemon. This is None unless
+# enable_warm_caches() is called.
+_warm_caches = None
+
+# True once the shared directory index is loaded into |_warm_caches|.
+_is_directory_index_warm = False
+
+# True once the global settings for the ninja generators are set up. They must
+# be set up only once even if generate_ninjas() is called multiple times.
+_is_global_settings_set_up = False
+
 
 def _get_build_system_dependencies():
   options_file = build_common.get_target_configure_options_file()
@@ -58,8 +72,59 @@ class ConfigResult(object):
 
 
 class FileEntry(object):
-  def __init__(self, mtime):
+  """Represents the state of a depended file at the time the cache is made.
+
+  The (size, mtime, inode) triple is checked first. If it does not match, e.g.
+  because a git checkout rewrote the file, the file is considered as unchanged
+  as long as the SHA-1 digest of its contents is the same.
+  """
+
+  def __init__(self, mtime, size=None, inode=None, digest=None):
     self.mtime = mtime
+    self.size = size
+    self.inode = inode
+    self.digest = digest
+
+  def matches_stat(self, st):
+    return (st.st_mtime == self.mtime and st.st_size == self.size and
+            st.st_ino == self.inode)
+
+  def check_freshness(self, path, st):
+    """Returns True if |path| whose stat is |st| is not changed.
+
+    When the contents turn out to be unchanged but the stat is different, the
+    entry is updated so that the next check can take the fast path.
+    """
+    if self.matches_stat(st):
+      return True
+    if self.digest is None or st.st_size != self.size:
+      return False
+    if _compute_digest(path) != self.digest:
+      return False
+    self.mtime = st.st_mtime
+    self.inode = st.st_ino
+    return True
+
+  def to_tuple(self, path):
+    return (path, self.mtime, self.size, self.inode, self.digest)
+
+
+def _compute_digest(path):
+  try:
+    return file_util.compute_file_digest(path)
+  except IOError as e:
+    # Directories are only checked with their stat.
+    if e.errno != errno.EISDIR:
+      raise
+    return None
+
+
+def _file_entry_from_stat(path, st):
+  return FileEntry(st.st_mtime, st.st_size, st.st_ino, _compute_digest(path))
+
+
+def _file_entries_from_list(list):
+  return {item[0]: FileEntry(*item[1:]) for item in list}
 
 
 class CacheDependency(object):
@@ -70,15 +135,23 @@ class CacheDependency(object):
   def __init__(self, files=None, listings=None):
     self.files = {} if files is None else files
     self.listings = set() if listings is None else listings
+    # True if check_freshness() found touch-only changes and updated entries.
+    self.is_updated = False
 
   def refresh(self, file_paths, queries):
     files = {}
     for path in file_paths:
       try:
-        files[path] = FileEntry(os.stat(path).st_mtime)
+        st = os.stat(path)
       except OSError as e:
         if e.errno != errno.ENOENT:
           raise
+        continue
+      # Reuse the digest of the files that are not touched since the last run.
+      entry = self.files.get(path)
+      if entry is None or not entry.matches_stat(st):
+        entry = _file_entry_from_stat(path, st)
+      files[path] = entry
     self.files = files
 
     listings = set()
@@ -95,24 +168,48 @@ class CacheDependency(object):
       listing.refresh_cache()
     self.listings = listings
 
-  def check_freshness(self):
-    for path in self.files:
+  def check_freshness(self, changed_paths=None):
+    """Returns True if the dependencies are not changed.
+
+    If |changed_paths|, a set of normalized paths, is given, only the files
+    and the listings which may be affected by them are checked.
+    """
+    self.is_updated = False
+    for path, entry in self.files.iteritems():
+      if (changed_paths is not None and
+          os.path.normpath(path) not in changed_paths):
+        continue
       try:
-        if os.stat(path).st_mtime != self.files[path].mtime:
+        st = os.stat(path)
+        if entry.matches_stat(st):
+          continue
+        if not entry.check_freshness(path, st):
           return False
+        self.is_updated = True
       except OSError as e:
         if e.errno == errno.ENOENT:
           return False
         raise
     for listing in self.listings:
+      if (changed_paths is not None and
+          not listing.is_affected_by(changed_paths)):
+        continue
       if not listing.refresh_cache():
         return False
     return True
 
+  def get_directories(self):
+    """Returns the directories where the dependencies may be changed."""
+    directories = {os.path.dirname(path) or '.' for path in self.files}
+    for listing in self.listings:
+      directories.update(listing.query.base_paths)
+      directories.update(listing.cache_entries)
+    return directories
+
   def to_dict(self):
     return {
         'version': _CONFIG_CACHE_VERSION,
-        'files': [(path, entry.mtime)
+        'files': [entry.to_tuple(path)
                   for path, entry in self.files.iteritems()],
         'listings': [listing.to_dict() for listing in self.listings]}
 
@@ -128,6 +225,8 @@ class ConfigCache(object):
     self.config_name = config_name
     self.entry_point = entry_point
     self.deps = CacheDependency(files, listings)
+    # A list of dicts made by RenderedNinja.to_dict(), so that it is saved
+    # with marshal as is.
     self.serialized_generated_ninjas = serialized_generated_ninjas
 
   def refresh_with_config_result(self, config_result):
@@ -135,21 +234,17 @@ class ConfigCache(object):
     assert self.entry_point == config_result.entry_point
     self.deps.refresh(config_result.get_file_dependency(),
                       config_result.listing_queries)
-    self.serialized_generated_ninjas = cPickle.dumps(
-        config_result.generated_ninjas)
+    self.serialized_generated_ninjas = [
+        ninja.to_dict() for ninja in config_result.generated_ninjas]
 
-  def check_cache_freshness(self):
+  def check_cache_freshness(self, changed_paths=None):
     """Returns True if the cache is fresh."""
 
-    return self.deps.check_freshness()
+    return self.deps.check_freshness(changed_paths)
 
   def to_config_result(self):
-    try:
-      generated_ninjas = cPickle.loads(self.serialized_generated_ninjas)
-    except Exception:
-      logging.warning('Failed to load NinjaGenerator from cache: %s',
-                      self.config_name, exc_info=True)
-      return None
+    generated_ninjas = [ninja_generator.RenderedNinja(data)
+                        for data in self.serialized_generated_ninjas]
     return ConfigResult(self.config_name, self.entry_point,
                         set(self.deps.files.keys()),
                         {listing.query for listing in self.deps.listings},
@@ -160,7 +255,7 @@ class ConfigCache(object):
         'version': _CONFIG_CACHE_VERSION,
         'config_name': self.config_name,
         'entry_point': self.entry_point,
-        'files': [(path, entry.mtime)
+        'files': [entry.to_tuple(path)
                   for path, entry in self.deps.files.iteritems()],
         'listings': [listing.to_dict() for listing in self.deps.listings],
         'generated_ninjas': self.serialized_generated_ninjas,
@@ -194,7 +289,7 @@ def _load_global_deps_from_file(cache_path):
   if data is None or data['version'] != _CONFIG_CACHE_VERSION:
     return None
 
-  files = {path: FileEntry(mtime) for path, mtime in data['files']}
+  files = _file_entries_from_list(data['files'])
   listings = set()
   for dict in data['listings']:
     listing = file_list_cache.file_list_cache_from_dict(dict)
@@ -211,7 +306,7 @@ def _load_config_cache_from_file(path):
 
   config_name = data['config_name']
   entry_point = data['entry_point']
-  files = {path: FileEntry(mtime) for path, mtime in data['files']}
+  files = _file_entries_from_list(data['files'])
   listings = set()
   for dict in data['listings']:
     listing = file_list_cache.file_list_cache_from_dict(dict)
@@ -225,25 +320,10 @@ def _load_config_cache_from_file(path):
 
 
 def _config_cache_from_config_result(config_result):
-  files = {}
-  for path in config_result.get_file_dependency():
-    try:
-      files[path] = FileEntry(os.stat(path).st_mtime)
-    except OSError as e:
-      if e.errno != errno.ENOENT:
-        raise
-
-  listings = set()
-  for query in config_result.listing_queries:
-    listing = file_list_cache.FileListCache(query)
-    listing.refresh_cache()
-    listings.add(listing)
-
-  return ConfigCache(
-      config_result.config_name,
-      config_result.entry_point,
-      files, listings,
-      cPickle.dumps(config_result.generated_ninjas))
+  config_cache = ConfigCache(config_result.config_name,
+                             config_result.entry_point, None, None, None)
+  config_cache.refresh_with_config_result(config_result)
+  return config_cache
 
 
 class ConfigContext:
@@ -269,14 +349,25 @@ class ConfigContext:
     dependency_inspection.stop_inspection()
 
   def make_result(self, ninja_list):
+    # Only the rendered form of the ninjas is returned to the parent process
+    # to reduce the cost of pickling.
     return ConfigResult(self.config_name, self.entry_point,
-                        self.files, self.listing_queries, ninja_list)
+                        self.files, self.listing_queries,
+                        [ninja.render() for ninja in ninja_list])
 
 
 def _get_global_deps_file_path():
   return os.path.join(build_common.get_config_cache_dir(), 'global_deps')
 
 
+def _get_directory_index_file_path():
+  return os.path.join(build_common.get_config_cache_dir(), 'directory_index')
+
+
+def _get_task_duration_file_path():
+  return os.path.join(build_common.get_config_cache_dir(), 'task_durations')
+
+
 def _get_cache_file_path(config_name, entry_point):
   return os.path.join(build_common.get_config_cache_dir(),
                       config_name, entry_point)
@@ -335,11 +426,21 @@ def _list_ninja_generators(config_loader, name):
            getattr(module, name))
 
 
-def _set_up_generate_ninja():
-  # Create generated_ninja directory if necessary.
-  ninja_dir = build_common.get_generated_ninja_dir()
-  if not os.path.exists(ninja_dir):
-    os.makedirs(ninja_dir)
+def _load_cache(cache_path, load_function):
+  """Loads a cache object from |cache_path| or from the warm caches."""
+  if _warm_caches is not None and cache_path in _warm_caches:
+    return _warm_caches[cache_path]
+  cache_object = load_function(cache_path)
+  if _warm_caches is not None and cache_object is not None:
+    _warm_caches[cache_path] = cache_object
+  return cache_object
+
+
+def _set_up_global_settings():
+  global _is_global_settings_set_up
+  if _is_global_settings_set_up:
+    return
+  _is_global_settings_set_up = True
 
   # Set up default resource path.
   framework_resources_base_path = (
@@ -351,6 +452,29 @@ def _set_up_generate_ninja():
   make_to_ninja.MakefileNinjaTranslator.add_global_filter(
       _filter_all_make_to_ninja)
 
+
+def _set_up_generate_ninja(changed_paths):
+  # Create generated_ninja directory if necessary.
+  ninja_dir = build_common.get_generated_ninja_dir()
+  if not os.path.exists(ninja_dir):
+    os.makedirs(ninja_dir)
+
+  _set_up_global_settings()
+
+  global_deps_path = _get_global_deps_file_path()
+  if _warm_caches is not None and global_deps_path in _warm_caches:
+    # The files for make_to_ninja and the config modules are set up in a
+    # previous run. Reuse them unless the build system is changed.
+    global_deps = _warm_caches[global_deps_path]
+    if global_deps.check_freshness(changed_paths):
+      if changed_paths is None or any(
+          os.path.basename(path) == 'config.py' for path in changed_paths):
+        _config_loader.load()
+      cache_to_save = []
+      if global_deps.is_updated:
+        cache_to_save.append((global_deps, global_deps_path))
+      return False, cache_to_save
+
   dependency_inspection.start_inspection()
   dependency_inspection.add_files(*_get_build_system_dependencies())
   make_to_ninja.prepare_make_to_ninja()
@@ -362,24 +486,23 @@ def _set_up_generate_ninja():
   needs_clobbering = True
   if OPTIONS.enable_config_cache():
     needs_clobbering = False
-    cache_path = _get_global_deps_file_path()
-    global_deps = _load_global_deps_from_file(cache_path)
+    global_deps = _load_cache(global_deps_path, _load_global_deps_from_file)
     if global_deps is None:
       needs_clobbering = True
       global_deps = CacheDependency()
     else:
-      if not global_deps.check_freshness():
+      if not global_deps.check_freshness(changed_paths):
         needs_clobbering = True
     global_deps.refresh(depended_files, depended_listings)
 
-    cache_to_save.append((global_deps, cache_path))
+    cache_to_save.append((global_deps, global_deps_path))
 
   _config_loader.load()
 
   return needs_clobbering, cache_to_save
 
 
-def _generate_independent_ninjas(needs_clobbering):
+def _generate_independent_ninjas(needs_clobbering, history, changed_paths):
   timer = build_common.SimpleTimer()
 
   # Invoke an unordered set of ninja-generators distributed across config
@@ -395,26 +518,29 @@ def _generate_independent_ninjas(needs_clobbering):
   task_list = []
   cached_result_list = []
   cache_miss = {}
+  cache_updated = []
 
   for config_context, generator in generator_list:
     cache_path = _get_cache_file_path(config_context.config_name,
                                       config_context.entry_point)
     config_cache = None
     if OPTIONS.enable_config_cache() and not needs_clobbering:
-      config_cache = _load_config_cache_from_file(cache_path)
+      config_cache = _load_cache(cache_path, _load_config_cache_from_file)
 
-    if config_cache is not None and config_cache.check_cache_freshness():
-      cached_result = config_cache.to_config_result()
-      if cached_result is not None:
-        cached_result_list.append(cached_result)
-        continue
+    if (config_cache is not None and
+        config_cache.check_cache_freshness(changed_paths)):
+      cached_result_list.append(config_cache.to_config_result())
+      if config_cache.deps.is_updated:
+        # Persist the updated file stats to skip digest checks next time.
+        cache_updated.append((config_cache, cache_path))
+      continue
 
     task_list.append(ninja_generator_runner.GeneratorTask(
         config_context, generator))
     cache_miss[cache_path] = config_cache
 
   result_list = ninja_generator_runner.run_in_parallel(
-      task_list, OPTIONS.configure_jobs())
+      task_list, OPTIONS.configure_jobs(), history)
 
   aggregated_result = {}
   ninja_list = []
@@ -430,7 +556,7 @@ def _generate_independent_ninjas(needs_clobbering):
   for cached_result in cached_result_list:
     ninja_list.extend(cached_result.generated_ninjas)
 
-  cache_to_save = []
+  cache_to_save = cache_updated
   if OPTIONS.enable_config_cache():
     for cache_path, config_result in aggregated_result.iteritems():
       config_cache = cache_miss[cache_path]
@@ -446,7 +572,7 @@ def _generate_independent_ninjas(needs_clobbering):
   return ninja_list, cache_to_save
 
 
-def _generate_shared_lib_depending_ninjas(ninja_list):
+def _generate_shared_lib_depending_ninjas(ninja_list, history):
   timer = build_common.SimpleTimer()
 
   timer.start('Generating plugin and packaging ninjas', OPTIONS.verbose())
@@ -468,7 +594,7 @@ def _generate_shared_lib_depending_ninjas(ninja_list):
           config_context,
           (generator, production_shared_libs))
        for config_context, generator in generator_list],
-      OPTIONS.configure_jobs())
+      OPTIONS.configure_jobs(), history)
   ninja_list = []
   for config_result in result_list:
     ninja_list.extend(config_result.generated_ninjas)
@@ -478,7 +604,7 @@ def _generate_shared_lib_depending_ninjas(ninja_list):
   return ninja_list
 
 
-def _generate_dependent_ninjas(ninja_list):
+def _generate_dependent_ninjas(ninja_list, history):
   """Generate the stage of ninjas coming after all executables."""
   timer = build_common.SimpleTimer()
 
@@ -489,6 +615,20 @@ def _generate_dependent_ninjas(ninja_list):
     root_dir_install_all_targets.extend(build_common.get_android_fs_path(p) for
                                         p in n._root_dir_install_targets)
 
+  # The test lists depend only on the ninjas of the previous phases, so they
+  # are generated in the main process while the workers run the tasks below.
+  test_list_ninjas = []
+
+  def _generate_test_list_ninjas():
+    all_test_lists_ninja = ninja_generator.NinjaGenerator('all_test_lists')
+    all_test_lists_ninja.build_all_test_lists(ninja_list)
+    test_list_ninjas.append(all_test_lists_ninja)
+
+    all_unittest_info_ninja = ninja_generator.NinjaGenerator(
+        'all_unittest_info')
+    all_unittest_info_ninja.build_all_unittest_info(ninja_list)
+    test_list_ninjas.append(all_unittest_info_ninja)
+
   generator_list = _list_ninja_generators(_config_loader,
                                           'generate_binaries_depending_ninjas')
   result_list = ninja_generator_runner.run_in_parallel(
@@ -496,7 +636,8 @@ def _generate_dependent_ninjas(ninja_list):
           config_context,
           (generator, root_dir_install_all_targets))
           for config_context, generator in generator_list],
-      OPTIONS.configure_jobs())
+      OPTIONS.configure_jobs(), history,
+      main_process_task=_generate_test_list_ninjas)
   dependent_ninjas = []
   for config_result in result_list:
     dependent_ninjas.extend(config_result.generated_ninjas)
@@ -504,14 +645,7 @@ def _generate_dependent_ninjas(ninja_list):
   notice_ninja = ninja_generator.NoticeNinjaGenerator('notices')
   notice_ninja.build_notices(ninja_list + dependent_ninjas)
   dependent_ninjas.append(notice_ninja)
-
-  all_test_lists_ninja = ninja_generator.NinjaGenerator('all_test_lists')
-  all_test_lists_ninja.build_all_test_lists(ninja_list)
-  dependent_ninjas.append(all_test_lists_ninja)
-
-  all_unittest_info_ninja = ninja_generator.NinjaGenerator('all_unittest_info')
-  all_unittest_info_ninja.build_all_unittest_info(ninja_list)
-  dependent_ninjas.append(all_unittest_info_ninja)
+  dependent_ninjas.extend(test_list_ninjas)
 
   timer.done()
   return dependent_ninjas
@@ -538,15 +672,15 @@ def _verify_ninja_generator_list(ninja_list):
     key = (ninja.get_module_name(), ninja.is_host())
     module_name_count_dict[key] += 1
     output_path_name_count_dict[ninja.get_ninja_path()] += 1
-    if isinstance(ninja, ninja_generator.ArchiveNinjaGenerator):
+    kind = ninja.get_generator_kind()
+    if kind == 'archive':
       archive_ninja_list.append(ninja)
-    if isinstance(ninja, ninja_generator.SharedObjectNinjaGenerator):
+    elif kind == 'shared_object':
       shared_ninja_list.append(ninja)
-    if isinstance(ninja, ninja_generator.ExecNinjaGenerator):
-      if isinstance(ninja, ninja_generator.TestNinjaGenerator):
-        test_ninja_list.append(ninja)
-      else:
-        exec_ninja_list.append(ninja)
+    elif kind == 'exec':
+      exec_ninja_list.append(ninja)
+    elif kind == 'test':
+      test_ninja_list.append(ninja)
 
   # Make sure there are no duplicated ninja modules.
   duplicated_module_list = [
@@ -578,14 +712,52 @@ def _verify_ninja_generator_list(ninja_list):
         archive_ninja_list, shared_ninja_list, exec_ninja_list, test_ninja_list)
 
 
-def generate_ninjas():
-  needs_clobbering, cache_to_save = _set_up_generate_ninja()
+def _emit_ninjas(ninja_list):
+  """Emits ninja files in parallel, and returns the number of updated files.
+
+  The contents are already rendered in this process, so writing them is
+  distributed to threads rather than processes to avoid copying the contents.
+  """
+  if OPTIONS.configure_jobs() == 0:
+    executor = concurrent.SynchronousExecutor()
+  else:
+    executor = concurrent.ThreadPoolExecutor(
+        OPTIONS.configure_jobs() or multiprocessing.cpu_count(), daemon=True)
+  with executor:
+    future_list = [executor.submit(ninja.emit) for ninja in ninja_list]
+    return sum(1 for future in future_list if future.result())
+
+
+def generate_ninjas(changed_paths=None):
+  """Generates all ninja files.
+
+  |changed_paths| is passed from the configure daemon. If it is given, only
+  the caches which depend on the paths are checked.
+  """
+  global _is_directory_index_warm
+  if OPTIONS.enable_config_cache():
+    if _is_directory_index_warm:
+      # The configure daemon keeps the index in memory. The directories just
+      # need to be checked again.
+      file_list_cache.invalidate_directory_index()
+    else:
+      file_list_cache.load_directory_index(_get_directory_index_file_path())
+      _is_directory_index_warm = _warm_caches is not None
+    shared_index.load_all(build_common.get_config_cache_dir())
+  # Re-scan the changed files here at once, rather than letting each
+  # subprocess find and read them again. The subprocesses inherit the
+  # refreshed entries, so they do not need to send them back.
+  shared_index.refresh_all()
+  shared_index.pop_new_entries()
+  needs_clobbering, cache_to_save = _set_up_generate_ninja(changed_paths)
+  history = ninja_generator_runner.TaskDurationHistory(
+      _get_task_duration_file_path())
   ninja_list, independent_ninja_cache = _generate_independent_ninjas(
-      needs_clobbering)
+      needs_clobbering, history, changed_paths)
   cache_to_save.extend(independent_ninja_cache)
   ninja_list.extend(
-      _generate_shared_lib_depending_ninjas(ninja_list))
-  ninja_list.extend(_generate_dependent_ninjas(ninja_list))
+      _generate_shared_lib_depending_ninjas(ninja_list, history))
+  ninja_list.extend(_generate_dependent_ninjas(ninja_list, history))
 
   top_level_ninja = _generate_top_level_ninja(ninja_list)
   ninja_list.append(top_level_ninja)
@@ -596,12 +768,48 @@ def generate_ninjas():
   # Emit each ninja script to a file.
   timer = build_common.SimpleTimer()
   timer.start('Emitting ninja scripts', OPTIONS.verbose())
-  for ninja in ninja_list:
-    ninja.emit()
+  num_updated = _emit_ninjas(ninja_list)
   top_level_ninja.emit_depfile()
+  top_level_ninja.emit_dependency_graph(ninja_list)
   top_level_ninja.cleanup_out_directories(ninja_list)
   timer.done()
+  logging.info('%d of %d ninja files updated', num_updated, len(ninja_list))
 
+  history.save()
   if OPTIONS.enable_config_cache():
     for cache_object, cache_path in cache_to_save:
       cache_object.save_to_file(cache_path)
+      if _warm_caches is not None:
+        _warm_caches[cache_path] = cache_object
+    file_list_cache.save_directory_index(_get_directory_index_file_path())
+    shared_index.save_all(build_common.get_config_cache_dir())
+
+
+def enable_warm_caches():
+  """Keeps the caches in memory across generate_ninjas() calls."""
+  global _warm_caches
+  if _warm_caches is None:
+    _warm_caches = {}
+
+
+def _get_warm_cache_dependencies():
+  for cache_object in _warm_caches.itervalues():
+    if isinstance(cache_object, ConfigCache):
+      cache_object = cache_object.deps
+    yield cache_object
+
+
+def get_dependency_directories():
+  """Returns the directories which the warm caches depend on."""
+  directories = set()
+  for deps in _get_warm_cache_dependencies():
+    directories.update(deps.get_directories())
+  return directories
+
+
+def get_dependency_files():
+  """Returns the files which the warm caches depend on."""
+  files = set()
+  for deps in _get_warm_cache_dependencies():
+    files.update(deps.files)
+  return files
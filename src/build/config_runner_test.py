@@ -0,0 +1,135 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for config_runner.py."""
+
+import atexit
+import os
+import tempfile
+import unittest
+
+from src.build import config_runner
+from src.build import ninja_generator
+from src.build.build_options import OPTIONS
+from src.build.util import file_util
+
+
+def _write(path, content):
+  with open(path, 'w') as f:
+    f.write(content)
+
+
+class CacheDependencyUnittest(unittest.TestCase):
+  def setUp(self):
+    tmpdir = tempfile.mkdtemp()
+    os.chdir(tmpdir)
+    atexit.register(lambda: file_util.rmtree(tmpdir, ignore_errors=True))
+
+    _write('foo.mk', 'LOCAL_MODULE := foo\n')
+    os.utime('foo.mk', (0, 0))
+
+  def _create_dependency(self):
+    deps = config_runner.CacheDependency()
+    deps.refresh({'foo.mk'}, set())
+    return deps
+
+  def testUnchangedFile(self):
+    deps = self._create_dependency()
+    self.assertTrue(deps.check_freshness())
+    self.assertFalse(deps.is_updated)
+
+  def testTouchedFile(self):
+    deps = self._create_dependency()
+    os.utime('foo.mk', (100, 100))
+    self.assertTrue(deps.check_freshness())
+    self.assertTrue(deps.is_updated)
+    self.assertEquals(100, deps.files['foo.mk'].mtime)
+
+  def testRecreatedFile(self):
+    deps = self._create_dependency()
+    os.remove('foo.mk')
+    _write('foo.mk', 'LOCAL_MODULE := foo\n')
+    self.assertTrue(deps.check_freshness())
+
+  def testModifiedFile(self):
+    deps = self._create_dependency()
+    _write('foo.mk', 'LOCAL_MODULE := bar\n')
+    os.utime('foo.mk', (100, 100))
+    self.assertFalse(deps.check_freshness())
+
+  def testRemovedFile(self):
+    deps = self._create_dependency()
+    os.remove('foo.mk')
+    self.assertFalse(deps.check_freshness())
+
+  def testChangedPaths(self):
+    deps = self._create_dependency()
+    _write('foo.mk', 'LOCAL_MODULE := bar\n')
+    os.utime('foo.mk', (100, 100))
+    # Only the files in the given changed paths are checked.
+    self.assertTrue(deps.check_freshness(set()))
+    self.assertTrue(deps.check_freshness({'bar.mk'}))
+    self.assertFalse(deps.check_freshness({'foo.mk'}))
+
+  def testGetDirectories(self):
+    os.mkdir('bar')
+    _write('bar/bar.mk', '')
+    deps = config_runner.CacheDependency()
+    deps.refresh({'foo.mk', 'bar/bar.mk'}, set())
+    self.assertEquals({'.', 'bar'}, deps.get_directories())
+
+  def testSaveAndLoad(self):
+    deps = self._create_dependency()
+    try:
+      fd, path = tempfile.mkstemp()
+      deps.save_to_file(path)
+      deps2 = config_runner._load_global_deps_from_file(path)
+    finally:
+      os.close(fd)
+      os.remove(path)
+
+    os.utime('foo.mk', (100, 100))
+    self.assertTrue(deps2.check_freshness())
+
+
+class ConfigCacheUnittest(unittest.TestCase):
+  def setUp(self):
+    OPTIONS.parse([])
+    tmpdir = tempfile.mkdtemp()
+    atexit.register(lambda: file_util.rmtree(tmpdir, ignore_errors=True))
+    self._cache_path = os.path.join(tmpdir, 'cache')
+
+  def _make_config_result(self):
+    context = config_runner.ConfigContext('config.py', 'config', 'generate')
+    ninja = ninja_generator.NinjaGenerator('foo', host=True)
+    ninja.build('out/foo', 'cp', 'src/foo')
+    return context.make_result([ninja])
+
+  def testMakeResult(self):
+    config_result = self._make_config_result()
+    ninja = config_result.generated_ninjas[0]
+    self.assertIsInstance(ninja, ninja_generator.RenderedNinja)
+    self.assertEquals('foo', ninja.get_module_name())
+    self.assertTrue(ninja.is_host())
+    self.assertIsNone(ninja.get_generator_kind())
+    self.assertEquals({'out/foo'}, ninja.get_output_path_list())
+    self.assertIn('build out/foo: cp', ninja._content)
+
+  def testSaveAndLoad(self):
+    config_result = self._make_config_result()
+    config_runner._config_cache_from_config_result(
+        config_result).save_to_file(self._cache_path)
+    config_cache = config_runner._load_config_cache_from_file(
+        self._cache_path)
+    loaded_result = config_cache.to_config_result()
+
+    expected = config_result.generated_ninjas[0]
+    ninja = loaded_result.generated_ninjas[0]
+    self.assertEquals(expected._content, ninja._content)
+    self.assertEquals(expected._build_rule_list, ninja._build_rule_list)
+    self.assertEquals(expected.get_ninja_path(), ninja.get_ninja_path())
+
+
+if __name__ == '__main__':
+  unittest.main()
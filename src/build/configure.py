@@ -15,6 +15,7 @@ import sys
 
 from src.build import build_common
 from src.build import config_runner
+from src.build import configure_daemon
 from src.build import download_arc_welder_deps
 from src.build import download_cts_files
 from src.build import download_sdk_and_ndk
@@ -25,6 +26,7 @@ from src.build import sync_gdb_multiarch
 from src.build import sync_nacl_sdk
 from src.build import toolchain
 from src.build.build_options import OPTIONS
+from src.build.util import concurrent
 from src.build.util import file_util
 
 
@@ -138,10 +140,13 @@ def _ensure_downloads_up_to_date():
   cache_path = OPTIONS.download_cache_path()
   cache_size = OPTIONS.download_cache_size()
 
-  sync_nacl_sdk.check_and_perform_updates(cache_path, cache_size)
-  download_sdk_and_ndk.check_and_perform_updates(cache_path, cache_size)
-  download_cts_files.check_and_perform_updates(cache_path, cache_size)
-  download_arc_welder_deps.check_and_perform_updates(cache_path, cache_size)
+  # The packages are independent of each other, so download and unpack them
+  # concurrently.
+  with concurrent.CheckedExecutor(concurrent.ThreadPoolExecutor(
+      4, daemon=True)) as executor:
+    for module in [sync_nacl_sdk, download_sdk_and_ndk, download_cts_files,
+                   download_arc_welder_deps]:
+      executor.submit(module.check_and_perform_updates, cache_path, cache_size)
 
   if sync_gdb_multiarch.main():
     sys.exit(1)
@@ -354,7 +359,8 @@ def main():
   # runs to make it easy to generate rules by scanning directories.
   staging.create_staging()
 
-  config_runner.generate_ninjas()
+  if not configure_daemon.request_regeneration():
+    config_runner.generate_ninjas()
 
   return 0
 
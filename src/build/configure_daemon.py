@@ -0,0 +1,293 @@
+#!src/build/run_python
+
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A daemon to regenerate ninja files keeping the config modules warm.
+
+Usage:
+  $ ./configure <options>
+  $ src/build/configure_daemon.py &
+
+While the daemon is running, ./configure requests it to regenerate the ninja
+files instead of doing that in its own process. The daemon keeps the loaded
+config modules and the config caches in memory, and watches the directories
+that the caches depend on with inotify. On a request, only the caches which
+depend on the changed files are checked, and only the stale ones are
+regenerated.
+
+The daemon exits when the configure options or the Python modules loaded in
+it, such as ninja_generator.py, are changed. Then ./configure regenerates the
+ninja files by itself as usual. Note that a newly added config.py is not
+noticed unless it is in a watched directory, so restart the daemon in such a
+case.
+"""
+
+import collections
+import contextlib
+import errno
+import os
+import re
+import select
+import socket
+import sys
+import traceback
+
+from src.build import build_common
+from src.build import config_runner
+from src.build import staging
+from src.build.build_options import OPTIONS
+from src.build.util import inotify
+
+
+_SOCKET_PATH = os.path.join(build_common.OUT_DIR, 'configure_daemon.sock')
+
+_RESPONSE_DONE = 'done'
+_RESPONSE_FAILED = 'failed'
+_RESPONSE_RESTART = 'restart'
+
+
+def _get_loaded_module_paths():
+  """Returns the paths of the loaded Python modules in the source tree.
+
+  config.py files are excluded, as they are reloaded when changed.
+  """
+  arc_root = build_common.get_arc_root()
+  paths = set()
+  for module in sys.modules.values():
+    path = getattr(module, '__file__', None)
+    if not path:
+      continue
+    path = os.path.relpath(re.sub(r'\.pyc$', '.py', os.path.abspath(path)),
+                           arc_root)
+    if path.startswith('..') or os.path.basename(path) == 'config.py':
+      continue
+    paths.add(path)
+  return paths
+
+
+def _resolve(path):
+  """Returns the path which |path| refers to after resolving symlinks.
+
+  The result is relative to the current directory, unless |path| is absolute.
+  """
+  real_path = os.path.realpath(path)
+  if os.path.isabs(path):
+    return real_path
+  return os.path.relpath(real_path)
+
+
+def _connect():
+  """Returns a socket connected to the daemon, or None if it is not running."""
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    client.connect(_SOCKET_PATH)
+  except socket.error as e:
+    client.close()
+    if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+      return None
+    raise
+  return client
+
+
+def _send_request(options):
+  """Sends a request to the daemon, and returns the response.
+
+  Returns None if the daemon is not running.
+  """
+  client = _connect()
+  if client is None:
+    return None
+  with contextlib.closing(client):
+    client.sendall(options + '\n')
+    return client.makefile().readline().rstrip('\n')
+
+
+def request_regeneration():
+  """Requests the running daemon to regenerate the ninja files.
+
+  Returns True if the ninja files are regenerated by the daemon. Otherwise,
+  e.g. the daemon is not running or has exited because of changes in the build
+  system, the caller needs to regenerate them by itself.
+  """
+  response = _send_request(' '.join(sys.argv[1:]))
+  if response == _RESPONSE_DONE:
+    print 'Ninja files are regenerated by configure daemon'
+    return True
+  if response == _RESPONSE_FAILED:
+    print 'Configure daemon failed to regenerate ninja files'
+  return False
+
+
+class _ConfigureDaemon(object):
+  def __init__(self, options):
+    self._options = options
+    self._watcher = inotify.Watcher()
+    self._module_paths = set()
+    # The paths changed since the last successful regeneration. These are kept
+    # on failures, so that the next request checks them again.
+    self._changed_paths = set()
+    self._is_overflowed = False
+    # Most of the dependencies are in out/staging, whose files are symlinks
+    # to the files in mods/ or third_party/. The edits of them are reported
+    # by inotify with the resolved paths, so these map the resolved paths of
+    # files and directories to the dependency paths.
+    self._file_aliases = collections.defaultdict(set)
+    self._directory_aliases = collections.defaultdict(set)
+
+  def _watch_directory(self, path, alias=None):
+    if not self._watcher.add_watch(path) or alias is None:
+      return
+    path = os.path.normpath(path)
+    if path != alias:
+      self._directory_aliases[path].add(alias)
+
+  def _update_watches(self):
+    # config.py may import other modules, so this is updated after each
+    # regeneration.
+    self._module_paths = _get_loaded_module_paths()
+    self._file_aliases.clear()
+    self._directory_aliases.clear()
+
+    directories = config_runner.get_dependency_directories()
+    directories.update(os.path.dirname(path) or '.'
+                       for path in self._module_paths)
+    for path in directories:
+      alias = os.path.normpath(path)
+      self._watch_directory(path)
+      self._watch_directory(_resolve(path), alias)
+      # A directory in out/staging is an overlay of the directories in mods/
+      # and third_party/. Files added to them are listed in it.
+      for composite_path in staging.get_composite_paths(alias):
+        if composite_path is not None:
+          self._watch_directory(composite_path, alias)
+
+    for path in config_runner.get_dependency_files():
+      alias = os.path.normpath(path)
+      real_path = _resolve(path)
+      if real_path == alias:
+        continue
+      self._file_aliases[real_path].add(alias)
+      self._watch_directory(os.path.dirname(real_path) or '.')
+
+  def _get_aliases(self, path):
+    """Returns the dependency paths which refer to the changed |path|."""
+    aliases = set(self._file_aliases.get(path, ()))
+    aliases.update(self._directory_aliases.get(path, ()))
+    name = os.path.basename(path)
+    for directory in self._directory_aliases.get(os.path.dirname(path), ()):
+      aliases.add(os.path.join(directory, name))
+    return aliases
+
+  def _collect_changes(self):
+    try:
+      changed_paths = self._watcher.read_changed_paths()
+    except inotify.QueueOverflowError:
+      self._is_overflowed = True
+      return
+    for path in changed_paths:
+      path = os.path.normpath(path)
+      self._changed_paths.add(path)
+      self._changed_paths.update(self._get_aliases(path))
+
+  def _needs_restart(self, options):
+    if options != self._options:
+      print 'Configure options are changed'
+      return True
+    if self._is_overflowed:
+      print 'Some changes may be missed because of inotify queue overflow'
+      return True
+    changed_modules = self._changed_paths.intersection(self._module_paths)
+    if changed_modules:
+      print 'Build system is changed: ' + ', '.join(sorted(changed_modules))
+      return True
+    return False
+
+  def regenerate(self):
+    config_runner.generate_ninjas(self._changed_paths)
+    self._changed_paths = set()
+    # The dependencies may be changed by the regeneration.
+    self._update_watches()
+
+  def initialize(self):
+    config_runner.enable_warm_caches()
+    config_runner.generate_ninjas()
+    self._update_watches()
+    # Drop the events caused by the initial generation itself.
+    self._collect_changes()
+    self._changed_paths = set()
+
+  def _handle_request(self, connection):
+    line = connection.makefile().readline()
+    if not line:
+      # The client just checked if the daemon is running.
+      return True
+    options = line.rstrip('\n')
+    self._collect_changes()
+    if self._needs_restart(options):
+      connection.sendall(_RESPONSE_RESTART + '\n')
+      return False
+    try:
+      self.regenerate()
+    except Exception:
+      traceback.print_exc()
+      connection.sendall(_RESPONSE_FAILED + '\n')
+    else:
+      connection.sendall(_RESPONSE_DONE + '\n')
+    return True
+
+  def serve(self, server):
+    while True:
+      readable, _, _ = select.select([server, self._watcher], [], [])
+      if self._watcher in readable:
+        # Read the events as they come to avoid overflowing the queue.
+        self._collect_changes()
+      if server in readable:
+        connection, _ = server.accept()
+        with contextlib.closing(connection):
+          if not self._handle_request(connection):
+            return
+
+
+def _create_server():
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    os.remove(_SOCKET_PATH)
+  except OSError as e:
+    if e.errno != errno.ENOENT:
+      raise
+  server.bind(_SOCKET_PATH)
+  server.listen(1)
+  return server
+
+
+def main():
+  os.chdir(build_common.get_arc_root())
+  OPTIONS.parse_configure_file()
+  if not OPTIONS.enable_config_cache():
+    print 'Configure daemon requires the config cache to be enabled'
+    return 1
+  with open(OPTIONS.get_configure_options_file()) as f:
+    options = f.read().rstrip('\n')
+
+  client = _connect()
+  if client is not None:
+    client.close()
+    print 'Configure daemon is already running'
+    return 1
+
+  daemon = _ConfigureDaemon(options)
+  daemon.initialize()
+  server = _create_server()
+  try:
+    print 'Configure daemon is ready'
+    daemon.serve(server)
+  finally:
+    server.close()
+    os.remove(_SOCKET_PATH)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,76 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for configure_daemon.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from src.build import config_runner
+from src.build import configure_daemon
+from src.build import staging
+
+
+def _write(path, content):
+  with open(path, 'w') as f:
+    f.write(content)
+
+
+class ConfigureDaemonTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._mods_dir = os.path.join(self._tmpdir, 'mods')
+    self._staging_dir = os.path.join(self._tmpdir, 'staging')
+    os.mkdir(self._mods_dir)
+    os.mkdir(self._staging_dir)
+    self._target = os.path.join(self._mods_dir, 'foo.c')
+    _write(self._target, 'foo')
+    self._staged_file = os.path.join(self._staging_dir, 'foo.c')
+    os.symlink(self._target, self._staged_file)
+
+    for name, value in [
+        ('get_dependency_directories', {self._staging_dir}),
+        ('get_dependency_files', {self._staged_file})]:
+      patcher = mock.patch.object(config_runner, name, return_value=value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    patcher = mock.patch.object(configure_daemon, '_get_loaded_module_paths',
+                                return_value=set())
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+    self._daemon = configure_daemon._ConfigureDaemon('')
+    self.addCleanup(self._daemon._watcher.close)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def _get_changed_paths(self):
+    self._daemon._collect_changes()
+    changed_paths = self._daemon._changed_paths
+    self._daemon._changed_paths = set()
+    return changed_paths
+
+  def test_edit_symlink_target(self):
+    self._daemon._update_watches()
+    _write(self._target, 'bar')
+    changed_paths = self._get_changed_paths()
+    self.assertIn(self._staged_file, changed_paths)
+    self.assertIn(self._target, changed_paths)
+
+  def test_add_file_to_composite_directory(self):
+    with mock.patch.object(staging, 'get_composite_paths',
+                           return_value=(None, self._mods_dir)):
+      self._daemon._update_watches()
+    _write(os.path.join(self._mods_dir, 'bar.c'), 'bar')
+    self.assertIn(os.path.join(self._staging_dir, 'bar.c'),
+                  self._get_changed_paths())
+
+
+if __name__ == '__main__':
+  unittest.main()
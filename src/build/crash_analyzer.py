@@ -14,32 +14,223 @@ Note that this is also integrated in launch_chrome.py.
 """
 
 import argparse
+import atexit
+import errno
+import marshal
 import os
 import re
 import subprocess
 import sys
+import threading
 
 from src.build import build_common
 from src.build import toolchain
 from src.build.build_options import OPTIONS
+from src.build.util import file_util
+
+_BINARY_INDEX_VERSION = 0
+
+_LOADED_TEXT_PATTERN = re.compile(
+    r'linker: Loaded text: 0x([0-9a-fA-F]+)-0x([0-9a-fA-F]+) (.*)')
+_ANNOTATED_ADDR_PATTERN = re.compile(r'.*0x([0-9a-fA-F]+)')
+_CRASH_ADDR_PATTERN = re.compile(
+    r'\*\* Signal \d+ from untrusted code: pc=([0-9a-fA-F]+)')
+
+
+def _get_binary_index_path():
+  return os.path.join(build_common.get_build_dir(), 'crash_analyzer_binaries')
+
+
+def _build_binary_map(library_path):
+  """Returns a map from basename to path of binaries, and the directory mtimes.
+
+  The directory mtimes are used to check if the map is still valid, as a
+  directory's mtime changes when a file is added to or removed from it.
+  """
+  binary_map = {}
+  directories = {}
+  for dirpath, dirnames, filenames in os.walk(library_path):
+    directories[dirpath] = os.stat(dirpath).st_mtime
+    for filename in filenames:
+      if re.match(r'arc_[^/]*\.nexe$', filename):
+        name = '/lib/main.nexe'
+        print 'Used %s as main.nexe' % filename
+      else:
+        name = os.path.basename(filename)
+      if name in binary_map:
+        raise Exception('Duplicated binary: ' + name)
+      binary_map[name] = os.path.join(dirpath, filename)
+  return binary_map, directories
+
+
+def _load_binary_map(index_path):
+  """Loads the binary map saved in the index, or returns None if stale."""
+  try:
+    with open(index_path, 'rb') as f:
+      data = marshal.load(f)
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+  except (EOFError, ValueError, TypeError):
+    return None
+  if data.get('version') != _BINARY_INDEX_VERSION:
+    return None
+  for dirpath, mtime in data['directories'].iteritems():
+    try:
+      if os.stat(dirpath).st_mtime != mtime:
+        return None
+    except OSError:
+      return None
+  return data['binary_map']
+
+
+def _save_binary_map(index_path, binary_map, directories):
+  data = {
+      'version': _BINARY_INDEX_VERSION,
+      'binary_map': binary_map,
+      'directories': directories,
+  }
+  file_util.makedirs_safely(os.path.dirname(index_path))
+  file_util.generate_file_atomically(
+      index_path, lambda f: marshal.dump(data, f))
+
+
+class _Addr2LineProcess(object):
+  """Keeps an addr2line process for a binary, resolving addresses via stdin."""
+
+  def __init__(self, binary_filename):
+    self._binary_filename = binary_filename
+    # Each address is resolved to a line of stdout. A warning in stderr would
+    # shift the lines for the later addresses, so stderr is discarded.
+    with open(os.devnull, 'w') as devnull:
+      self._process = subprocess.Popen(
+          [toolchain.get_tool(OPTIONS.target(), 'addr2line'),
+           '-e', binary_filename],
+          stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=devnull)
+
+  def resolve(self, addr):
+    try:
+      self._process.stdin.write('%x\n' % addr)
+      self._process.stdin.flush()
+    except IOError as e:
+      if e.errno != errno.EPIPE:
+        raise
+      # addr2line has exited, e.g. because the binary is broken.
+      return 'addr2line failed for %s\n' % self._binary_filename
+    return self._process.stdout.readline()
+
+  def close(self):
+    try:
+      self._process.stdin.close()
+    except IOError:
+      pass
+    self._process.wait()
+
+
+class Symbolizer(object):
+  """Resolves addresses in binaries.
+
+  This keeps an addr2line process per binary, and caches the results, so that
+  many crash addresses can be resolved at the rate of the output lines. The
+  map of the binaries is saved in the build directory, and shared across
+  processes until the binaries are added or removed.
+  This is thread-safe, so that output handlers can share the instance.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # A map from basename to path of binaries. Loaded lazily when crash is
+    # found.
+    self._binary_map = None
+    self._addr2line_processes = {}
+    self._addr2line_cache = {}
+    self._objdump_cache = {}
+
+  def _init_binary_map(self):
+    if self._binary_map is not None:
+      return
+    index_path = _get_binary_index_path()
+    self._binary_map = _load_binary_map(index_path)
+    if self._binary_map is None:
+      self._binary_map, directories = _build_binary_map(
+          build_common.get_load_library_path())
+      _save_binary_map(index_path, self._binary_map, directories)
+
+  def find_binary(self, binary_name):
+    """Returns the path to |binary_name| shown by the linker, or None."""
+    if os.path.exists(binary_name):
+      return binary_name
+    with self._lock:
+      self._init_binary_map()
+      return self._binary_map.get(binary_name)
+
+  def addr2line(self, binary_filename, addr):
+    key = (binary_filename, addr)
+    with self._lock:
+      if key not in self._addr2line_cache:
+        process = self._addr2line_processes.get(binary_filename)
+        if process is None:
+          process = _Addr2LineProcess(binary_filename)
+          self._addr2line_processes[binary_filename] = process
+        self._addr2line_cache[key] = process.resolve(addr)
+      return self._addr2line_cache[key]
+
+  def objdump(self, binary_filename, addr):
+    key = (binary_filename, addr)
+    with self._lock:
+      if key in self._objdump_cache:
+        return self._objdump_cache[key]
+
+    # We can always get clean result using 32 byte aligned start
+    # address as NaCl binary does never overlap 32 byte boundary.
+    objdump_start_addr = (addr & ~31) - 32
+    objdump_end_addr = addr + 64
+    pipe = subprocess.Popen([toolchain.get_tool(OPTIONS.target(),
+                                                'objdump'),
+                             '-SC', binary_filename,
+                             '--start-address', '0x%x' % objdump_start_addr,
+                             '--stop-address', '0x%x' % objdump_end_addr],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    result = pipe.communicate()[0]
+    with self._lock:
+      self._objdump_cache[key] = result
+    return result
+
+  def close(self):
+    with self._lock:
+      for process in self._addr2line_processes.itervalues():
+        process.close()
+      self._addr2line_processes = {}
+
+
+_symbolizer = None
+_symbolizer_lock = threading.Lock()
+
+
+def get_symbolizer():
+  """Returns the Symbolizer shared in this process."""
+  global _symbolizer
+  with _symbolizer_lock:
+    if _symbolizer is None:
+      _symbolizer = Symbolizer()
+      atexit.register(_symbolizer.close)
+    return _symbolizer
 
 
 class CrashAnalyzer(object):
-  def __init__(self, is_annotating=False):
+  def __init__(self, is_annotating=False, symbolizer=None):
     self._text_segments = []
     self._crash_addr = None
-    # A map from basename to path of binaries. Loaded lazily when
-    # crash is found.
-    self._binary_map = None
     self._is_annotating = is_annotating
+    self._symbolizer = symbolizer or get_symbolizer()
 
   def handle_line(self, line):
     if self._is_annotating:
       sys.stdout.write(line)
 
     line = line.strip()
-    matched = re.match(
-        r'linker: Loaded text: 0x([0-9a-fA-F]+)-0x([0-9a-fA-F]+) (.*)', line)
+    matched = _LOADED_TEXT_PATTERN.match(line)
     if matched:
       start_addr = int(matched.group(1), 16)
       end_addr = int(matched.group(2), 16)
@@ -48,11 +239,11 @@ class CrashAnalyzer(object):
       return False
 
     if self._is_annotating:
-      addr_reg = r'.*0x([0-9a-fA-F]+)'
+      addr_pattern = _ANNOTATED_ADDR_PATTERN
     else:
-      addr_reg = r'\*\* Signal \d+ from untrusted code: pc=([0-9a-fA-F]+)'
+      addr_pattern = _CRASH_ADDR_PATTERN
 
-    matched = re.match(addr_reg, line)
+    matched = addr_pattern.match(line)
     if matched:
       self._crash_addr = int(matched.group(1), 16)
       # Convert 64bit address to 32bit for x86-64.
@@ -61,23 +252,6 @@ class CrashAnalyzer(object):
 
     return False
 
-  def init_binary_map(self):
-    if self._binary_map:
-      return
-
-    self._binary_map = {}
-    for dirpath, dirnames, filenames in (
-        os.walk(build_common.get_load_library_path())):
-      for filename in filenames:
-        if re.match(r'arc_[^/]*\.nexe$', filename):
-          name = '/lib/main.nexe'
-          print 'Used %s as main.nexe' % filename
-        else:
-          name = os.path.basename(filename)
-        if name in self._binary_map:
-          raise Exception('Duplicated binary: ' + name)
-        self._binary_map[name] = os.path.join(dirpath, filename)
-
   def get_crash_report(self):
     assert self._crash_addr is not None
     for binary_name, start_addr, end_addr in self._text_segments:
@@ -89,33 +263,11 @@ class CrashAnalyzer(object):
       if binary_name.endswith('.so') or OPTIONS.is_bare_metal_build():
         addr -= start_addr
 
-      if os.path.exists(binary_name):
-        binary_filename = binary_name
-      else:
-        self.init_binary_map()
-        if binary_name not in self._binary_map:
-          return '%s %x (binary file not found)\n' % (binary_name, addr)
-        binary_filename = self._binary_map[binary_name]
-
-      pipe = subprocess.Popen([toolchain.get_tool(OPTIONS.target(),
-                                                  'addr2line'),
-                               '-e', binary_filename],
-                              stdin=subprocess.PIPE,
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.STDOUT)
-      addr2line_result = pipe.communicate('%x\n' % addr)[0]
-
-      # We can always get clean result using 32 byte aligned start
-      # address as NaCl binary does never overlap 32 byte boundary.
-      objdump_start_addr = (addr & ~31) - 32
-      objdump_end_addr = addr + 64
-      pipe = subprocess.Popen([toolchain.get_tool(OPTIONS.target(),
-                                                  'objdump'),
-                               '-SC', binary_filename,
-                               '--start-address', '0x%x' % objdump_start_addr,
-                               '--stop-address', '0x%x' % objdump_end_addr],
-                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-      objdump_result = pipe.communicate('%x\n' % addr)[0]
+      binary_filename = self._symbolizer.find_binary(binary_name)
+      if binary_filename is None:
+        return '%s %x (binary file not found)\n' % (binary_name, addr)
+
+      addr2line_result = self._symbolizer.addr2line(binary_filename, addr)
 
       if self._is_annotating:
         report = ('[[ %s 0x%x %s ]]' %
@@ -124,7 +276,7 @@ class CrashAnalyzer(object):
       else:
         report = '%s 0x%x\n' % (binary_filename, addr)
         report += addr2line_result
-        report += objdump_result
+        report += self._symbolizer.objdump(binary_filename, addr)
 
       return report
     return 'Failed to retrieve a crash report\n'
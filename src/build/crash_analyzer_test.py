@@ -0,0 +1,102 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for crash_analyzer.py."""
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import mock
+
+from src.build import crash_analyzer
+from src.build.build_options import OPTIONS
+
+# A fake addr2line which prints a line for each address read from stdin, and
+# records how many times it is launched. The warning in stderr must not be
+# taken as the result.
+_FAKE_ADDR2LINE = """#!/bin/sh
+echo started >> %(log)s
+echo "addr2line: Dwarf Error: unexpected tag" >&2
+while read addr; do
+  echo "$2:0x$addr"
+done
+"""
+
+_FAKE_OBJDUMP = """#!/bin/sh
+echo objdump >> %(log)s
+echo "disassembly of $2"
+"""
+
+
+class CrashAnalyzerTest(unittest.TestCase):
+  def setUp(self):
+    OPTIONS.parse([])
+    self._tmpdir = tempfile.mkdtemp()
+    self._log = os.path.join(self._tmpdir, 'log')
+    tools = {
+        'addr2line': self._write_script('addr2line', _FAKE_ADDR2LINE),
+        'objdump': self._write_script('objdump', _FAKE_OBJDUMP),
+    }
+    patcher = mock.patch('src.build.toolchain.get_tool',
+                         side_effect=lambda target, tool: tools[tool])
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+    self._binary = os.path.join(self._tmpdir, 'libfoo.so')
+    open(self._binary, 'w').close()
+    self._symbolizer = crash_analyzer.Symbolizer()
+    self.addCleanup(self._symbolizer.close)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+  def _write_script(self, name, template):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(template % {'log': self._log})
+    os.chmod(path, stat.S_IRWXU)
+    return path
+
+  def _read_log(self):
+    with open(self._log) as f:
+      return f.read().splitlines()
+
+  def _analyze(self, lines):
+    analyzer = crash_analyzer.CrashAnalyzer(symbolizer=self._symbolizer)
+    for line in lines:
+      if analyzer.handle_line(line):
+        return analyzer.get_crash_report()
+    return None
+
+  def test_crash_report(self):
+    lines = [
+        'linker: Loaded text: 0x1000-0x2000 %s\n' % self._binary,
+        '** Signal 11 from untrusted code: pc=1234\n',
+    ]
+    self.assertEquals(
+        '%s 0x234\n%s:0x234\ndisassembly of %s\n' % (
+            self._binary, self._binary, self._binary),
+        self._analyze(lines))
+
+  def test_reuse_addr2line_process(self):
+    for pc in ['1234', '1238', '1234']:
+      self._analyze([
+          'linker: Loaded text: 0x1000-0x2000 %s\n' % self._binary,
+          '** Signal 11 from untrusted code: pc=%s\n' % pc,
+      ])
+    # addr2line is launched once for the binary, and objdump is run once for
+    # each distinct address.
+    self.assertEquals(['started', 'objdump', 'objdump'], self._read_log())
+
+  def test_unknown_address(self):
+    self.assertEquals(
+        'Failed to retrieve a crash report\n',
+        self._analyze(['** Signal 11 from untrusted code: pc=1234\n']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,119 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Saves the build dependency graph and finds the outputs affected by changes.
+
+The graph is made from the build rules of all the ninja files when they are
+generated, and is used to select the tests which may be affected by a set of
+changed source files, e.g. the output of git diff.
+"""
+
+import collections
+import errno
+import marshal
+import os
+
+from src.build import build_common
+from src.build.util import file_util
+
+_GRAPH_FILE_VERSION = 0
+
+# Source directories which are symlinked into the staging directory.
+_STAGED_SOURCE_DIRS = ['internal/mods', 'internal/third_party', 'mods',
+                       'third_party']
+
+
+def get_graph_file_path():
+  return os.path.join(build_common.get_build_dir(), 'dependency_graph')
+
+
+def save(path, build_rule_lists):
+  """Saves the dependency graph made from the build rules of ninja files.
+
+  |build_rule_lists| is a list of NinjaGenerator._build_rule_list, each of
+  which is a list of (target groups, outputs, inputs) tuples.
+  """
+  dependents = collections.defaultdict(set)
+  for build_rule_list in build_rule_lists:
+    for _, outputs, inputs in build_rule_list:
+      outputs = [os.path.normpath(output) for output in outputs]
+      for input_path in inputs:
+        dependents[os.path.normpath(input_path)].update(outputs)
+  data = {
+      'version': _GRAPH_FILE_VERSION,
+      'dependents': dict((input_path, sorted(outputs))
+                         for input_path, outputs in dependents.iteritems()),
+  }
+  file_util.makedirs_safely(os.path.dirname(path))
+  file_util.generate_file_atomically(
+      path, lambda f: marshal.dump(data, f))
+
+
+def load(path):
+  """Loads the dependency graph, or returns None if it is not available."""
+  try:
+    with open(path, 'rb') as f:
+      data = marshal.load(f)
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+  except (EOFError, ValueError, TypeError):
+    return None
+  if data.get('version') != _GRAPH_FILE_VERSION:
+    return None
+  return DependencyGraph(data['dependents'])
+
+
+def _get_graph_paths(path):
+  """Returns the paths by which a changed source file can appear in the graph.
+
+  A file in mods/ or third_party/ is usually referred to via the staging
+  directory, or by its path relative to the staging directory.
+  """
+  path = os.path.normpath(path)
+  paths = [path]
+  for source_dir in _STAGED_SOURCE_DIRS:
+    if path.startswith(source_dir + os.path.sep):
+      rel_path = os.path.relpath(path, source_dir)
+      paths.append(rel_path)
+      paths.append(os.path.join(build_common.get_staging_root(), rel_path))
+      break
+  else:
+    if path.startswith('src' + os.path.sep):
+      paths.append(os.path.join(build_common.get_staging_root(), path))
+  return paths
+
+
+class DependencyGraph(object):
+  def __init__(self, dependents):
+    # A map from a path to the outputs directly built from it.
+    self._dependents = dependents
+
+  def get_affected_paths(self, changed_paths):
+    """Returns a set of the outputs which are rebuilt from |changed_paths|.
+
+    The changed paths themselves are included in the result too.
+    """
+    affected = set()
+    pending = []
+    for changed_path in changed_paths:
+      pending.extend(_get_graph_paths(changed_path))
+    while pending:
+      path = pending.pop()
+      if path in affected:
+        continue
+      affected.add(path)
+      pending.extend(self._dependents.get(path, ()))
+    return affected
+
+  def get_unknown_paths(self, changed_paths):
+    """Returns the paths in |changed_paths| which are not inputs of the graph.
+
+    The graph does not know implicit dependencies, e.g. headers found via
+    depfiles, so the outputs affected by these paths cannot be found.
+    """
+    return [changed_path for changed_path in changed_paths
+            if not any(path in self._dependents
+                       for path in _get_graph_paths(changed_path))]
@@ -0,0 +1,66 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for dependency_graph.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.build import build_common
+from src.build import dependency_graph
+from src.build.build_options import OPTIONS
+
+
+class DependencyGraphTest(unittest.TestCase):
+  def setUp(self):
+    OPTIONS.parse([])
+    self._tmpdir = tempfile.mkdtemp()
+    self._path = os.path.join(self._tmpdir, 'target', 'dependency_graph')
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+  def _save_and_load(self, build_rule_list):
+    dependency_graph.save(self._path, [build_rule_list])
+    return dependency_graph.load(self._path)
+
+  def test_missing_graph(self):
+    self.assertIsNone(dependency_graph.load(self._path))
+
+  def test_affected_paths(self):
+    staged_foo = os.path.join(build_common.get_staging_root(),
+                              'android/foo.c')
+    graph = self._save_and_load([
+        (None, {'out/foo.o'}, {staged_foo}),
+        (None, {'out/libfoo.so'}, {'out/foo.o', 'out/bar.o'}),
+        (None, {'out/Foo.apk'}, {'out/libfoo.so'}),
+        (None, {'out/Bar.apk'}, {'out/bar.o'}),
+    ])
+    self.assertEquals(
+        {staged_foo, 'out/foo.o', 'out/libfoo.so', 'out/Foo.apk'},
+        graph.get_affected_paths(['mods/android/foo.c']) -
+        {'mods/android/foo.c', 'android/foo.c'})
+    self.assertEquals(
+        {'out/bar.o', 'out/libfoo.so', 'out/Foo.apk', 'out/Bar.apk'},
+        graph.get_affected_paths(['out/bar.o']))
+    self.assertEquals({'docs/README'},
+                      graph.get_affected_paths(['docs/README']))
+
+  def test_unknown_paths(self):
+    staged_foo = os.path.join(build_common.get_staging_root(),
+                              'android/foo.c')
+    graph = self._save_and_load([
+        (None, {'out/foo.o'}, {staged_foo}),
+        (None, {'out/libfoo.so'}, {'out/foo.o'}),
+    ])
+    self.assertEquals(
+        ['mods/android/foo.h', 'docs/README'],
+        graph.get_unknown_paths(['mods/android/foo.c', 'mods/android/foo.h',
+                                 'out/foo.o', 'docs/README']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -7,22 +7,21 @@ from src.build.util import npm_package_sync
 
 
 def check_and_perform_updates(cache_base_path, cache_history_size):
-  download_package_util.BasicCachedPackage(
-      'src/build/DEPS.naclports-python',
-      'out/naclports-python',
-      cache_base_path=cache_base_path,
-      cache_history_size=cache_history_size,
-      download_method=download_package_util.gsutil_download_url()
-  ).check_and_perform_update()
+  download_package_util.update_packages_concurrently([
+      download_package_util.BasicCachedPackage(
+          'src/build/DEPS.naclports-python',
+          'out/naclports-python',
+          cache_base_path=cache_base_path,
+          cache_history_size=cache_history_size,
+          download_method=download_package_util.gsutil_download_url()),
 
-  download_package_util.BasicCachedPackage(
-      'src/build/DEPS.polymer-elements',
-      'out/polymer-elements',
-      cache_base_path=cache_base_path,
-      cache_history_size=cache_history_size
-  ).check_and_perform_update()
+      download_package_util.BasicCachedPackage(
+          'src/build/DEPS.polymer-elements',
+          'out/polymer-elements',
+          cache_base_path=cache_base_path,
+          cache_history_size=cache_history_size),
 
-  npm_package_sync.NpmPackageSync(
-      'src/build/DEPS.arc-welder-npm-packages',
-      'out/arc-welder-npm-packages'
-  ).check_and_perform_update()
+      npm_package_sync.NpmPackageSync(
+          'src/build/DEPS.arc-welder-npm-packages',
+          'out/arc-welder-npm-packages'),
+  ])
@@ -88,9 +88,12 @@ class AndroidSDKFiles(download_package_util.BasicCachedPackage):
 
     logging.info('Updating Android SDK components: %s',
                  ','.join(update_component_ids))
-    accept_android_license_subprocess([
-        self.android_tool, 'update', 'sdk', '--all', '--no-ui', '--filter',
-        ','.join(update_component_ids)])
+    # The SDK tool updates the files in the cache entry, which may be shared
+    # with the other versions of the SDK.
+    with self.modify_cache_in_place():
+      accept_android_license_subprocess([
+          self.android_tool, 'update', 'sdk', '--all', '--no-ui', '--filter',
+          ','.join(update_component_ids)])
 
     # Ensure the final directory properly links to the cache.
     self.populate_final_directory()
@@ -135,14 +138,14 @@ class AndroidSDKFiles(download_package_util.BasicCachedPackage):
 
 
 def check_and_perform_updates(cache_base_path, cache_history_size):
-  download_package_util.BasicCachedPackage(
+  ndk = download_package_util.BasicCachedPackage(
       'src/build/DEPS.ndk',
       'third_party/ndk',
       unpack_method=download_package_util.unpack_self_extracting_archive(),
       link_subdir='android-ndk-r10d',
       cache_base_path=cache_base_path,
       cache_history_size=cache_history_size
-  ).check_and_perform_update()
+  )
 
   sdk = AndroidSDKFiles(
       'src/build/DEPS.android-sdk',
@@ -151,7 +154,7 @@ def check_and_perform_updates(cache_base_path, cache_history_size):
       cache_base_path=cache_base_path,
       cache_history_size=cache_history_size
   )
-  sdk.check_and_perform_update()
+  download_package_util.update_packages_concurrently([ndk, sdk])
   sdk.check_and_perform_component_updates()
 
 
@@ -6,13 +6,13 @@
 
 import argparse
 import collections
-import json
 import os
 import re
 import sys
 
 from src.build import build_common
 from src.build.build_options import OPTIONS
+from src.build.util import trace_event_stream
 
 
 class LogTag(object):
@@ -20,6 +20,22 @@ class LogTag(object):
     self.name = None
 
 
+def _expand_event_log_tags(trace, logtags):
+  for entry in trace:
+    if entry['cat'] == 'ARC' and entry['name'] == 'EventLogTag':
+      if 'args' not in entry or 'tag' not in entry['args']:
+        entry['name'] = 'Poorly formatted EventLogTag'
+        print 'Invalid eventlogtag: %s' % entry
+      else:
+        number = entry['args']['tag']
+        if number not in logtags:
+          entry['name'] = 'Unknown EventLogTag'
+          print 'Unknown eventlogtag: %s' % entry
+        else:
+          entry['name'] = logtags[number].name + " (EventLogTag)"
+    yield entry
+
+
 def main():
   OPTIONS.parse_configure_file()
   parser = argparse.ArgumentParser()
@@ -36,8 +52,6 @@ def main():
 
   options = parser.parse_args(sys.argv[1:])
 
-  trace = json.load(options.input)
-
   logtag_format = re.compile(r'(\d+) (\S+) .*')
   logtags = collections.defaultdict(LogTag)
   for line in options.logtag.readlines():
@@ -45,21 +59,11 @@ def main():
     if m:
       logtags[int(m.group(1))].name = m.group(2)
 
-  for i in xrange(len(trace)):
-    entry = trace[i]
-    if entry['cat'] == 'ARC' and entry['name'] == 'EventLogTag':
-      if 'args' not in entry or 'tag' not in entry['args']:
-        entry['name'] = 'Poorly formatted EventLogTag'
-        print 'Invalid eventlogtag: %s' % entry
-      else:
-        number = entry['args']['tag']
-        if number not in logtags:
-          entry['name'] = 'Unknown EventLogTag'
-          print 'Unknown eventlogtag: %s' % entry
-        else:
-          entry['name'] = logtags[number].name + " (EventLogTag)"
-
-  options.output.write(json.dumps(trace, separators=(',', ':')))
+  # The trace is processed as a stream, as it can be too large to load.
+  trace = trace_event_stream.iterate_events(options.input)
+  trace_event_stream.write_events(_expand_event_log_tags(trace, logtags),
+                                  options.output, key=None,
+                                  separators=(',', ':'))
 
   print 'Done'
   return 0
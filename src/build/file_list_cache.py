@@ -4,46 +4,122 @@
 
 import errno
 import hashlib
+import itertools
 import logging
 import marshal
 import os
 import pickle
 import stat
 
+from src.build.util import file_util
 
 _CACHE_FILE_VERSION = 0
 
+_INDEX_FILE_VERSION = 0
 
-# Splits given |cache_entries| into |cache_hit|, |cache_miss| and removed
-# entries, and returns |cache_hit| and |cache_miss|.
-# |cache_entries|, |cache_hit| and |cache_miss| are dictionaries from a file
-# path to a CacheEntry.
-def _check_cache_freshness(cache_entries):
-  cache_hit = {}
-  cache_miss = {}
 
-  for path, cached in cache_entries.iteritems():
+def _calculate_dir_contents_hash(dirs, files):
+  return hashlib.sha1('\0'.join(dirs + [''] + files)).hexdigest()
+
+
+class DirectoryIndex(object):
+  """An index of directory listings shared by all FileListCaches.
+
+  Each directory is listed only when its mtime is changed, and stat'ed at most
+  once until invalidate() is called, even if it is queried multiple times.
+  """
+
+  def __init__(self, entries=None):
+    # A map from a directory path to (mtime, sorted dirs, sorted files).
+    self._entries = {} if entries is None else entries
+    self._checked_paths = set()
+    self.is_updated = False
+
+  def list_directory(self, path):
+    """Returns (mtime, dirs, files) of |path|, or None if it is not a dir."""
+    if path in self._checked_paths:
+      return self._entries.get(path)
+    self._checked_paths.add(path)
+
+    entry = self._entries.get(path)
     try:
       st = os.stat(path)
-      if not stat.S_ISDIR(st.st_mode):
-        # |path| is a removed entry.
-        continue
-      elif st.st_mtime > cached.mtime:
-        cache_miss[path] = cached
-        cached.mtime = st.st_mtime
-        continue
-      cache_hit[path] = cached
     except OSError as e:
-      if e.errno == errno.ENOENT:
-        # |path| is a removed entry.
-        continue
-      raise
+      if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+        raise
+      st = None
+    if st is None or not stat.S_ISDIR(st.st_mode):
+      if entry is not None:
+        del self._entries[path]
+        self.is_updated = True
+      return None
+    if entry is not None and entry[0] == st.st_mtime:
+      return entry
+
+    dirs = []
+    files = []
+    for name in os.listdir(path):
+      # Follow symbolic links, as os.walk(followlinks=True) does.
+      if os.path.isdir(os.path.join(path, name)):
+        dirs.append(name)
+      else:
+        files.append(name)
+    entry = (st.st_mtime, sorted(dirs), sorted(files))
+    self._entries[path] = entry
+    self.is_updated = True
+    return entry
+
+  def invalidate(self):
+    """Makes the directories checked again on the next listing."""
+    self._checked_paths = set()
 
-  return cache_hit, cache_miss
+  def to_dict(self):
+    return {
+        'version': _INDEX_FILE_VERSION,
+        'entries': self._entries,
+    }
 
 
-def _calculate_dir_contents_hash(dirs, files):
-  return hashlib.sha1('\0'.join(dirs + [''] + files)).hexdigest()
+_directory_index = DirectoryIndex()
+
+
+def reset_directory_index():
+  """Starts a new empty shared DirectoryIndex."""
+  global _directory_index
+  _directory_index = DirectoryIndex()
+
+
+def invalidate_directory_index():
+  """Makes the directories in the shared DirectoryIndex checked again."""
+  _directory_index.invalidate()
+
+
+def load_directory_index(file_path):
+  """Loads the shared DirectoryIndex persisted in |file_path|."""
+  global _directory_index
+  reset_directory_index()
+  try:
+    with open(file_path) as f:
+      data = marshal.load(f)
+  except (EOFError, ValueError, TypeError):
+    return
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return
+    raise
+  if data['version'] == _INDEX_FILE_VERSION:
+    _directory_index = DirectoryIndex(data['entries'])
+
+
+def save_directory_index(file_path):
+  """Saves the shared DirectoryIndex to |file_path| if it is updated."""
+  if not _directory_index.is_updated:
+    return
+  data = _directory_index.to_dict()
+  file_util.makedirs_safely(os.path.dirname(file_path))
+  file_util.generate_file_atomically(file_path,
+                                     lambda f: marshal.dump(data, f))
+  _directory_index.is_updated = False
 
 
 class Query:
@@ -73,64 +149,63 @@ class FileListCache:
     self.query = query
     self.cache_entries = {} if entries is None else entries
 
+  def _match(self, file_path):
+    if not self.query.matcher:
+      return True
+    if self.query.root is None:
+      match_path = file_path
+    else:
+      match_path = os.path.relpath(file_path, self.query.root)
+    return self.query.matcher.match(match_path)
+
   # Searches cached entries and refreshes them if needed.
+  # The directories are listed via the shared DirectoryIndex, so the
+  # directories overlapping with other queries are listed only once.
   def refresh_cache(self):
-    cache_hit, cache_miss = _check_cache_freshness(self.cache_entries)
-
-    for base_path in self.query.base_paths:
-      if base_path not in cache_hit and base_path not in cache_miss:
-        cache_miss[base_path] = None
-
-    new_cache_entries = cache_hit
+    new_cache_entries = {}
     cache_is_fresh = True
 
-    for path in cache_miss:
-      for root, dirs, files in os.walk(path, followlinks=True):
-        matched_files = []
-        for file in files:
-          file_path = os.path.join(root, file)
-          if not self.query.matcher:
-            matched_files.append(file_path)
-            continue
-
-          if self.query.root is None:
-            match_path = file_path
-          else:
-            match_path = os.path.relpath(file_path, self.query.root)
-          if self.query.matcher.match(match_path):
-            matched_files.append(file_path)
-        matched_files = sorted(matched_files)
-
-        if not self.query.include_subdirectories:
-          dirs[:] = []
-
-        content_hash = _calculate_dir_contents_hash(sorted(dirs), matched_files)
-        recurse = []
-        # Recurse into new directories only.
-        for subdir_name in dirs:
-          subdir = os.path.join(root, subdir_name)
-          if subdir not in cache_hit and subdir not in cache_miss:
-            recurse.append(subdir_name)
-        dirs[:] = recurse
-
-        # Populate cache for |root|.
-        cache = cache_miss.get(root)
-        if cache:
-          if cache.content_hash != content_hash:
-            cache_is_fresh = False
-          cache.content_hash = content_hash
-          cache.contents = matched_files
-          new_cache_entries[root] = cache
-        else:
-          cache = CacheEntry(os.stat(root).st_mtime,
-                             content_hash, matched_files)
-          cache_is_fresh = False
-          new_cache_entries[root] = cache
-
-      self.cache_entries = new_cache_entries
+    pending_paths = list(self.query.base_paths)
+    while pending_paths:
+      root = pending_paths.pop()
+      listing = _directory_index.list_directory(root)
+      if listing is None:
+        continue
+      mtime, dirs, files = listing
+      if not self.query.include_subdirectories:
+        dirs = []
+      pending_paths.extend(os.path.join(root, subdir) for subdir in dirs)
+
+      cache = self.cache_entries.get(root)
+      if cache is not None and cache.mtime == mtime:
+        # The directory is not changed since the last listing.
+        new_cache_entries[root] = cache
+        continue
 
+      matched_files = [file_path for file_path in
+                       (os.path.join(root, file) for file in files)
+                       if self._match(file_path)]
+      content_hash = _calculate_dir_contents_hash(dirs, matched_files)
+      if cache is None or cache.content_hash != content_hash:
+        cache_is_fresh = False
+      new_cache_entries[root] = CacheEntry(mtime, content_hash, matched_files)
+
+    if len(new_cache_entries) != len(self.cache_entries):
+      cache_is_fresh = False
+    self.cache_entries = new_cache_entries
     return cache_is_fresh
 
+  # Returns True if any of |changed_paths| may change the result of the
+  # listing, that is, it is a listed directory or an entry directly in one.
+  # |changed_paths| must be a set of normalized paths.
+  def is_affected_by(self, changed_paths):
+    changed_dirs = changed_paths.union(
+        os.path.dirname(path) for path in changed_paths)
+    for path in itertools.chain(self.query.base_paths, self.cache_entries):
+      if os.path.normpath(path) in changed_dirs:
+        return True
+    return False
+
   def enumerate_files(self):
     for cached_dir_path in self.cache_entries:
       for path in self.cache_entries[cached_dir_path].contents:
@@ -10,6 +10,8 @@ import re
 import tempfile
 import unittest
 
+import mock
+
 from src.build import file_list_cache
 from src.build.util import file_util
 
@@ -24,9 +26,16 @@ def _reset_timestamp():
       os.utime(os.path.join(root, path), (0, 0))
 
 
+def _refresh_cache(cache):
+  # Each refresh simulates a separate configure run, in which the directories
+  # are checked again.
+  file_list_cache.invalidate_directory_index()
+  return cache.refresh_cache()
+
+
 def _list_files(*args):
   cache = file_list_cache.FileListCache(file_list_cache.Query(*args))
-  cache.refresh_cache()
+  _refresh_cache(cache)
   return list(cache.enumerate_files())
 
 
@@ -35,6 +44,7 @@ class FileListCacheUnittest(unittest.TestCase):
     tmpdir = tempfile.mkdtemp()
     os.chdir(tmpdir)
     atexit.register(lambda: file_util.rmtree(tmpdir, ignore_errors=True))
+    file_list_cache.reset_directory_index()
 
     os.makedirs('foo/bar/baz')
     _touch('foo/bar/baz/hoge.cc')
@@ -53,28 +63,28 @@ class FileListCacheUnittest(unittest.TestCase):
     cache = file_list_cache.FileListCache(query)
 
     # Cache should not be fresh here.
-    self.assertFalse(cache.refresh_cache())
+    self.assertFalse(_refresh_cache(cache))
 
     # Cache should be fresh now.
-    self.assertTrue(cache.refresh_cache())
+    self.assertTrue(_refresh_cache(cache))
 
     # New matched files should make the cache dirty.
     _touch('foo/bar/baz/piyo.cc')
-    self.assertFalse(cache.refresh_cache())
+    self.assertFalse(_refresh_cache(cache))
 
     # Unmatched file should not affect the freshness.
     _touch('foo/bar/piyo.h')
-    self.assertTrue(cache.refresh_cache())
+    self.assertTrue(_refresh_cache(cache))
 
     # Removing matched file should make the cache dirty.
     os.remove('foo/o/o/o.cc')
-    self.assertFalse(cache.refresh_cache())
+    self.assertFalse(_refresh_cache(cache))
 
     os.remove('foo/o/o/o.h')
-    self.assertTrue(cache.refresh_cache())
+    self.assertTrue(_refresh_cache(cache))
 
     os.rmdir('foo/o/o')
-    self.assertFalse(cache.refresh_cache())
+    self.assertFalse(_refresh_cache(cache))
 
   def testListingFiles(self):
     self.assertEquals(_list_files(['foo'], re.compile('.*\.cc'), None, True),
@@ -109,7 +119,7 @@ class FileListCacheUnittest(unittest.TestCase):
   def testSaveAndLoad(self):
     query = file_list_cache.Query(['foo'], re.compile('.*\.cc'), None, True)
     cache = file_list_cache.FileListCache(query)
-    self.assertFalse(cache.refresh_cache())
+    self.assertFalse(_refresh_cache(cache))
 
     try:
       fd, path = tempfile.mkstemp()
@@ -120,7 +130,53 @@ class FileListCacheUnittest(unittest.TestCase):
       os.remove(path)
 
     self.assertEquals(query, cache2.query)
-    self.assertTrue(cache.refresh_cache())
+    self.assertTrue(_refresh_cache(cache))
+
+  def testSharedDirectoryIndex(self):
+    cc_cache = file_list_cache.FileListCache(
+        file_list_cache.Query(['foo'], re.compile('.*\.cc'), None, True))
+    py_cache = file_list_cache.FileListCache(
+        file_list_cache.Query(['foo'], re.compile('.*\.py'), None, True))
+
+    with mock.patch('os.listdir', side_effect=os.listdir) as listdir:
+      self.assertFalse(_refresh_cache(cc_cache))
+      self.assertFalse(py_cache.refresh_cache())
+      # Each directory is listed only once for both queries.
+      self.assertEquals(3, listdir.call_count)
+
+      # Unchanged directories are not listed again.
+      self.assertTrue(_refresh_cache(cc_cache))
+      self.assertEquals(3, listdir.call_count)
+
+    self.assertEquals(['foo/bar/baz/hoge.cc'], list(cc_cache.enumerate_files()))
+    self.assertEquals(['foo/bar/baz/fuga.py'], list(py_cache.enumerate_files()))
+
+  def testSaveAndLoadDirectoryIndex(self):
+    cache = file_list_cache.FileListCache(
+        file_list_cache.Query(['foo'], re.compile('.*\.cc'), None, True))
+    _refresh_cache(cache)
+    try:
+      fd, path = tempfile.mkstemp()
+      file_list_cache.save_directory_index(path)
+      file_list_cache.load_directory_index(path)
+    finally:
+      os.close(fd)
+      os.remove(path)
+
+    with mock.patch('os.listdir', side_effect=os.listdir) as listdir:
+      self.assertTrue(cache.refresh_cache())
+      self.assertFalse(listdir.called)
+
+  def testIsAffectedBy(self):
+    query = file_list_cache.Query(['foo'], re.compile('.*\.cc'), None, True)
+    cache = file_list_cache.FileListCache(query)
+    _refresh_cache(cache)
+
+    self.assertFalse(cache.is_affected_by(set()))
+    self.assertFalse(cache.is_affected_by({'bar/hoge.cc'}))
+    self.assertTrue(cache.is_affected_by({'foo/bar/baz/piyo.cc'}))
+    self.assertTrue(cache.is_affected_by({'foo/bar/baz'}))
+    self.assertFalse(cache.is_affected_by({'foo/bar/baz/qux/piyo.cc'}))
 
 if __name__ == '__main__':
   unittest.main()
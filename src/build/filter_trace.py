@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!src/build/run_python
 
 # Copyright 2014 The Chromium Authors. All rights reserved.
 # Use of this source code is governed by a BSD-style license that can be
@@ -7,14 +7,16 @@
 """A small tool to process and analyze trace logs.
 
 To use Chrome tracing logs effectively, please refer to docs/profiling.md
+The events are processed as a stream, so large traces can be processed without
+loading them into memory.
 """
 
 import argparse
-import json
 import re
 import sys
 
-_TRACE_EVENTS = 'traceEvents'
+from src.build.util import trace_event_stream
+
 _EVENT_TYPE = 'ph'
 _EVENT_NAME = 'name'
 _EVENT_TIMESTAMP = 'ts'
@@ -24,36 +26,38 @@ _METADATA_TYPE = 'M'
 class Traces:
 
   def __init__(self, jsonfile):
-    self._events = json.load(jsonfile)[_TRACE_EVENTS]
-    self._events.sort(Traces._timestamp_cmp)
+    # Sorting consumes all the events from |jsonfile|. The following stages
+    # are applied lazily when the events are dumped.
+    self._events = trace_event_stream.sort_events(
+        trace_event_stream.iterate_events(jsonfile), Traces._timestamp_key)
 
   @staticmethod
-  def _timestamp_cmp(x, y):
-    tsx = x[_EVENT_TIMESTAMP] if x[_EVENT_TIMESTAMP] else 0
-    tsy = y[_EVENT_TIMESTAMP] if y[_EVENT_TIMESTAMP] else 0
-    return tsx - tsy
+  def _timestamp_key(event):
+    return event.get(_EVENT_TIMESTAMP) or 0
 
   def filter(self, matching_function):
-    filtered_events = []
-    for rawevent in self._events:
-      if _EVENT_TYPE in rawevent and rawevent[_EVENT_TYPE] == _METADATA_TYPE:
+    self._events = (
+        rawevent for rawevent in self._events
         # Metadata events are always added.
-        filtered_events.append(rawevent)
-      elif matching_function(rawevent):
-        filtered_events.append(rawevent)
-    self._events = filtered_events
+        if (rawevent.get(_EVENT_TYPE) == _METADATA_TYPE or
+            matching_function(rawevent)))
 
-  def normalize_time(self):
+  @staticmethod
+  def _normalize_time(events):
     first_timestamp = None
-    for rawevent in self._events:
+    for rawevent in events:
       if first_timestamp is None:
         if _EVENT_TIMESTAMP in rawevent and rawevent[_EVENT_TIMESTAMP] > 0:
           first_timestamp = rawevent[_EVENT_TIMESTAMP]
       if first_timestamp is not None and _EVENT_TIMESTAMP in rawevent:
         rawevent[_EVENT_TIMESTAMP] -= first_timestamp
+      yield rawevent
+
+  def normalize_time(self):
+    self._events = Traces._normalize_time(self._events)
 
   def dump(self, outputfile):
-    json.dump({_TRACE_EVENTS: self._events}, outputfile)
+    trace_event_stream.write_events(self._events, outputfile)
 
 
 def _parse_comma_separated_list(value):
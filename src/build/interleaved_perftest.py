@@ -34,6 +34,18 @@ _TEST_SSH_KEY = (
 # %h: host name, and %p: port). See man ssh_config for the detail.
 _SSH_CONTROL_PATH = '/tmp/perftest-ssh-%r@%h:%p'
 
+# Metrics to compare, as tuples of the label, the VRAWPERF key, the unit, and
+# the number of fractional digits to print.
+_METRICS = [
+    ('boot', 'boot_time_ms', 'ms', 0),
+    ('  preEmbed', 'pre_embed_time_ms', 'ms', 0),
+    ('  pluginLoad', 'plugin_load_time_ms', 'ms', 0),
+    ('  onResume', 'on_resume_time_ms', 'ms', 0),
+    ('virt', 'app_virt_mem', 'MB', 1),
+    ('res', 'app_res_mem', 'MB', 1),
+    ('pdirt', 'app_pdirt_mem', 'MB', 1),
+]
+
 
 def get_abs_arc_root():
   return os.path.abspath(build_common.get_arc_root())
@@ -104,7 +116,16 @@ Typical usage:
       parents=[base_parser])
   compare_parser.add_argument(
       '--iterations', type=int, metavar='<N>', default=60,
-      help='Number of perftest iterations.')
+      help=('Number of perftest iterations. With --stop-threshold, this is '
+            'the maximum number of iterations.'))
+  compare_parser.add_argument(
+      '--stop-threshold', type=float, metavar='<%>',
+      help=('Stop iterating once the confidence interval of every metric is '
+            'decisively within or beyond this percentage of the control '
+            'median.'))
+  compare_parser.add_argument(
+      '--min-iterations', type=int, metavar='<N>', default=10,
+      help='Minimum number of perftest iterations with --stop-threshold.')
   compare_parser.add_argument(
       '--confidence-level', type=int, metavar='<%>', default=90,
       help='Confidence level of confidence intervals.')
@@ -391,40 +412,27 @@ def merge_perfs(a, b):
     a[key].extend(values)
 
 
-def bootstrap_sample(sample):
-  """Performs Bootstrap sampling.
-
-  Args:
-    sample: A sample as a list of numbers.
-
-  Returns:
-    A Bootstrap sample as a list of numbers. The size of the returned Bootstrap
-    sample is equal to that of the original sample.
-  """
-  return [random.choice(sample) for _ in sample]
-
+def is_metric_decided(ctrl_sample, expt_sample, confidence_level, threshold):
+  """Checks if more iterations are unlikely to change the verdict of a metric.
 
-def bootstrap_estimation(
-    ctrl_sample, expt_sample, statistic, confidence_level):
-  """Estimates confidence interval of difference of a statistic by Bootstrap.
+  The verdict is decided when the confidence interval of the difference of the
+  medians is entirely within the threshold (no meaningful change), or entirely
+  beyond it (a meaningful change).
 
   Args:
     ctrl_sample: A control sample as a list of numbers.
     expt_sample: An experiment sample as a list of numbers.
-    statistic: A function that computes a statistic from a sample.
     confidence_level: An integer that specifies requested confidence level
         in percentage, e.g. 90, 95, 99.
+    threshold: The threshold in percentage of the control median.
 
   Returns:
-    Estimated range as a number tuple.
+    True if the verdict is decided.
   """
-  bootstrap_distribution = []
-  for _ in xrange(1000):
-    bootstrap_distribution.append(
-        statistic(bootstrap_sample(expt_sample)) -
-        statistic(bootstrap_sample(ctrl_sample)))
-  return statistics.compute_percentiles(
-      bootstrap_distribution, (100 - confidence_level, confidence_level))
+  lower, upper = statistics.bootstrap_difference_interval(
+      ctrl_sample, expt_sample, confidence_level)
+  limit = abs(statistics.compute_median(ctrl_sample)) * threshold / 100.
+  return (-limit < lower and upper < limit) or upper < -limit or lower > limit
 
 
 def handle_stash(parsed_args):
@@ -565,26 +573,37 @@ def handle_compare(parsed_args):
     def do_expt():
       merge_perfs(expt_perfs, expt_runner.run())
 
-    for iteration in xrange(parsed_args.iterations):
+    num_iterations = 0
+    while num_iterations < parsed_args.iterations:
+      num_iterations += 1
       print
       print '=================================== iteration %d/%d' % (
-          iteration + 1, parsed_args.iterations)
+          num_iterations, parsed_args.iterations)
       for do in random.sample((do_ctrl, do_expt), 2):
         do()
+      if (parsed_args.stop_threshold is not None and
+          num_iterations >= parsed_args.min_iterations and
+          all(is_metric_decided(ctrl_perfs[key], expt_perfs[key],
+                                parsed_args.confidence_level,
+                                parsed_args.stop_threshold)
+              for _, key, _, _ in _METRICS)):
+        logging.info('All metrics are decided after %d iterations.',
+                     num_iterations)
+        break
 
   print
   print 'VRAWPERF_CTRL=%r' % dict(ctrl_perfs)  # Convert from defaultdict.
   print 'VRAWPERF_EXPT=%r' % dict(expt_perfs)  # Convert from defaultdict.
   print
   print 'PERF=runs=%d CI=%d%%' % (
-      parsed_args.iterations, parsed_args.confidence_level)
+      num_iterations, parsed_args.confidence_level)
   if expt_options == ctrl_options:
     print '     configure_opts=%s' % expt_options
   else:
     print '     configure_opts=%s (vs. %s)' % (expt_options, ctrl_options)
   print '     launch_chrome_opts=%s' % ' '.join(parsed_args.launch_chrome_opt)
 
-  def _print_metric(prefix, key, unit, frac_digits=0):
+  def _print_metric(prefix, key, unit, frac_digits):
     def format_frac(k, sign=False):
       format_string = '%'
       if sign:
@@ -597,31 +616,27 @@ def handle_compare(parsed_args):
     ctrl_median = statistics.compute_median(ctrl_sample)
     expt_median = statistics.compute_median(expt_sample)
     diff_estimate_lower, diff_estimate_upper = (
-        bootstrap_estimation(
-            ctrl_sample, expt_sample,
-            statistics.compute_median,
-            parsed_args.confidence_level))
+        statistics.bootstrap_difference_interval(
+            ctrl_sample, expt_sample, parsed_args.confidence_level))
+    _, p_value = statistics.compute_mann_whitney_u_test(
+        ctrl_sample, expt_sample)
     if diff_estimate_upper < 0:
       significance = '[--]'
     elif diff_estimate_lower > 0:
       significance = '[++]'
     else:
       significance = '[not sgfnt.]'
-    print '     %s: ctrl=%s, expt=%s, diffCI=(%s,%s) %s' % (
+    print '     %s: ctrl=%s, expt=%s, diffCI=(%s,%s) p=%.3f %s' % (
         prefix,
         format_frac(ctrl_median),
         format_frac(expt_median),
         format_frac(diff_estimate_lower, sign=True),
         format_frac(diff_estimate_upper, sign=True),
+        p_value,
         significance)
 
-  _print_metric('boot', 'boot_time_ms', 'ms')
-  _print_metric('  preEmbed', 'pre_embed_time_ms', 'ms')
-  _print_metric('  pluginLoad', 'plugin_load_time_ms', 'ms')
-  _print_metric('  onResume', 'on_resume_time_ms', 'ms')
-  _print_metric('virt', 'app_virt_mem', 'MB', frac_digits=1)
-  _print_metric('res', 'app_res_mem', 'MB', frac_digits=1)
-  _print_metric('pdirt', 'app_pdirt_mem', 'MB', frac_digits=1)
+  for prefix, key, unit, frac_digits in _METRICS:
+    _print_metric(prefix, key, unit, frac_digits)
 
   print '     (see go/arcipt for how to interpret these numbers)'
 
@@ -5,8 +5,10 @@
 # found in the LICENSE file.
 
 import atexit
+import json
 import logging
 import os
+import platform
 import re
 import signal
 import subprocess
@@ -28,9 +30,11 @@ from src.build.util import launch_chrome_util
 from src.build.util import logging_util
 from src.build.util import minidump_filter
 from src.build.util import output_handler
+from src.build.util import perf_results_store
 from src.build.util import platform_util
 from src.build.util import remote_executor
 from src.build.util import signal_util
+from src.build.util import startup_profiler
 from src.build.util import startup_stats
 
 
@@ -140,10 +144,24 @@ def _maybe_wait_iteration_lock(parsed_args):
     time.sleep(0.1)
 
 
+def _get_startup_timeline_path(parsed_args, name):
+  if not parsed_args.startup_timeline_dir:
+    return None
+  return os.path.join(parsed_args.startup_timeline_dir,
+                      'startup-%s.json' % name)
+
+
+def _maybe_print_startup_timeline_path(startup_timeline_path):
+  if startup_timeline_path:
+    print 'STARTUP_TIMELINE=%s' % startup_timeline_path
+
+
 def _run_chrome_iterations(parsed_args):
   if not parsed_args.no_cache_warming:
     _maybe_wait_iteration_lock(parsed_args)
-    stats = _run_chrome(parsed_args, cache_warming=True)
+    startup_timeline_path = _get_startup_timeline_path(parsed_args, 'warm-up')
+    stats = _run_chrome(parsed_args, cache_warming=True,
+                        startup_timeline_path=startup_timeline_path)
     if parsed_args.mode == 'perftest':
       total = (stats.pre_embed_time_ms + stats.plugin_load_time_ms +
                stats.on_resume_time_ms)
@@ -152,6 +170,7 @@ def _run_chrome_iterations(parsed_args):
                                      stats.plugin_load_time_ms,
                                      stats.on_resume_time_ms)
       startup_stats.print_raw_stats(stats)
+      _maybe_print_startup_timeline_path(startup_timeline_path)
       sys.stdout.flush()
 
   if parsed_args.iterations > 0:
@@ -159,13 +178,35 @@ def _run_chrome_iterations(parsed_args):
     for i in xrange(parsed_args.iterations):
       _maybe_wait_iteration_lock(parsed_args)
       sys.stderr.write('\nStarting Chrome\n')
-      stats = _run_chrome(parsed_args)
+      startup_timeline_path = _get_startup_timeline_path(parsed_args, i)
+      stats = _run_chrome(parsed_args,
+                          startup_timeline_path=startup_timeline_path)
       startup_stats.print_raw_stats(stats)
+      _maybe_print_startup_timeline_path(startup_timeline_path)
       sys.stdout.flush()
       stat_list.append(stats)
 
     startup_stats.print_aggregated_stats(stat_list)
     sys.stdout.flush()
+    if parsed_args.mode == 'perftest' and parsed_args.perf_results_db:
+      _record_perf_results(parsed_args, stat_list)
+
+
+def _record_perf_results(parsed_args, stat_list):
+  stat_list = [stats for stats in stat_list if stats.is_complete()]
+  if not stat_list:
+    return
+  with open(OPTIONS.get_configure_options_file()) as f:
+    configure_options = f.read().strip()
+  label = ' '.join(os.path.basename(apk_path)
+                   for apk_path in parsed_args.apk_path_list)
+  if parsed_args.additional_metadata:
+    label += ' ' + json.dumps(parsed_args.additional_metadata, sort_keys=True)
+  with perf_results_store.PerfResultsStore(
+      parsed_args.perf_results_db) as store:
+    store.add_run(startup_stats.build_raw_stats(stat_list),
+                  perf_results_store.get_build_tag(), configure_options,
+                  platform.node(), label)
 
 
 def _check_apk_existence(parsed_args):
@@ -566,7 +607,7 @@ def _terminate_chrome(chrome):
   chrome.wait(_CHROME_KILL_TIMEOUT)
 
 
-def _run_chrome(parsed_args, **kwargs):
+def _run_chrome(parsed_args, startup_timeline_path=None, **kwargs):
   if parsed_args.logcat is not None:
     # adb process will be terminated in the atexit handler, registered
     # in the signal_util.setup().
@@ -596,8 +637,14 @@ def _run_chrome(parsed_args, **kwargs):
     with open(_CHROME_PID_PATH, 'w') as pid_file:
       pid_file.write('%d\n' % p.pid)
 
+    profiler = None
+    if startup_timeline_path:
+      profiler = startup_profiler.StartupProfiler(p.pid)
+      profiler.start()
+
     stats = startup_stats.StartupStats()
-    handler = _select_output_handler(parsed_args, stats, p, **kwargs)
+    handler = _select_output_handler(parsed_args, stats, p, profiler=profiler,
+                                     **kwargs)
 
     # Wait for the process to finish or us to be interrupted.
     try:
@@ -605,9 +652,15 @@ def _run_chrome(parsed_args, **kwargs):
     except output_handler.ChromeFlakinessError:
       # Chrome is terminated due to its flakiness. Retry.
       continue
+    finally:
+      if profiler:
+        profiler.stop()
 
     if returncode:
       sys.exit(returncode)
+    if profiler:
+      file_util.makedirs_safely(os.path.dirname(startup_timeline_path))
+      profiler.write(startup_timeline_path)
     return stats
 
   # Here, the Chrome flakiness failure has continued too many times.
@@ -17,6 +17,7 @@ from src.build import ninja_generator
 from src.build.build_options import OPTIONS
 from src.build.metadata import manager
 from src.build.util import launch_chrome_util
+from src.build.util import perf_results_store
 from src.build.util import remote_executor
 
 _DEFAULT_TIMEOUT = 60
@@ -86,6 +87,8 @@ def _validate_perftest_settings(parser, args):
       parser.error("--iterations only valid in 'perftest' mode")
     if args.iteration_lock_file:
       parser.error("--iteration-lock-file only valid in 'perftest' mode")
+    if args.startup_timeline_dir:
+      parser.error("--startup-timeline-dir only valid in 'perftest' mode")
 
 
 def _validate_system_settings(parser, args):
@@ -459,6 +462,13 @@ Native Client Debugging
                       help='The patch expansion file, e.g. '
                       'patch.123.com.example.app.obb.')
 
+  parser.add_argument('--perf-results-db', metavar='<path>',
+                      default=perf_results_store.get_default_path(),
+                      help='Works with perftest command only. Appends the '
+                      'results to the database at <path>, which can be '
+                      'examined by src/build/perf_report.py. Pass an empty '
+                      'string not to record the results.')
+
   parser.add_argument('--perfstartup', type=int, metavar='<N>',
                       help='Launch with perf and collect data for the first '
                       '<N> seconds. Plugin will be killed after this timeout.')
@@ -486,6 +496,12 @@ Native Client Debugging
                       help='Used by atftest to indicate how to launch the '
                       'tests.')
 
+  parser.add_argument('--startup-timeline-dir', metavar='<dir>',
+                      help='Works with perftest command only. Samples the '
+                      'memory and CPU usage of the Chrome processes and '
+                      'collects the startup phases during each launch, and '
+                      'writes them to <dir> as Chrome trace files.')
+
   parser.add_argument('--timeout', type=int, default=_DEFAULT_TIMEOUT,
                       metavar='<T>',
                       help='Works with atftest, system and perftest commands '
@@ -7,10 +7,14 @@
 import argparse
 import cPickle
 import collections
+import errno
 import glob
+import hashlib
 import itertools
 import json
 import logging
+import marshal
+import multiprocessing
 import os
 import re
 import shlex
@@ -21,6 +25,7 @@ import tempfile
 from src.build import analyze_diffs
 from src.build import build_common
 from src.build import open_source
+from src.build.util import concurrent
 from src.build.util import file_util
 from src.build.util import logging_util
 
@@ -57,6 +62,42 @@ _DEFAULT_LINT_TARGET_DIR_LIST = [
     'third_party/examples',
 ]
 
+# The directory to store the lint results of the files which passed.
+_LINT_CACHE_DIR = os.path.join(build_common.OUT_DIR, 'lint_cache')
+_LINT_CACHE_VERSION = 0
+
+# The maximum number of files passed to a linter process at once.
+_MAX_BATCH_SIZE = 50
+
+
+def _compute_files_digest(paths):
+  digest = hashlib.sha1()
+  for path in paths:
+    digest.update(path)
+    try:
+      with open(path, 'rb') as f:
+        digest.update(f.read())
+    except IOError as e:
+      # The linter fails to run, so its result is not cached anyway.
+      if e.errno != errno.ENOENT:
+        raise
+  return digest.hexdigest()
+
+
+def _list_python_files(directories):
+  """Returns the sorted list of the .py files under |directories|."""
+  paths = []
+  for directory in directories:
+    for dirpath, _, filenames in os.walk(directory):
+      paths.extend(os.path.join(dirpath, filename)
+                   for filename in filenames if filename.endswith('.py'))
+  return sorted(paths)
+
+
+def _get_source_path(module_path):
+  """Returns the path to the .py file for a module's __file__."""
+  return os.path.splitext(module_path)[0] + '.py'
+
 
 class FileStatistics:
   def __init__(self, filename=None):
@@ -77,10 +118,16 @@ class Linter(object):
     files. Subclasses can override if necessary.
   - run(path): Applies the lint to the file. Returns True on success, otherwise
     False. All subclasses must override this method.
+  - run_batch(paths): Applies the lint to the files, and returns a dict from
+    each path to the result of run(). By default, run() is called for each
+    file. Subclasses can override to lint the files at once.
+  - version: A string which changes whenever the linter may report a
+    different result for the same file content. Used for the result cache.
   """
 
   def __init__(self, name, target_groups=None,
-               ignore_mods=False, ignore_upstream_tracking_file=True):
+               ignore_mods=False, ignore_upstream_tracking_file=True,
+               cacheable=True):
     """Initializes the basic linter instance.
 
     - name: Name of the linter. Used for the name based ignoring check whose
@@ -91,6 +138,8 @@ class Linter(object):
       mods/. By default: False.
     - ignore_upstream_tracking_file: If True, the linter will not be applied
       to files tracking an upstream file. By default: True.
+    - cacheable: If True, the result only depends on the path and the content
+      of the file, so that it can be cached. By default: True.
 
     Please see also LinterRunner for the common ignoring rule implementation.
     """
@@ -99,6 +148,8 @@ class Linter(object):
     self._target_groups = tuple(target_groups) if target_groups else None
     self._ignore_mods = ignore_mods
     self._ignore_upstream_tracking_file = ignore_upstream_tracking_file
+    self._cacheable = cacheable
+    self._version = None
 
   @property
   def name(self):
@@ -116,6 +167,21 @@ class Linter(object):
   def ignore_upstream_tracking_file(self):
     return self._ignore_upstream_tracking_file
 
+  @property
+  def cacheable(self):
+    return self._cacheable
+
+  @property
+  def version(self):
+    if self._version is None:
+      self._version = _compute_files_digest(self._get_implementation_files())
+    return self._version
+
+  def _get_implementation_files(self):
+    """Returns the list of the files which implement the linter."""
+    return [_get_source_path(__file__),
+            _get_source_path(analyze_diffs.__file__)]
+
   def should_run(self, path):
     """Returns True if this linter should be applied to the file at |path|."""
     # Returns True, by default, which means this linter will be applied to
@@ -127,6 +193,10 @@ class Linter(object):
     # All subclasses must override this function.
     raise NotImplementedError()
 
+  def run_batch(self, paths):
+    """Applies the linter to the files at |paths|."""
+    return dict((path, self.run(path)) for path in paths)
+
 
 class CommandLineLinterBase(Linter):
   """Abstract Linter implementation to run a linter child process."""
@@ -144,7 +214,18 @@ class CommandLineLinterBase(Linter):
         re.compile(error_line_filter, re.M) if error_line_filter else None)
 
   def run(self, path):
-    command = self._build_command(path)
+    return self._run_command(self._build_command(path))
+
+  def run_batch(self, paths):
+    if len(paths) > 1:
+      command = self._build_batch_command(paths)
+      # If some file has errors, lint the files one by one below, to find and
+      # report them.
+      if command and self._run_command(command, report_errors=False):
+        return dict.fromkeys(paths, True)
+    return super(CommandLineLinterBase, self).run_batch(paths)
+
+  def _run_command(self, command, report_errors=True):
     env = self._build_env()
     try:
       subprocess.check_output(command, stderr=subprocess.STDOUT, env=env)
@@ -153,6 +234,8 @@ class CommandLineLinterBase(Linter):
       logging.exception('Unable to invoke %s', command)
       return False
     except subprocess.CalledProcessError as e:
+      if not report_errors:
+        return False
       if self._error_line_filter:
         output = '\n'.join(self._error_line_filter.findall(e.output))
       else:
@@ -160,9 +243,26 @@ class CommandLineLinterBase(Linter):
       logging.error('Lint output errors:\n%s', output)
       return False
 
+  def _get_implementation_files(self):
+    files = super(CommandLineLinterBase, self)._get_implementation_files()
+    command = self._build_batch_command([])
+    if command:
+      files.append(command[0])
+    return files
+
   def _build_command(self, path):
-    """Builds the commandline to run a subprocess, and returns it."""
-    # All subclasses must implement this.
+    """Builds the commandline to run a subprocess, and returns it.
+
+    By default, the command to lint only |path| is built.
+    """
+    return self._build_batch_command([path])
+
+  def _build_batch_command(self, paths):
+    """Builds the commandline to lint all |paths| at once, and returns it.
+
+    Returns None if the linter does not support it.
+    """
+    # Subclasses must implement this or _build_command().
     raise NotImplementedError()
 
   def _build_env(self):
@@ -185,13 +285,17 @@ class CppLinter(CommandLineLinterBase):
         # Strip less information lines.
         error_line_filter='^(?:(?!Done processing|Total errors found:))(.*)')
 
-  def _build_command(self, path):
-    return ['third_party/tools/depot_tools/cpplint.py', '--root=src', path]
+  def _build_batch_command(self, paths):
+    return ['third_party/tools/depot_tools/cpplint.py', '--root=src'] + paths
 
 
 class JsLinter(CommandLineLinterBase):
   """Linter for JavaScript files."""
 
+  # The packages src/build/gjslint runs.
+  _PACKAGE_DIRS = ['third_party/tools/closure_linter',
+                   'third_party/tools/python_gflags']
+
   def __init__(self):
     super(JsLinter, self).__init__(
         'gjslint', target_groups=[_GROUP_JS],
@@ -199,7 +303,7 @@ class JsLinter(CommandLineLinterBase):
         error_line_filter=(
             '^' + re.escape(build_common.get_arc_root()) + '/(.*)'))
 
-  def _build_command(self, path):
+  def _build_batch_command(self, paths):
     # gjslint is run with the following options:
     #
     #  --unix_mode
@@ -224,8 +328,12 @@ class JsLinter(CommandLineLinterBase):
     #      full set of jsdoc tags, including "@public". This is how we can use
     #      them without gjslint complaining.
     return ['src/build/gjslint', '--unix_mode', '--jslint_error=all',
-            '--disable=210,213,217', '--custom_jsdoc_tags=public,namespace',
-            path]
+            '--disable=210,213,217',
+            '--custom_jsdoc_tags=public,namespace'] + paths
+
+  def _get_implementation_files(self):
+    return (super(JsLinter, self)._get_implementation_files() +
+            _list_python_files(JsLinter._PACKAGE_DIRS))
 
 
 class PyLinter(CommandLineLinterBase):
@@ -247,6 +355,12 @@ class PyLinter(CommandLineLinterBase):
       'E402',  # module level import not at top of file
   ]
 
+  # The packages src/build/flake8 runs.
+  _PACKAGE_DIRS = ['third_party/tools/flake8',
+                   'third_party/tools/mccabe',
+                   'third_party/tools/pep8',
+                   'third_party/tools/pyflakes']
+
   def __init__(self):
     super(PyLinter, self).__init__('flake8', target_groups=[_GROUP_PY])
 
@@ -255,17 +369,20 @@ class PyLinter(CommandLineLinterBase):
     # by us.
     return not path.startswith('third_party/')
 
-  def _build_command(self, path):
+  def _build_batch_command(self, paths):
     return ['src/build/flake8',
             '--ignore=' + ','.join(PyLinter._DISABLED_LINT_LIST),
-            '--max-line-length=80',
-            path]
+            '--max-line-length=80'] + paths
+
+  def _get_implementation_files(self):
+    return (super(PyLinter, self)._get_implementation_files() +
+            _list_python_files(PyLinter._PACKAGE_DIRS))
 
 
 class TestConfigLinter(CommandLineLinterBase):
   """Linter for src/integration_tests/expectations/"""
   # This list must be sync'ed with suite_runner_config's evaluation context.
-  # Please see also suite_runner_config._read_test_config().
+  # Please see also suite_runner_config._eval_test_config().
   _BUILTIN_VARS = [
       # Expectation flags.
       'PASS', 'FAIL', 'TIMEOUT', 'NOT_SUPPORTED', 'LARGE', 'FLAKY',
@@ -292,11 +409,11 @@ class TestConfigLinter(CommandLineLinterBase):
     return (path.startswith('src/integration_tests/expectations/') and
             os.path.basename(path) not in TestConfigLinter._META_FILE_LIST)
 
-  def _build_command(self, path):
+  def _build_batch_command(self, paths):
     # E501: line too long.
     # We do not limit the line length, considering some test names are very
     # long.
-    return ['src/build/flake8', '--ignore=E501', path]
+    return ['src/build/flake8', '--ignore=E501'] + paths
 
   def _build_env(self):
     env = os.environ.copy()
@@ -319,8 +436,8 @@ class CopyrightLinter(CommandLineLinterBase):
     # copyrights all be consistent.
     return path.startswith('src/') or open_source.is_open_sourced(path)
 
-  def _build_command(self, path):
-    return ['src/build/check_copyright.py', path]
+  def _build_batch_command(self, paths):
+    return ['src/build/check_copyright.py'] + paths
 
 
 class UpstreamLinter(Linter):
@@ -399,7 +516,8 @@ class OpenSourceLinter(Linter):
   """Linter to check OPEN_SOURCE files."""
 
   def __init__(self):
-    super(OpenSourceLinter, self).__init__('opensourcelint')
+    # The result depends on the files in the directory.
+    super(OpenSourceLinter, self).__init__('opensourcelint', cacheable=False)
 
   def should_run(self, path):
     # Accept only OPEN_SOURCE file.
@@ -434,10 +552,16 @@ class DiffLinter(CommandLineLinterBase):
       Note that it is the caller's responsibility to remove the generated
       files.
     """
+    # The result depends on the upstream file, and the output is needed for
+    # the statistics, so it is not cached.
     super(DiffLinter, self).__init__(
-        'analyze_diffs', ignore_upstream_tracking_file=False)
+        'analyze_diffs', ignore_upstream_tracking_file=False, cacheable=False)
     self._output_dir = output_dir
 
+  def _build_batch_command(self, paths):
+    # analyze_diffs.py takes only one file.
+    return None
+
   def _build_command(self, path):
     command = ['src/build/analyze_diffs.py', path]
     if self._output_dir:
@@ -453,6 +577,50 @@ class DiffLinter(CommandLineLinterBase):
     return command
 
 
+class LintResultCache(object):
+  """Remembers the linters which passed for the content of each file.
+
+  The result for each file is stored in a separate file under |cache_dir|, so
+  that lint_source.py running for different files concurrently (e.g. from
+  ninja) does not conflict. Only passing results are cached, so that errors are
+  reported again on the next run.
+  """
+
+  def __init__(self, cache_dir=None):
+    self._cache_dir = cache_dir or _LINT_CACHE_DIR
+
+  def _get_cache_path(self, path):
+    return os.path.join(
+        self._cache_dir, os.path.abspath(path).lstrip(os.sep) + '.cache')
+
+  def get_passed_linters(self, path, digest):
+    """Returns a dict from the name to the version of the passed linters."""
+    try:
+      with open(self._get_cache_path(path), 'rb') as f:
+        data = marshal.load(f)
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return {}
+      raise
+    except (EOFError, ValueError, TypeError):
+      return {}
+    if (data.get('version') != _LINT_CACHE_VERSION or
+        data.get('digest') != digest):
+      return {}
+    return data['passed']
+
+  def set_passed_linters(self, path, digest, passed):
+    data = {
+        'version': _LINT_CACHE_VERSION,
+        'digest': digest,
+        'passed': passed,
+    }
+    cache_path = self._get_cache_path(path)
+    file_util.makedirs_safely(os.path.dirname(cache_path))
+    file_util.generate_file_atomically(
+        cache_path, lambda f: marshal.dump(data, f))
+
+
 class LinterRunner(object):
   """Takes a list of Linters, and runs them."""
 
@@ -471,18 +639,22 @@ class LinterRunner(object):
       '.s': _GROUP_ASM,
   }
 
-  def __init__(self, linter_list, ignore_rule=None):
+  def __init__(self, linter_list, ignore_rule=None, cache=None, jobs=1):
+    """Initializes the runner.
+
+    - cache: LintResultCache to skip the linters which passed for the same
+      file content. Can be None not to cache.
+    - jobs: The number of the linters to run in parallel.
+    """
     self._linter_list = linter_list
     self._ignore_rule = ignore_rule or {}
+    self._cache = cache
+    self._jobs = jobs
 
-  def run(self, path):
-    # In is_tracking_an_upstream_file, the path is opened.
-    # To avoid invoking it many times for a file, we cache the result, and
-    # pass it to Linter.should_run() method via an argument.
-    is_tracking_upstream = analyze_diffs.is_tracking_an_upstream_file(path)
+  def _get_linters_to_run(self, path, is_tracking_upstream):
     group = LinterRunner._EXTENSION_GROUP_MAP.get(
         os.path.splitext(path)[1].lower())
-    result = True
+    result = []
     for linter in self._linter_list:
       # Common rule to check if linter should be applied to the file.
       if (linter.name in self._ignore_rule.get(path, []) or
@@ -493,16 +665,70 @@ class LinterRunner(object):
       # Also, check each linter specific rule.
       if not linter.should_run(path):
         continue
+      result.append(linter)
+    return result
 
+  def run(self, path):
+    return self.run_all([path])
+
+  def run_all(self, paths):
+    """Applies the linters to |paths|, and returns True if all files pass."""
+    # A map from a linter to the paths to lint.
+    pending_paths = collections.OrderedDict(
+        (linter, []) for linter in self._linter_list)
+    # A map from a path to the content digest and the passed linters.
+    cache_entries = {}
+    for path in paths:
+      # Read the file only once, to compute the digest and the tracking path.
+      with open(path) as f:
+        content = f.read()
+      is_tracking_upstream = analyze_diffs.compute_tracking_path(
+          None, path, content.splitlines(True)) is not None
+      passed = {}
+      if self._cache:
+        digest = hashlib.sha1(content).hexdigest()
+        passed = self._cache.get_passed_linters(path, digest)
+        cache_entries[path] = (digest, passed)
+      for linter in self._get_linters_to_run(path, is_tracking_upstream):
+        if linter.cacheable and passed.get(linter.name) == linter.version:
+          continue
+        pending_paths[linter].append(path)
+
+    # Split the files into batches, so that all jobs have work to do.
+    batches = []
+    for linter, linter_paths in pending_paths.iteritems():
+      batch_size = min(_MAX_BATCH_SIZE,
+                       max(1, -(-len(linter_paths) // self._jobs)))
+      for i in xrange(0, len(linter_paths), batch_size):
+        batches.append((linter, linter_paths[i:i + batch_size]))
+
+    failed_paths = set()
+    with concurrent.ThreadPoolExecutor(self._jobs, daemon=True) as executor:
+      futures = [(linter, executor.submit(self._run_batch, linter, batch))
+                 for linter, batch in batches]
+      for linter, future in futures:
+        for path, result in future.result().iteritems():
+          if not result:
+            failed_paths.add(path)
+          elif linter.cacheable and path in cache_entries:
+            cache_entries[path][1][linter.name] = linter.version
+
+    for path in paths:
+      if path in failed_paths:
+        logging.error('%s: has lint errors', path)
+    if self._cache:
+      for path, (digest, passed) in cache_entries.iteritems():
+        self._cache.set_passed_linters(path, digest, passed)
+    return not failed_paths
+
+  def _run_batch(self, linter, paths):
+    for path in paths:
       logging.info('%- 10s: %s', linter.name, path)
-      result &= linter.run(path)
-
-    if not result:
-      logging.error('%s: has lint errors', path)
-    return result
+    return linter.run_batch(paths)
 
 
-def _run_lint(target_file_list, ignore_rule, output_dir):
+def _run_lint(target_file_list, ignore_rule, output_dir, jobs=1,
+              use_cache=True):
   """Applies all linters to the target_file_list.
 
   - target_file_list: List of the target files' paths.
@@ -510,16 +736,16 @@ def _run_lint(target_file_list, ignore_rule, output_dir):
   - output_dir: Directory to store the analyze_diffs.py's output data.
     If specified, it is callers' responsibility to remove the generated
     files, if necessary.
+  - jobs: The number of the linters to run in parallel.
+  - use_cache: If True, the linters which passed for the same file content
+    are skipped.
   """
   runner = LinterRunner(
       [CppLinter(), JsLinter(), PyLinter(), TestConfigLinter(),
        CopyrightLinter(), UpstreamLinter(), LicenseLinter(),
        OpenSourceLinter(), DiffLinter(output_dir)],
-      ignore_rule)
-  result = True
-  for path in target_file_list:
-    result &= runner.run(path)
-  return result
+      ignore_rule, cache=LintResultCache() if use_cache else None, jobs=jobs)
+  return runner.run_all(target_file_list)
 
 
 def _process_analyze_diffs_output(output_dir):
@@ -624,7 +850,8 @@ def _read_ignore_rule(path):
   return result
 
 
-def process(target_path_list, ignore_file=None, output_file=None):
+def process(target_path_list, ignore_file=None, output_file=None, jobs=None,
+            use_cache=True):
   target_file_list = _expand_path_list(target_path_list)
   ignore_rule = _read_ignore_rule(ignore_file)
   target_file_list = _filter_files(target_file_list)
@@ -633,7 +860,9 @@ def process(target_path_list, ignore_file=None, output_file=None):
   # iff |output_file| is specified.
   output_dir = tempfile.mkdtemp(dir='out') if output_file else None
   try:
-    if not _run_lint(target_file_list, ignore_rule, output_dir):
+    if not _run_lint(target_file_list, ignore_rule, output_dir,
+                     jobs=jobs or multiprocessing.cpu_count(),
+                     use_cache=use_cache):
       return 1
 
     if output_file:
@@ -715,7 +944,12 @@ def main():
                       'will lint all files.')
   parser.add_argument('--ignore', '-i', dest='ignore_file',
                       help='A text file containting list of files to ignore.')
+  parser.add_argument('--jobs', '-j', type=int,
+                      default=multiprocessing.cpu_count(),
+                      help='The number of linters to run in parallel.')
   parser.add_argument('--merge', action='store_true', help='Merge results.')
+  parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                      help='Lint the files even if they passed before.')
   parser.add_argument('--output', '-o', help='Output file for storing results.')
   parser.add_argument('--verbose', '-v', action='store_true',
                       help='Prints additional output.')
@@ -729,7 +963,8 @@ def main():
   if args.merge:
     return merge_results(args.files, args.output)
   else:
-    return process(args.files, args.ignore_file, args.output)
+    return process(args.files, args.ignore_file, args.output, jobs=args.jobs,
+                   use_cache=args.use_cache)
 
 if __name__ == '__main__':
   sys.exit(main())
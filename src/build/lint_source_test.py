@@ -0,0 +1,121 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for lint_source.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from src.build import lint_source
+
+
+class FakeLinter(lint_source.Linter):
+  def __init__(self, name='fake', cacheable=True):
+    super(FakeLinter, self).__init__(name, cacheable=cacheable)
+    self.linted_paths = []
+
+  @property
+  def version(self):
+    return '1'
+
+  def run(self, path):
+    self.linted_paths.append(os.path.basename(path))
+    with open(path) as f:
+      return 'error' not in f.read()
+
+
+class ShellLinter(lint_source.CommandLineLinterBase):
+  """Passes the files containing 'ok'."""
+
+  def __init__(self):
+    super(ShellLinter, self).__init__('shell')
+    self.commands = []
+
+  def _build_batch_command(self, paths):
+    command = ['sh', '-c', 'for f; do grep -q ok "$f" || exit 1; done',
+               'sh'] + paths
+    self.commands.append([os.path.basename(path) for path in paths])
+    return command
+
+
+class LinterRunnerTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def _write(self, name, content):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    return path
+
+  def test_cache(self):
+    paths = [self._write('a', 'ok'), self._write('b', 'ok'),
+             self._write('c', 'error')]
+    cache = lint_source.LintResultCache(os.path.join(self._tmpdir, 'cache'))
+
+    def run_lint():
+      linter = FakeLinter()
+      uncacheable_linter = FakeLinter('uncacheable', cacheable=False)
+      runner = lint_source.LinterRunner([linter, uncacheable_linter],
+                                        cache=cache, jobs=2)
+      result = runner.run_all(paths)
+      self.assertEquals(['a', 'b', 'c'],
+                        sorted(uncacheable_linter.linted_paths))
+      return result, sorted(linter.linted_paths)
+
+    self.assertEquals((False, ['a', 'b', 'c']), run_lint())
+    # Only the file with errors is linted again.
+    self.assertEquals((False, ['c']), run_lint())
+
+    self._write('b', 'modified')
+    self._write('c', 'fixed')
+    self.assertEquals((True, ['b', 'c']), run_lint())
+    self.assertEquals((True, []), run_lint())
+
+  def test_ignore_rule(self):
+    path = self._write('a', 'error')
+    linter = FakeLinter()
+    runner = lint_source.LinterRunner([linter], ignore_rule={path: ['fake']})
+    self.assertTrue(runner.run_all([path]))
+    self.assertEquals([], linter.linted_paths)
+
+  def test_command_line_linter_batch(self):
+    paths = [self._write('a', 'ok'), self._write('b', 'ok')]
+    linter = ShellLinter()
+    self.assertEquals({paths[0]: True, paths[1]: True},
+                      linter.run_batch(paths))
+    self.assertEquals([['a', 'b']], linter.commands)
+
+    # On failure, the files are linted one by one to find the errors.
+    paths.append(self._write('c', 'error'))
+    linter = ShellLinter()
+    self.assertEquals({paths[0]: True, paths[1]: True, paths[2]: False},
+                      linter.run_batch(paths))
+    self.assertEquals([['a', 'b', 'c'], ['a'], ['b'], ['c']], linter.commands)
+
+  def test_linter_version(self):
+    # analyze_diffs.py cannot lint files in a batch.
+    self.assertTrue(lint_source.DiffLinter(None).version)
+
+    # The version depends on the packages the linter runs.
+    package_dir = os.path.join(self._tmpdir, 'pyflakes')
+    os.mkdir(package_dir)
+    self._write('pyflakes/checker.py', 'v1')
+    with mock.patch.object(lint_source.PyLinter, '_PACKAGE_DIRS',
+                           [package_dir]):
+      version = lint_source.PyLinter().version
+      self.assertEquals(version, lint_source.PyLinter().version)
+      self._write('pyflakes/checker.py', 'v2')
+      self.assertNotEquals(version, lint_source.PyLinter().version)
+
+
+if __name__ == '__main__':
+  unittest.main()
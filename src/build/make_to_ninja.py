@@ -7,6 +7,9 @@
 # TODO(igorc): Support codegen rules. Perhaps needs a rework to parse resulting
 # commands rather than dumping variable names.
 
+import errno
+import hashlib
+import marshal
 import os
 import re
 import shlex
@@ -56,6 +59,11 @@ _ANDROID_HOST_GEN_SOURCES_DIR = os.path.join(
 _INTERMEDIATE_HEADERS_DIR = os.path.join(build_common.get_target_common_dir(),
                                          'intermediate_headers')
 
+# Holds the parsed results of make, which is the largest cost of make_to_ninja.
+_MAKE_CACHE_DIR = os.path.join(build_common.get_target_common_dir(),
+                               'make_to_ninja_cache')
+_MAKE_CACHE_VERSION = 0
+
 _CANNED_GEN_SOURCES_TAR = os.path.join(
     'canned', 'target', 'android', 'generated', 'gen_sources.tar.gz')
 
@@ -809,27 +817,30 @@ def _filter_make_output(workdir, stdout, stderr, in_file):
 
   # Print and filter out "Reading makefile" lines from stdout if necessary.
   result = []
+  makefiles = []
   has_logging = OPTIONS.is_make_to_ninja_logging()
   for line in stdout.split('\n'):
     match = _READING_MAKEFILE_RE.match(line)
     if match:
       if has_logging:
         print line
-      submake = os.path.join(workdir, match.group(1))
-      if not submake.startswith(_MAKE_TO_NINJA_DIR):
-        dependency_inspection.add_files(submake)
+      makefiles.append(match.group(1))
+      _add_submake_dependency(workdir, match.group(1))
     elif line:
       result.append(line)
 
-  return result
+  return result, makefiles
 
 
-def _run_make(workdir, in_file, extra_env_vars):
-  dependency_inspection.add_file_listing([workdir], None, None, True)
+def _add_submake_dependency(workdir, makefile):
+  submake = os.path.join(workdir, makefile)
+  if not submake.startswith(_MAKE_TO_NINJA_DIR):
+    dependency_inspection.add_files(submake)
+
 
+def _get_make_env():
   target = OPTIONS.target()
-  main_makefile = _create_main_makefile(in_file, extra_env_vars)
-  env = {
+  return {
       'CXX': toolchain.get_tool(target, 'cxx'),
       'CC': toolchain.get_tool(target, 'cc'),
       'LD': toolchain.get_tool(target, 'ld'),
@@ -845,6 +856,9 @@ def _run_make(workdir, in_file, extra_env_vars):
       'PATH': ':'.join([_MAKE_TO_NINJA_BIN_DIR, os.environ['PATH']])
   }
 
+
+def _run_make(workdir, in_file, main_makefile, env):
+  """Runs make and returns its output lines and the makefiles it read."""
   # "--debug=v" indicates when Make reads makefiles.
   make_cmd = [
       'make', '-f', '-', '-I', _MAKE_BUILD_DIR, '--always-make',
@@ -867,6 +881,137 @@ def _run_make(workdir, in_file, extra_env_vars):
                              in_file=in_file)
 
 
+# Maps (path, mtime, size, inode) to the digest of the file. Makefiles under
+# build/core are read by every make invocation, so they are hashed only once.
+_makefile_digest_cache = {}
+
+
+def _get_makefile_digest(path):
+  """Returns the digest of the makefile read by make, or None if missing."""
+  # Relative paths are resolved from the directory make runs in.
+  path = os.path.join(_MAKE_TO_NINJA_DIR, path)
+  try:
+    st = os.stat(path)
+  except OSError as e:
+    if e.errno != errno.ENOENT:
+      raise
+    return None
+  key = (path, st.st_mtime, st.st_size, st.st_ino)
+  digest = _makefile_digest_cache.get(key)
+  if digest is None:
+    digest = file_util.compute_file_digest(path)
+    _makefile_digest_cache[key] = digest
+  return digest
+
+
+def _get_listing_digest(workdir):
+  """Returns the digest of the file list under |workdir|.
+
+  Makefiles may use $(wildcard) or all-java-files-under, so the output of make
+  depends on the file list as well as the makefiles.
+  """
+  digest = hashlib.sha1()
+  for root, dirs, files in os.walk(workdir, followlinks=True):
+    dirs.sort()
+    for name in dirs + sorted(files):
+      digest.update(os.path.join(root, name) + '\0')
+  return digest.hexdigest()
+
+
+def _get_make_cache_path(main_makefile, env):
+  key = hashlib.sha1(main_makefile)
+  for item in sorted(env.iteritems()):
+    key.update('\0%s=%s' % item)
+  return os.path.join(_MAKE_CACHE_DIR, key.hexdigest())
+
+
+def _load_make_cache(cache_path, workdir):
+  """Returns the cached modules if none of the inputs of make is changed."""
+  try:
+    with open(cache_path) as f:
+      data = marshal.load(f)
+  except (EOFError, ValueError, TypeError):
+    return None
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+
+  if data['version'] != _MAKE_CACHE_VERSION:
+    return None
+  for makefile, digest in data['makefiles']:
+    if _get_makefile_digest(makefile) != digest:
+      return None
+  if _get_listing_digest(workdir) != data['listing']:
+    return None
+
+  # Record the same dependencies as running make does.
+  dependency_inspection.add_file_listing([workdir], None, None, True)
+  for makefile, _ in data['makefiles']:
+    _add_submake_dependency(workdir, makefile)
+  return data['modules']
+
+
+def _save_make_cache(cache_path, workdir, makefiles, modules):
+  data = {
+      'version': _MAKE_CACHE_VERSION,
+      'makefiles': [(makefile, _get_makefile_digest(makefile))
+                    for makefile in makefiles],
+      'listing': _get_listing_digest(workdir),
+      'modules': modules,
+  }
+  file_util.makedirs_safely(_MAKE_CACHE_DIR)
+  file_util.generate_file_atomically(cache_path,
+                                     lambda f: marshal.dump(data, f))
+
+
+def _split_modules(make_output_lines):
+  """Returns a list of (build_type, build_file, raw_vars) from make output."""
+  modules = []
+  build_type = ''
+  build_file = ''
+  build_lines = []
+  for line in make_output_lines:
+    if line.startswith(_VARS_PREFIX):
+      if build_type:
+        # Generate ninja for the previous lines
+        modules.append((build_type, build_file, _parse_vars(build_lines)))
+      line = line[len(_VARS_PREFIX):]
+      build_type, build_file = line.split(' ')
+      build_lines = []
+      continue
+    build_lines.append(line)
+  if build_type:
+    # Generate ninja for the previous lines
+    modules.append((build_type, build_file, _parse_vars(build_lines)))
+  return modules
+
+
+def _read_raw_modules(workdir, in_file, extra_env_vars):
+  """Returns a list of (build_type, build_file, raw_vars) for |in_file|.
+
+  When the config cache is enabled, the result is cached on disk keyed by the
+  main makefile and the environment, and reused unless the makefiles read by
+  make or the file list under |workdir| are changed.
+  """
+  main_makefile = _create_main_makefile(in_file, extra_env_vars)
+  env = _get_make_env()
+
+  use_cache = OPTIONS.enable_config_cache()
+  if use_cache:
+    cache_path = _get_make_cache_path(main_makefile, env)
+    modules = _load_make_cache(cache_path, workdir)
+    if modules is not None:
+      return modules
+
+  dependency_inspection.add_file_listing([workdir], None, None, True)
+  make_output_lines, makefiles = _run_make(workdir, in_file, main_makefile, env)
+  modules = _split_modules(make_output_lines)
+  if use_cache:
+    _save_make_cache(cache_path, workdir, makefiles, modules)
+  return modules
+
+
 def _filter_var_name(name):
   # If variable name starts with one of our prefixes, ignore. Too many
   # variants of these prefixed inheritance variables.
@@ -2701,28 +2846,9 @@ class MakefileNinjaTranslator:
 
   @staticmethod
   def _read_modules(workdir, file_name, extra_env_vars):
-    make_output_lines = _run_make(workdir, file_name, extra_env_vars)
-
-    vars_list = []
-    build_type = ''
-    build_file = ''
-    build_lines = []
-    for line in make_output_lines:
-      if line.startswith(_VARS_PREFIX):
-        if build_type:
-          # Generate ninja for the previous lines
-          raw_vars = _parse_vars(build_lines)
-          vars_list += [MakeVars(build_type, build_file, raw_vars)]
-        line = line[len(_VARS_PREFIX):]
-        build_type, build_file = line.split(' ')
-        build_lines = []
-        continue
-      build_lines.append(line)
-    if build_type:
-      # Generate ninja for the previous lines
-      raw_vars = _parse_vars(build_lines)
-      vars_list += [MakeVars(build_type, build_file, raw_vars)]
-    return vars_list
+    return [MakeVars(build_type, build_file, raw_vars)
+            for build_type, build_file, raw_vars
+            in _read_raw_modules(workdir, file_name, extra_env_vars)]
 
 
 def run(path):
@@ -4,11 +4,19 @@
 
 """Unittests for make_to_ninja.py."""
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from src.build import make_to_ninja
 
 
+def _write(path, content):
+  with open(path, 'w') as f:
+    f.write(content)
+
+
 class MakeToNinjaUnittest(unittest.TestCase):
   def testFlagsRemove(self):
     asmflags = ['asmflags']
@@ -37,6 +45,66 @@ class MakeToNinjaUnittest(unittest.TestCase):
     self.assertTrue(flags.has_flag('abc'))
     self.assertFalse(flags.has_flag('cba'))
 
+  def testSplitModules(self):
+    modules = make_to_ninja._split_modules([
+        '=== VARIABLES FOR: static_library foo/Android.mk',
+        '=== VARIABLE LOCAL_MODULE=libfoo',
+        '=== VARIABLES FOR: shared_library foo/Android.mk',
+        '=== VARIABLE LOCAL_MODULE=libbar',
+        '=== VARIABLE LOCAL_CFLAGS=-DBAR \\',
+        '  -DBAZ'])
+    self.assertEquals(
+        [('static_library', 'foo/Android.mk', {'LOCAL_MODULE': 'libfoo'}),
+         ('shared_library', 'foo/Android.mk',
+          {'LOCAL_MODULE': 'libbar', 'LOCAL_CFLAGS': '-DBAR \\\n  -DBAZ'})],
+        modules)
+
+
+class MakeCacheUnittest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._original_cache_dir = make_to_ninja._MAKE_CACHE_DIR
+    make_to_ninja._MAKE_CACHE_DIR = os.path.join(self._tmpdir, 'cache')
+    self._workdir = os.path.join(self._tmpdir, 'foo')
+    self._makefile = os.path.join(self._workdir, 'Android.mk')
+    os.makedirs(self._workdir)
+    _write(self._makefile, 'LOCAL_MODULE := libfoo\n')
+
+    self._cache_path = make_to_ninja._get_make_cache_path(
+        'include Android.mk', {'CC': 'gcc'})
+    self._modules = [
+        ('static_library', self._makefile, {'LOCAL_MODULE': 'libfoo'})]
+    make_to_ninja._save_make_cache(self._cache_path, self._workdir,
+                                   [self._makefile], self._modules)
+
+  def tearDown(self):
+    make_to_ninja._MAKE_CACHE_DIR = self._original_cache_dir
+    shutil.rmtree(self._tmpdir)
+
+  def _load(self):
+    return make_to_ninja._load_make_cache(self._cache_path, self._workdir)
+
+  def testCacheKey(self):
+    self.assertNotEquals(
+        self._cache_path,
+        make_to_ninja._get_make_cache_path('include Android.mk',
+                                           {'CC': 'clang'}))
+
+  def testCacheHit(self):
+    self.assertEquals(self._modules, self._load())
+
+    # Touching the makefile does not invalidate the cache.
+    os.utime(self._makefile, (0, 0))
+    self.assertEquals(self._modules, self._load())
+
+  def testMakefileChanged(self):
+    _write(self._makefile, 'LOCAL_MODULE := libbar\n')
+    self.assertIsNone(self._load())
+
+  def testFileAdded(self):
+    _write(os.path.join(self._workdir, 'foo.c'), '')
+    self.assertIsNone(self._load())
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -7,6 +7,7 @@
 
 import collections
 import copy
+import errno
 import fnmatch
 import hashlib
 import json
@@ -20,13 +21,14 @@ import traceback
 
 import ninja_syntax
 
-from src.build import analyze_diffs
 from src.build import build_common
+from src.build import dependency_graph
 from src.build import ninja_generator_runner
 from src.build import notices
 from src.build import open_source
 from src.build import staging
 from src.build import toolchain
+from src.build import tracking_path_index
 from src.build import wrapped_functions
 from src.build.build_options import OPTIONS
 from src.build.util import file_util
@@ -277,6 +279,108 @@ class _BootclasspathComputer(object):
     return _BootclasspathComputer._classes
 
 
+def _has_same_content(path, content):
+  """Returns True if the file at |path| has exactly |content|."""
+  try:
+    if os.stat(path).st_size != len(content):
+      return False
+    with open(path) as f:
+      return f.read() == content
+  except (IOError, OSError) as e:
+    if e.errno != errno.ENOENT:
+      raise
+    return False
+
+
+def _emit_content(path, content):
+  """Writes |content| to |path| unless the file already has it.
+
+  The file is left as is if it has the same contents so that its mtime is not
+  bumped. Returns True if the file is written.
+  """
+  if _has_same_content(path, content):
+    return False
+  with open(path, 'w') as f:
+    f.write(content)
+  return True
+
+
+class RenderedNinja(object):
+  """A compact form of a NinjaGenerator whose contents are already rendered.
+
+  NinjaGenerators created in the configure workers are converted into this
+  form before they are sent back to the parent process, and the config cache
+  stores the same form. It holds the ninja script text, and only the metadata
+  that the later phases of the configuration need, such as target groups,
+  installed files, test lists and notices. The attribute names are kept the
+  same as NinjaGenerator's, so that it can be handled in the same way.
+  """
+
+  def __init__(self, data):
+    self._module_name = data['module_name']
+    self._ninja_name = data['ninja_name']
+    self._ninja_path = data['ninja_path']
+    self._is_host = data['is_host']
+    self._use_global_scope = data['use_global_scope']
+    self._content = data['content']
+    self._generator_kind = data['generator_kind']
+    self._build_rule_list = data['build_rule_list']
+    self._root_dir_install_targets = data['root_dir_install_targets']
+    self._output_path_list = set(data['output_path_list'])
+    self._test_lists = data['test_lists']
+    self._test_info_list = data['test_info_list']
+    self._notices = notices.notices_from_dict(data['notices'])
+    self._notice_archive = data['notice_archive']
+    self._notices_install_path = data['notices_install_path']
+    self._is_installed = data['is_installed']
+    self._included_module_names = data['included_module_names']
+    # The followings are available only for some kinds of generators. See
+    # CNinjaGenerator, ArchiveNinjaGenerator and SharedObjectNinjaGenerator.
+    self._shared_deps = data.get('shared_deps', [])
+    self._enable_libcxx = data.get('enable_libcxx', False)
+    self._instances = data.get('instances', 1)
+    self.production_shared_library_list = data.get(
+        'production_shared_library_list', [])
+    self._data = data
+
+  def to_dict(self):
+    return self._data
+
+  def emit(self):
+    """Emits the contents of ninja script to the file.
+
+    Returns True if the file is written.
+    """
+    return _emit_content(self._ninja_path, self._content)
+
+  def is_host(self):
+    return self._is_host
+
+  def get_module_name(self):
+    return self._module_name
+
+  def get_ninja_path(self):
+    return self._ninja_path
+
+  def get_output_path_list(self):
+    return self._output_path_list
+
+  def get_generator_kind(self):
+    return self._generator_kind
+
+  def is_installed(self):
+    return self._is_installed
+
+  def get_notices_install_path(self):
+    return self._notices_install_path
+
+  def get_notice_archive(self):
+    return self._notice_archive
+
+  def get_included_module_names(self):
+    return self._included_module_names
+
+
 class NinjaGenerator(ninja_syntax.Writer):
   """Encapsulate ninja file generation.
 
@@ -454,9 +558,45 @@ class NinjaGenerator(ninja_syntax.Writer):
     return canon
 
   def emit(self):
-    """Emits the contents of ninja script to the file."""
-    with open(self._ninja_path, 'w') as f:
-      f.write(self.output.getvalue())
+    """Emits the contents of ninja script to the file.
+
+    If the file already has the same contents, it is left as is so that its
+    mtime is not bumped. Returns True if the file is written.
+    """
+    return _emit_content(self._ninja_path, self.output.getvalue())
+
+  def _get_rendered_data(self):
+    """Returns a dict to create RenderedNinja, which can be marshalled."""
+    return {
+        'module_name': self._module_name,
+        'ninja_name': self._ninja_name,
+        'ninja_path': self._ninja_path,
+        'is_host': self._is_host,
+        'use_global_scope': self._use_global_scope,
+        'content': self.output.getvalue(),
+        'generator_kind': self.get_generator_kind(),
+        'build_rule_list': self._build_rule_list,
+        'root_dir_install_targets': self._root_dir_install_targets,
+        'output_path_list': self._output_path_list,
+        'test_lists': self._test_lists,
+        'test_info_list': self._test_info_list,
+        'notices': self._notices.to_dict(),
+        'notice_archive': self._notice_archive,
+        'notices_install_path': self.get_notices_install_path(),
+        'is_installed': bool(self.is_installed()),
+        'included_module_names': self.get_included_module_names(),
+    }
+
+  def render(self):
+    """Returns RenderedNinja, which is the compact form of this instance."""
+    return RenderedNinja(self._get_rendered_data())
+
+  def get_generator_kind(self):
+    """Returns the kind of the generator used for the verification.
+
+    This is None for generators which do not need the verification.
+    """
+    return None
 
   def add_flags(self, key, *values):
     values = [pipes.quote(x) for x in values]
@@ -624,12 +764,9 @@ class NinjaGenerator(ninja_syntax.Writer):
       if (s.startswith(build_common.OUT_DIR) and
           not s.startswith(build_common.get_staging_root())):
         continue
-      if not os.path.exists(s):
-        continue
-      with open_dependency(s, 'r', ignore_dependency=True) as f:
-        tracking_file = analyze_diffs.compute_tracking_path(None, s, f)
-        if tracking_file:
-          sources_including_tracking.append(tracking_file)
+      tracking_file = tracking_path_index.get_tracking_path(s)
+      if tracking_file:
+        sources_including_tracking.append(tracking_file)
     if OPTIONS.is_notices_logging():
       print 'Adding notice sources to %s: %s' % (self.get_module_name(),
                                                  sources_including_tracking)
@@ -868,7 +1005,7 @@ class NinjaGenerator(ninja_syntax.Writer):
     """Returns production shared libs in the given ninja_list."""
     production_shared_libs = []
     for ninja in ninja_list:
-      if not isinstance(ninja, SharedObjectNinjaGenerator):
+      if ninja.get_generator_kind() != 'shared_object':
         continue
       for path in ninja.production_shared_library_list:
         production_shared_libs.append(build_common.get_build_dir() + path)
@@ -1032,6 +1169,12 @@ class CNinjaGenerator(NinjaGenerator):
   def get_intermediates_dir(self):
     return self._intermediates_dir
 
+  def _get_rendered_data(self):
+    data = super(CNinjaGenerator, self)._get_rendered_data()
+    data['shared_deps'] = self._shared_deps
+    data['enable_libcxx'] = self._enable_libcxx
+    return data
+
   @staticmethod
   def add_to_variable(variables, flag_name, addend):
     if flag_name not in variables:
@@ -1911,6 +2054,14 @@ class TopLevelNinjaGenerator(NinjaGenerator):
   def _get_depfile_path(self):
     return self._ninja_path + '.dep'
 
+  def emit(self):
+    # build.ninja is the output of the regen_ninja rule, so it is always
+    # written. Otherwise ninja would see it older than its inputs and keep
+    # regenerating it.
+    with open(self._ninja_path, 'w') as f:
+      f.write(self.output.getvalue())
+    return True
+
   # TODO(crbug.com/177699): Improve ninja regeneration rule generation.
   def _emit_ninja_regeneration_rules(self):
     # Add rule/target to regenerate all ninja files we built this time
@@ -1983,6 +2134,12 @@ class TopLevelNinjaGenerator(NinjaGenerator):
         self._get_depfile_path(),
         '%s: %s' % (self._ninja_path, ' '.join(input_dependencies)))
 
+  @staticmethod
+  def emit_dependency_graph(ninja_list):
+    dependency_graph.save(
+        dependency_graph.get_graph_file_path(),
+        [ninja._build_rule_list for ninja in ninja_list])
+
   @staticmethod
   def cleanup_out_directories(ninja_list):
     output_paths = set()
@@ -2035,6 +2192,14 @@ class ArchiveNinjaGenerator(CNinjaGenerator):
       self._disallowed_symbol_files = ['disallowed_symbols.defined']
     self._instances = instances
 
+  def get_generator_kind(self):
+    return 'archive'
+
+  def _get_rendered_data(self):
+    data = super(ArchiveNinjaGenerator, self)._get_rendered_data()
+    data['instances'] = self._instances
+    return data
+
   def archive(self, **kwargs):
     if self._shared_deps or self._static_deps or self._whole_archive_deps:
       raise Exception('Cannot use dependencies with an archive')
@@ -2191,6 +2356,15 @@ class SharedObjectNinjaGenerator(CNinjaGenerator):
       self._is_clang_linker_enabled = use_clang_linker
     self._is_for_test = is_for_test
 
+  def get_generator_kind(self):
+    return 'shared_object'
+
+  def _get_rendered_data(self):
+    data = super(SharedObjectNinjaGenerator, self)._get_rendered_data()
+    data['production_shared_library_list'] = (
+        self.production_shared_library_list)
+    return data
+
   @classmethod
   def disable_linking(cls):
     """Disables further linking of any shared libraries"""
@@ -2318,6 +2492,9 @@ class ExecNinjaGenerator(CNinjaGenerator):
               use_stlport=not self._enable_libcxx,
               use_libcxx=self._enable_libcxx))
 
+  def get_generator_kind(self):
+    return 'exec'
+
   def link(self, variables=None, implicit=None, **kwargs):
     implicit = (build_common.as_list(implicit) + self._static_deps +
                 self._whole_archive_deps)
@@ -2571,6 +2748,9 @@ class TestNinjaGenerator(ExecNinjaGenerator):
     if OPTIONS.is_arm():
       self._qemu_disabled_tests.append('*.QEMU_DISABLED_*')
 
+  def get_generator_kind(self):
+    return 'test'
+
   @staticmethod
   def _get_toplevel_run_test_variables():
     """Get the variables for running unit tests defined in toplevel ninja."""
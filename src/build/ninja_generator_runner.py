@@ -2,12 +2,18 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import errno
+import heapq
 import logging
+import marshal
 import multiprocessing
+import os
 import time
 import traceback
 
+from src.build import shared_index
 from src.build.util import concurrent
+from src.build.util import file_util
 
 
 # Represents an individual task to run on |ninja_generator_runner|.
@@ -105,7 +111,9 @@ def _run_task(generator_task):
     # 2) to request to run ninja generators back to the parent process, at the
     # same time.
     assert (not result or not task_list)
-    return (result, task_list)
+    # The entries added to the shared indexes are sent back to the parent
+    # process, so that they are shared with the other tasks and saved.
+    return (result, task_list, elapsed_time, shared_index.pop_new_entries())
   except BaseException:
     if multiprocessing.current_process().name == 'MainProcess':
       # Just raise the exception up the single process, single thread
@@ -126,50 +134,205 @@ def _run_task(generator_task):
     __request_task_list = None
 
 
-def run_in_parallel(task_list, maximum_jobs):
+def _stable_repr(value):
+  """Returns a repr of |value| which does not change across runs.
+
+  Objects other than the basic types are represented by their class names, as
+  their default repr() has their addresses.
+  """
+  if isinstance(value, (basestring, int, long, float, bool, type(None))):
+    return repr(value)
+  if isinstance(value, (list, tuple)):
+    return '[%s]' % ', '.join(_stable_repr(item) for item in value)
+  if isinstance(value, dict):
+    return '{%s}' % ', '.join(
+        '%s: %s' % (_stable_repr(key), _stable_repr(item))
+        for key, item in sorted(value.iteritems()))
+  value_type = type(value)
+  return '<%s.%s>' % (value_type.__module__, value_type.__name__)
+
+
+def _get_task_key(generator_task):
+  """Returns the key to record the duration of the task.
+
+  The arguments are included, as sub tasks often run the same function with
+  different arguments.
+  """
+  function = generator_task.function
+  key = '%s.%s' % (function.__module__, function.__name__)
+  if generator_task.args:
+    key += '(%s)' % ', '.join(_stable_repr(arg)
+                              for arg in generator_task.args)
+  return key
+
+
+class TaskDurationHistory(object):
+  """Records how long each task took in the previous runs.
+
+  The duration of a task includes the durations of the tasks it requested via
+  request_run_in_parallel(), so that a config.py which fans out into many slow
+  sub tasks is started early.
+  """
+
+  _VERSION = 1
+
+  def __init__(self, path):
+    self._path = path
+    self._durations = {}
+    try:
+      with open(path) as f:
+        data = marshal.load(f)
+      if data['version'] == TaskDurationHistory._VERSION:
+        self._durations = data['durations']
+    except (EOFError, ValueError, TypeError):
+      pass
+    except IOError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+  def get(self, key):
+    """Returns the recorded duration of the task, or None if unknown."""
+    return self._durations.get(key)
+
+  def update(self, key, duration):
+    self._durations[key] = duration
+
+  def save(self):
+    data = {'version': TaskDurationHistory._VERSION,
+            'durations': self._durations}
+    file_util.makedirs_safely(os.path.dirname(self._path))
+    file_util.generate_file_atomically(self._path,
+                                       lambda f: marshal.dump(data, f))
+
+
+class _ScheduledTask(object):
+  """Tracks a task and the sub tasks it requested to measure its duration."""
+
+  def __init__(self, generator_task, parent):
+    self.generator_task = generator_task
+    self.key = _get_task_key(generator_task)
+    self.parent = parent
+    # The number of this task and its sub tasks that are not completed yet.
+    self.num_pending = 1
+    self.duration = 0
+
+
+class _TaskQueue(object):
+  """Priority queue of tasks, which are not submitted to the executor yet.
+
+  Tasks requested via request_run_in_parallel() come first, as their parent
+  task has already started. Then tasks are ordered from the longest one, based
+  on |history|. Tasks without history are considered as the longest.
+  """
+
+  def __init__(self, history):
+    self._history = history
+    self._heap = []
+    self._sequence = 0
+
+  def __len__(self):
+    return len(self._heap)
+
+  def push(self, scheduled_task):
+    duration = None
+    if self._history:
+      duration = self._history.get(scheduled_task.key)
+    if duration is None:
+      duration = float('inf')
+    is_requested = scheduled_task.parent is not None
+    heapq.heappush(self._heap, (not is_requested, -duration, self._sequence,
+                                scheduled_task))
+    self._sequence += 1
+
+  def pop(self):
+    return heapq.heappop(self._heap)[-1]
+
+
+def _complete_task(scheduled_task, history):
+  """Records the durations of the task and its ancestors completed by it."""
+  while scheduled_task:
+    scheduled_task.num_pending -= 1
+    if scheduled_task.num_pending:
+      break
+    if history:
+      history.update(scheduled_task.key, scheduled_task.duration)
+    parent = scheduled_task.parent
+    if parent:
+      parent.duration += scheduled_task.duration
+    scheduled_task = parent
+
+
+def run_in_parallel(task_list, maximum_jobs, history=None,
+                    main_process_task=None):
   """Runs task_list in parallel on multiprocess.
 
   Returns a list of NinjaGenerator created in subprocesses.
   If |maximum_jobs| is set to 0, this function runs the ninja generation
   synchronously in process.
+  If |history| is given, tasks are started from the longest one according to
+  the recorded durations, and the history is updated with the durations of
+  this run.
+  If |main_process_task| is given, it is called in the main process while the
+  tasks run in the subprocesses.
   """
   if maximum_jobs == 0:
     executor = concurrent.SynchronousExecutor()
+    num_workers = 1
   else:
-    executor = concurrent.ProcessPoolExecutor(max_workers=maximum_jobs)
+    num_workers = maximum_jobs or multiprocessing.cpu_count()
+    executor = concurrent.ProcessPoolExecutor(max_workers=num_workers)
+
+  # Tasks are submitted only when a worker is available, so that the tasks in
+  # |task_queue| can be reordered as new tasks are requested.
+  task_queue = _TaskQueue(history)
+  for generator_task in task_list:
+    task_queue.push(_ScheduledTask(generator_task, None))
 
   result_list = []
   with executor:
     try:
-      # Submit initial tasks.
-      not_done = {executor.submit(_run_task, generator_task)
-                  for generator_task in task_list}
-      while not_done:
+      running = {}
+      while task_queue or running:
+        while task_queue and len(running) < num_workers:
+          scheduled_task = task_queue.pop()
+          future = executor.submit(_run_task, scheduled_task.generator_task)
+          running[future] = scheduled_task
+
+        if main_process_task:
+          main_process_task()
+          main_process_task = None
+
         # Wait any task is completed.
-        done, not_done = concurrent.wait(
-            not_done, return_when=concurrent.FIRST_COMPLETED)
+        done, _ = concurrent.wait(
+            running.keys(), return_when=concurrent.FIRST_COMPLETED)
 
         for completed_future in done:
+          scheduled_task = running.pop(completed_future)
           if completed_future.exception():
             # An exception is raised in a task. Cancel remaining tasks and
             # re-raise the exception.
-            for future in not_done:
+            for future in running:
               future.cancel()
-            not_done = []
             raise completed_future.exception()
 
           # The task is completed successfully. Process the result.
-          result, request_task_list = completed_future.result()
+          (result, request_task_list, elapsed_time,
+           shared_index_entries) = completed_future.result()
+          shared_index.merge_entries(shared_index_entries)
+          scheduled_task.duration += elapsed_time
           if request_task_list:
-            # If sub tasks are requested, submit them.
+            # If sub tasks are requested, queue them.
             assert not result
-            not_done.update(
-                executor.submit(_run_task, generator_task)
-                for generator_task in request_task_list)
-            continue
+            scheduled_task.num_pending += len(request_task_list)
+            for generator_task in request_task_list:
+              task_queue.push(_ScheduledTask(generator_task, scheduled_task))
+          _complete_task(scheduled_task, history)
 
           if result:
             result_list.append(result)
+      if main_process_task:
+        # There was no task to run.
+        main_process_task()
     except:
       # An exception is raised. Terminate the running workers.
       if isinstance(executor, concurrent.ProcessPoolExecutor):
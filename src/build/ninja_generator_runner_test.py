@@ -0,0 +1,127 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for ninja_generator_runner.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.build import ninja_generator_runner
+
+# The names of the tasks in the order they ran.
+_task_log = []
+
+
+class _Context(object):
+  def set_up(self):
+    pass
+
+  def tear_down(self):
+    pass
+
+  def make_result(self, ninja_list):
+    return ninja_list
+
+
+def _short_task():
+  _task_log.append('short')
+
+
+def _long_task():
+  _task_log.append('long')
+
+
+def _sub_task():
+  _task_log.append('sub')
+
+
+def _parent_task():
+  _task_log.append('parent')
+  ninja_generator_runner.request_run_in_parallel(_sub_task)
+
+
+def _task_with_arg(name):
+  _task_log.append(name)
+
+
+def _run(task_list, history=None):
+  del _task_log[:]
+  ninja_generator_runner.run_in_parallel(
+      [ninja_generator_runner.GeneratorTask(_Context(), task)
+       for task in task_list], 0, history)
+  return list(_task_log)
+
+
+def _key(task):
+  return '%s.%s' % (task.__module__, task.__name__)
+
+
+class NinjaGeneratorRunnerUnittest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._history_path = os.path.join(self._tmpdir, 'task_durations')
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def testListOrderWithoutHistory(self):
+    self.assertEquals(['short', 'long'], _run([_short_task, _long_task]))
+
+  def testLongestTaskFirst(self):
+    history = ninja_generator_runner.TaskDurationHistory(self._history_path)
+    history.update(_key(_short_task), 1)
+    history.update(_key(_long_task), 10)
+    self.assertEquals(['long', 'short'],
+                      _run([_short_task, _long_task], history))
+
+  def testRequestedTaskFirst(self):
+    history = ninja_generator_runner.TaskDurationHistory(self._history_path)
+    history.update(_key(_parent_task), 10)
+    history.update(_key(_long_task), 5)
+    history.update(_key(_sub_task), 1)
+    self.assertEquals(['parent', 'sub', 'long'],
+                      _run([_long_task, _parent_task], history))
+
+  def testHistory(self):
+    history = ninja_generator_runner.TaskDurationHistory(self._history_path)
+    _run([_parent_task], history)
+    # The duration of the parent task includes its sub task.
+    self.assertGreaterEqual(history.get(_key(_parent_task)),
+                            history.get(_key(_sub_task)))
+    history.save()
+
+    history = ninja_generator_runner.TaskDurationHistory(self._history_path)
+    self.assertIsNotNone(history.get(_key(_sub_task)))
+    self.assertIsNone(history.get(_key(_short_task)))
+
+  def testTaskArgumentsInKey(self):
+    history = ninja_generator_runner.TaskDurationHistory(self._history_path)
+    history.update('%s(%r)' % (_key(_task_with_arg), 'short'), 1)
+    history.update('%s(%r)' % (_key(_task_with_arg), 'long'), 10)
+    self.assertEquals(['long', 'short'],
+                      _run([(_task_with_arg, 'short'),
+                            (_task_with_arg, 'long')], history))
+
+    key = ninja_generator_runner._get_task_key(
+        ninja_generator_runner.GeneratorTask(
+            _Context(), (_task_with_arg, [_Context(), {'b': 2, 'a': 1}])))
+    self.assertEquals(
+        '%s([<%s._Context>, {\'a\': 1, \'b\': 2}])' % (
+            _key(_task_with_arg), __name__),
+        key)
+
+  def testMainProcessTask(self):
+    def _main_process_task():
+      _task_log.append('main')
+    del _task_log[:]
+    ninja_generator_runner.run_in_parallel(
+        [ninja_generator_runner.GeneratorTask(_Context(), _short_task)], 0,
+        main_process_task=_main_process_task)
+    self.assertEquals(['short', 'main'], _task_log)
+
+
+if __name__ == '__main__':
+  unittest.main()
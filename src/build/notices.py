@@ -2,12 +2,110 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-import glob
+import errno
 import os
+import stat
 
 from src.build import build_common
+from src.build import shared_index
 from src.build import staging
 
+# The name of the shared NoticeRootIndex, which is also the name of its file.
+_ROOT_INDEX_NAME = 'notice_roots'
+
+_NOTICE_FILE = 'NOTICE'
+
+_LICENSE_FILE_PREFIX = 'MODULE_LICENSE_'
+
+
+class NoticeRootIndex(shared_index.SharedIndex):
+  """An index of the NOTICE and MODULE_LICENSE_* files in each directory.
+
+  A directory is listed only when its mtime is changed, and stat'ed at most
+  once until refresh() is called. The index is shared by the ninja generators
+  and refreshed once before running them, so that the lookups in the
+  generators are dictionary hits. See shared_index.py.
+  """
+
+  def __init__(self, entries=None):
+    # The entries map a directory path to (mtime, whether it has a NOTICE
+    # file, sorted names of MODULE_LICENSE_* files).
+    super(NoticeRootIndex, self).__init__(entries)
+    self._checked_paths = set()
+    # Maps from (directory path, whether to find a license instead of a
+    # notice) to the directory that contains the file or None if no parent
+    # does.
+    self._parent_cache = {}
+
+  def _get_entry(self, path):
+    if path in self._checked_paths:
+      return self._entries.get(path)
+    self._checked_paths.add(path)
+
+    entry = self._entries.get(path)
+    try:
+      st = os.stat(path)
+    except OSError as e:
+      if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+        raise
+      st = None
+    if st is None or not stat.S_ISDIR(st.st_mode):
+      if entry is not None:
+        self._remove_entry(path)
+      return None
+    if entry is not None and entry[0] == st.st_mtime:
+      return entry
+
+    names = os.listdir(path)
+    entry = (st.st_mtime, _NOTICE_FILE in names,
+             sorted(name for name in names
+                    if name.startswith(_LICENSE_FILE_PREFIX)))
+    self._update_entry(path, entry)
+    return entry
+
+  def _find_parent(self, start_path, find_license):
+    if start_path == '':
+      return None
+    key = (start_path, find_license)
+    if key in self._parent_cache:
+      return self._parent_cache[key]
+    entry = self._get_entry(start_path)
+    if entry is not None and entry[2 if find_license else 1]:
+      result = start_path
+    else:
+      parent = os.path.dirname(start_path)
+      result = (self._find_parent(parent, find_license)
+                if parent != start_path else None)
+    self._parent_cache[key] = result
+    return result
+
+  def find_notice_root(self, start_path):
+    """Returns start_path or its parent which has a NOTICE file, or None."""
+    return self._find_parent(start_path, False)
+
+  def find_license_root(self, start_path):
+    """Returns start_path or its parent which has a license file, or None."""
+    return self._find_parent(start_path, True)
+
+  def get_license_files(self, path):
+    """Returns the sorted names of the MODULE_LICENSE_* files in |path|."""
+    entry = self._get_entry(path)
+    return entry[2] if entry is not None else []
+
+  def refresh(self):
+    """Checks all the indexed directories again, and lists changed ones."""
+    self._checked_paths = set()
+    self._parent_cache = {}
+    for path in self._entries.keys():
+      self._get_entry(path)
+
+
+shared_index.register(_ROOT_INDEX_NAME, NoticeRootIndex)
+
+
+def _get_root_index():
+  return shared_index.get(_ROOT_INDEX_NAME)
+
 
 class Notices(object):
   """Class that keeps track of Android-style notice and license files.
@@ -15,11 +113,12 @@ class Notices(object):
   Notice files are named NOTICE and have the text of notices in them.  These
   notices are required to be shown in the final product for proper compliance.
   License files are named MODULE_LICENSE_* and their existence demarks a
-  directory tree published under the given license."""
+  directory tree published under the given license.
+
+  The files are looked up in the shared NoticeRootIndex."""
+  # Maps from a license root to (the names of its license files, the license
+  # kind classified by them).
   _license_kinds = {}
-  # Maps from (relative directory path, file spec) to path that contains
-  # that file or None if no parent does.
-  _parent_cache = {}
 
   KIND_PUBLIC_DOMAIN = 'public domain'
   KIND_NOTICE = 'notice'
@@ -66,36 +165,18 @@ class Notices(object):
     self._license_roots_examples = {}
     self._notice_roots = set()
 
-  def _find_parent_file(self, start_path, filespec):
-    """Find a file in start_path or a parent matching filespec.
-
-    This function is purposefully not staging aware.  It will only look in
-    the actual file system path provided."""
-    if start_path == '':
-      return None
-    if (start_path, filespec) in self._parent_cache:
-      return self._parent_cache[start_path, filespec]
-    if (('*' in filespec and glob.glob(os.path.join(start_path, filespec))) or
-        os.path.exists(os.path.join(start_path, filespec))):
-      self._parent_cache[start_path, filespec] = start_path
-      return start_path
-    parent_result = self._find_parent_file(os.path.dirname(start_path),
-                                           filespec)
-    self._parent_cache[start_path, filespec] = parent_result
-    return parent_result
-
   def add_sources(self, files):
+    root_index = _get_root_index()
     for f in files:
       if os.path.isabs(f):
         f = os.path.relpath(f, build_common.get_arc_root())
-      notice_root = self._find_parent_file(os.path.dirname(f), 'NOTICE')
+      notice_root = root_index.find_notice_root(os.path.dirname(f))
       if notice_root:
         self._notice_roots.add(notice_root)
       if f in self._PER_FILE_LICENSE_KINDS:
         license_root = f
       else:
-        license_root = self._find_parent_file(os.path.dirname(f),
-                                              'MODULE_LICENSE_*')
+        license_root = root_index.find_license_root(os.path.dirname(f))
       if license_root:
         if license_root not in self._license_roots:
           self._license_roots.add(license_root)
@@ -135,21 +216,23 @@ class Notices(object):
 
   @staticmethod
   def get_license_kind(path):
-    if path not in Notices._license_kinds:
-      license_filenames = glob.glob(os.path.join(path, 'MODULE_LICENSE_*'))
-      most_restrictive = None
-      for license_filename in license_filenames:
-        kind = Notices._get_license_kind_by_path(license_filename)
-        if (not most_restrictive or
-            Notices.is_more_restrictive(kind, most_restrictive)):
-          most_restrictive = kind
-      if path in Notices._PER_FILE_LICENSE_KINDS:
-        Notices._license_kinds[path] = Notices._PER_FILE_LICENSE_KINDS[path]
-      elif most_restrictive is None:
-        Notices._license_kinds[path] = Notices.KIND_DEFAULT
-      else:
-        Notices._license_kinds[path] = most_restrictive
-    return Notices._license_kinds[path]
+    if path in Notices._PER_FILE_LICENSE_KINDS:
+      return Notices._PER_FILE_LICENSE_KINDS[path]
+    license_files = _get_root_index().get_license_files(path)
+    cached = Notices._license_kinds.get(path)
+    if cached is not None and cached[0] == license_files:
+      return cached[1]
+    most_restrictive = None
+    for license_file in license_files:
+      kind = Notices._get_license_kind_by_path(
+          os.path.join(path, license_file))
+      if (not most_restrictive or
+          Notices.is_more_restrictive(kind, most_restrictive)):
+        most_restrictive = kind
+    if most_restrictive is None:
+      most_restrictive = Notices.KIND_DEFAULT
+    Notices._license_kinds[path] = (license_files, most_restrictive)
+    return most_restrictive
 
   def get_most_restrictive_license_kind(self):
     most_restrictive = Notices.KIND_PUBLIC_DOMAIN
@@ -189,6 +272,13 @@ class Notices(object):
   def get_notice_roots(self):
     return self._notice_roots
 
+  def to_dict(self):
+    return {
+        'license_roots': self._license_roots,
+        'license_roots_examples': self._license_roots_examples,
+        'notice_roots': self._notice_roots,
+    }
+
   def get_license_roots(self):
     return self._license_roots
 
@@ -198,7 +288,7 @@ class Notices(object):
   def get_notice_files(self):
     notice_files = set()
     for p in self._notice_roots:
-      notice_file = os.path.join(p, 'NOTICE')
+      notice_file = os.path.join(p, _NOTICE_FILE)
       if os.path.exists(notice_file):
         notice_files.add(notice_file)
     return notice_files
@@ -211,3 +301,11 @@ class Notices(object):
                     (Notices.get_license_kind(r), r,
                      self.get_license_root_example(r)))
     return '\n'.join(output)
+
+
+def notices_from_dict(data):
+  result = Notices()
+  result._license_roots = set(data['license_roots'])
+  result._license_roots_examples = dict(data['license_roots_examples'])
+  result._notice_roots = set(data['notice_roots'])
+  return result
@@ -5,9 +5,14 @@
 """Tests covering notices"""
 
 import os
+import shutil
+import tempfile
 import unittest
 
+import mock
+
 from src.build import notices
+from src.build import shared_index
 
 _PATH_PREFIX = 'src/build/tests/notices'
 
@@ -173,5 +178,92 @@ class TestNotices(unittest.TestCase):
                      notices.Notices.KIND_GPL_LIKE)
 
 
+class TestNoticeRootIndex(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    patcher = mock.patch('os.listdir', wraps=os.listdir)
+    self._listdir = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+    shared_index.reset(notices._ROOT_INDEX_NAME)
+
+  def _touch(self, path):
+    path = os.path.join(self._tmpdir, path)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+  def _set_mtime(self, path, mtime):
+    path = os.path.join(self._tmpdir, path)
+    os.utime(path, (mtime, mtime))
+
+  def test_find_roots(self):
+    self._touch('NOTICE')
+    self._touch('a/MODULE_LICENSE_GPL')
+    self._touch('a/b/c.c')
+    index = notices.NoticeRootIndex()
+    ab = os.path.join(self._tmpdir, 'a', 'b')
+    self.assertEquals(self._tmpdir, index.find_notice_root(ab))
+    self.assertEquals(os.path.join(self._tmpdir, 'a'),
+                      index.find_license_root(ab))
+    self.assertEquals(['MODULE_LICENSE_GPL'],
+                      index.get_license_files(os.path.join(self._tmpdir, 'a')))
+    num_listings = self._listdir.call_count
+    self.assertEquals(self._tmpdir, index.find_notice_root(ab))
+    self.assertEquals(num_listings, self._listdir.call_count)
+
+  def test_refresh(self):
+    self._touch('a/b/c.c')
+    self._set_mtime('a', 100)
+    index = notices.NoticeRootIndex()
+    a = os.path.join(self._tmpdir, 'a')
+    ab = os.path.join(a, 'b')
+    self.assertIsNone(index.find_license_root(ab))
+
+    # The directories are not listed again unless they are changed.
+    index.refresh()
+    num_listings = self._listdir.call_count
+    self.assertIsNone(index.find_license_root(ab))
+    self.assertEquals(num_listings, self._listdir.call_count)
+
+    self._touch('a/MODULE_LICENSE_BSD')
+    self._set_mtime('a', 200)
+    index.refresh()
+    self.assertEquals(num_listings + 1, self._listdir.call_count)
+    self.assertEquals(a, index.find_license_root(ab))
+
+  def test_license_kind(self):
+    self._touch('a/MODULE_LICENSE_BSD')
+    self._set_mtime('a', 100)
+    a = os.path.join(self._tmpdir, 'a')
+    self.assertEquals(notices.Notices.KIND_NOTICE,
+                      notices.Notices.get_license_kind(a))
+
+    self._touch('a/MODULE_LICENSE_GPL')
+    self._set_mtime('a', 200)
+    shared_index.refresh_all()
+    self.assertEquals(notices.Notices.KIND_GPL_LIKE,
+                      notices.Notices.get_license_kind(a))
+
+  def test_merge_and_save(self):
+    cache_dir = os.path.join(self._tmpdir, 'cache')
+    self._touch('a/NOTICE')
+    a = os.path.join(self._tmpdir, 'a')
+    child = notices.NoticeRootIndex()
+    self.assertEquals(a, child.find_notice_root(a))
+    entries = child.pop_new_entries()
+    self.assertEquals({}, child.pop_new_entries())
+
+    shared_index.reset(notices._ROOT_INDEX_NAME)
+    shared_index.merge_entries({notices._ROOT_INDEX_NAME: entries})
+    shared_index.save_all(cache_dir)
+    shared_index.load_all(cache_dir)
+    num_listings = self._listdir.call_count
+    self.assertEquals(a, notices._get_root_index().find_notice_root(a))
+    self.assertEquals(num_listings, self._listdir.call_count)
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,125 @@
+#!src/build/run_python
+
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Reports the perftest results recorded by launch_chrome.
+
+Typical usage:
+
+  $ ./launch_chrome perftest --iterations=20
+  $ src/build/perf_report.py list
+  $ src/build/perf_report.py check
+
+"check" compares the latest run of each setup (the apps, the configure options
+and the host) with the preceding runs of the same setup, and exits with 1 if
+any metric has regressed.
+"""
+
+import argparse
+import datetime
+import sys
+
+from src.build.util import perf_results_store
+from src.build.util import statistics
+
+# Metrics shown by "list", as pairs of the label and the metric name.
+_LIST_METRICS = [
+    ('boot', 'boot_time_ms'),
+    ('pluginLoad', 'plugin_load_time_ms'),
+    ('res', 'app_res_mem'),
+    ('pdirt', 'app_pdirt_mem'),
+]
+
+
+def _format_setup(label, configure_options, host):
+  return '%s on %s (%s)' % (label or '<default>', host, configure_options)
+
+
+def _format_timestamp(timestamp):
+  return datetime.datetime.fromtimestamp(timestamp).strftime(
+      '%Y-%m-%d %H:%M:%S')
+
+
+def _handle_list(store, args):
+  for setup in store.get_setups():
+    print _format_setup(*setup)
+    for run in reversed(store.get_runs(*setup, limit=args.limit)):
+      medians = ' '.join(
+          '%s=%.1f' % (label, statistics.compute_median(
+              run.samples.get(name, [])))
+          for label, name in _LIST_METRICS)
+      print '  #%d %s %s runs=%d %s' % (
+          run.id, _format_timestamp(run.timestamp), run.build_tag,
+          len(run.samples.get('boot_time_ms', [])), medians)
+  return 0
+
+
+def _handle_check(store, args):
+  has_regression = False
+  for setup in store.get_setups():
+    runs = store.get_runs(*setup, limit=args.baseline_runs + 1)
+    if len(runs) < 2:
+      continue
+    latest_run = runs[0]
+    baseline_runs = runs[1:]
+    regressions = perf_results_store.find_regressions(
+        latest_run, baseline_runs, confidence_level=args.confidence_level,
+        significance_level=args.significance_level, threshold=args.threshold)
+    if not regressions:
+      continue
+    has_regression = True
+    print 'Regressions in run #%d (%s) of %s against %d preceding runs:' % (
+        latest_run.id, latest_run.build_tag, _format_setup(*setup),
+        len(baseline_runs))
+    for regression in regressions:
+      print '  %s: %.1f -> %.1f, diffCI=(%+.1f,%+.1f) p=%.3f' % (
+          regression.name, regression.baseline_median, regression.median,
+          regression.diff_lower, regression.diff_upper, regression.p_value)
+  if not has_regression:
+    print 'No regressions found.'
+  return 1 if has_regression else 0
+
+
+def _parse_args(args):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument('--db', default=perf_results_store.get_default_path(),
+                      help='The perftest results database.')
+  subparsers = parser.add_subparsers(title='commands')
+
+  list_parser = subparsers.add_parser(
+      'list', help='List the medians of the recorded runs.')
+  list_parser.add_argument('--limit', type=int, default=10, metavar='<N>',
+                           help='Number of the latest runs to list per setup.')
+  list_parser.set_defaults(entrypoint=_handle_list)
+
+  check_parser = subparsers.add_parser(
+      'check', help='Check the latest runs for regressions.')
+  check_parser.add_argument(
+      '--baseline-runs', type=int, default=10, metavar='<N>',
+      help='Number of the preceding runs used as the baseline.')
+  check_parser.add_argument(
+      '--confidence-level', type=int, default=95, metavar='<%>',
+      help='Confidence level of the confidence intervals.')
+  check_parser.add_argument(
+      '--significance-level', type=float, default=0.05, metavar='<P>',
+      help='Significance level of the Mann-Whitney U test.')
+  check_parser.add_argument(
+      '--threshold', type=float, default=2., metavar='<%>',
+      help=('Minimum regression to report, in percentage of the baseline '
+            'median.'))
+  check_parser.set_defaults(entrypoint=_handle_check)
+
+  return parser.parse_args(args)
+
+
+def main():
+  args = _parse_args(sys.argv[1:])
+  with perf_results_store.PerfResultsStore(args.db) as store:
+    return args.entrypoint(store, args)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
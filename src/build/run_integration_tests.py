@@ -19,7 +19,9 @@ running that test suite.
 
 import argparse
 import collections
+import heapq
 import logging
+import math
 import multiprocessing
 import os
 import subprocess
@@ -27,6 +29,7 @@ import sys
 
 from src.build import build_common
 from src.build import dashboard_submit
+from src.build import dependency_graph
 from src.build.build_options import OPTIONS
 from src.build.cts import expected_driver_times
 from src.build.util import color
@@ -41,6 +44,7 @@ from src.build.util.test import scoreboard_constants
 from src.build.util.test import suite_results
 from src.build.util.test import suite_runner_config
 from src.build.util.test import test_driver
+from src.build.util.test import test_duration_history
 from src.build.util.test import test_filter
 
 _BOT_TEST_SUITE_MAX_RETRY_COUNT = 5
@@ -48,6 +52,17 @@ _DEFINITIONS_ROOT = 'src/integration_tests/definitions'
 _EXPECTATIONS_ROOT = 'src/integration_tests/expectations'
 _TEST_METHOD_MAX_RETRY_COUNT = 5
 
+_TEST_DURATION_HISTORY_PATH = os.path.join(
+    build_common.OUT_DIR, 'integration_test_durations.json')
+
+# Changes in these directories may affect any suite, as they contain the test
+# framework and the suite definitions.
+_ALWAYS_AFFECTING_DIRS = ['src/build', 'src/integration_tests']
+
+# Suites expected to finish in this many seconds are never split into shards,
+# as each shard has its own overhead to prepare and launch Chrome.
+_MIN_SHARD_DURATION = 60
+
 _REPORT_COLOR_FOR_SUITE_EXPECTATION = {
     scoreboard_constants.SKIPPED: color.MAGENTA,
     scoreboard_constants.EXPECTED_FAIL: color.RED,
@@ -59,12 +74,17 @@ _REPORT_COLOR_FOR_SUITE_EXPECTATION = {
 def get_all_suite_runners(on_bot, use_gpu, remote_host_type):
   """Gets all the suites defined in the various config.py files."""
   result = suite_runner_config.load_from_suite_definitions(
-      _DEFINITIONS_ROOT, _EXPECTATIONS_ROOT, on_bot, use_gpu, remote_host_type)
+      _DEFINITIONS_ROOT, _EXPECTATIONS_ROOT, on_bot, use_gpu, remote_host_type,
+      cache_path=suite_runner_config.get_expectations_cache_path(
+          _EXPECTATIONS_ROOT))
 
+  internal_expectations_root = (
+      'out/internal-apks-integration-tests/expectations')
   result += suite_runner_config.load_from_suite_definitions(
       'src/integration_tests/definitions/internal',
-      'out/internal-apks-integration-tests/expectations',
-      on_bot, use_gpu, remote_host_type)
+      internal_expectations_root, on_bot, use_gpu, remote_host_type,
+      cache_path=suite_runner_config.get_expectations_cache_path(
+          internal_expectations_root))
 
   # Check name duplication.
   counter = collections.Counter(runner.name for runner in result)
@@ -104,6 +124,126 @@ def get_dependencies_for_integration_tests():
   return deps
 
 
+def _get_always_affected_prefixes():
+  """Returns the prefixes of the build outputs that all suites depend on."""
+  return [build_common.get_runtime_out_dir() + os.path.sep,
+          build_common.ARC_WELDER_UNPACKED_DIR + os.path.sep]
+
+
+def _select_affected_suite_runners(all_suite_runners, changed_files):
+  """Returns the suite runners which may be affected by |changed_files|.
+
+  The changed files are mapped to the affected build outputs via the dependency
+  graph saved by ./configure, and a suite is affected if it depends on any of
+  them. All suites are selected if the graph is not available, or if any of
+  the changed files is unknown to the graph, e.g. a header file.
+  """
+  graph = dependency_graph.load(dependency_graph.get_graph_file_path())
+  if graph is None:
+    logging.warning('Dependency graph is not available. Run ./configure. '
+                    'Selecting all suites.')
+    return all_suite_runners
+  changed_files = map(os.path.normpath, changed_files)
+  if any(path.startswith(directory + os.path.sep)
+         for path in changed_files for directory in _ALWAYS_AFFECTING_DIRS):
+    return all_suite_runners
+  unknown_paths = graph.get_unknown_paths(changed_files)
+  if unknown_paths:
+    logging.info('Changed files are not in the dependency graph: %s. '
+                 'Selecting all suites.', ', '.join(unknown_paths))
+    return all_suite_runners
+
+  affected_paths = graph.get_affected_paths(changed_files)
+  prefixes = tuple(_get_always_affected_prefixes())
+  if any(path.startswith(prefixes) for path in affected_paths):
+    return all_suite_runners
+
+  result = []
+  for runner in all_suite_runners:
+    dependencies = runner.get_build_dependencies()
+    if dependencies is None or affected_paths.intersection(
+        os.path.normpath(path) for path in dependencies):
+      result.append(runner)
+  return result
+
+
+def _split_tests_into_shards(test_durations, num_shards):
+  """Splits the tests into |num_shards| lists of roughly equal duration.
+
+  |test_durations| is a dict from a test name to its expected duration. Each
+  test, longest first, is assigned to the shard with the least total duration.
+  """
+  shards = [[] for _ in xrange(num_shards)]
+  heap = [(0, index) for index in xrange(num_shards)]
+  for name in sorted(test_durations,
+                     key=lambda name: (-test_durations[name], name)):
+    total, index = heapq.heappop(heap)
+    shards[index].append(name)
+    heapq.heappush(heap, (total + test_durations[name], index))
+  return shards
+
+
+def _create_test_driver(runner, test_expectations, tests_to_run, args):
+  return test_driver.TestDriver(
+      runner, test_expectations, tests_to_run,
+      _TEST_METHOD_MAX_RETRY_COUNT if not args.keep_running else sys.maxint,
+      stop_on_unexpected_failures=not args.keep_running)
+
+
+def _shard_test_drivers(driver_list, args):
+  """Splits long suites into shards, and orders them to run.
+
+  Returns a list of (driver, expected duration) tuples.
+  A suite is split when it is expected to take longer than the total duration
+  divided by the number of jobs, so that a giant suite does not decide the
+  total run time by itself.
+  """
+  history = test_duration_history.TestDurationHistory(
+      _TEST_DURATION_HISTORY_PATH)
+  estimated_list = []
+  for driver, test_expectations in driver_list:
+    test_durations = history.estimate_test_durations(
+        driver.name, driver.tests_to_run,
+        expected_driver_times.get_expected_driver_time(driver))
+    estimated_list.append((driver, test_expectations, test_durations))
+  total_duration = sum(sum(test_durations.itervalues())
+                       for _, _, test_durations in estimated_list)
+  shard_duration = max(float(total_duration) / args.jobs, _MIN_SHARD_DURATION)
+
+  result = []
+  for driver, test_expectations, test_durations in estimated_list:
+    runner = driver.suite_runner
+    duration = sum(test_durations.itervalues())
+    num_shards = min(int(math.ceil(duration / shard_duration)), args.jobs,
+                     len(test_durations))
+    if num_shards <= 1 or not runner.is_shardable():
+      result.append((driver, duration))
+      continue
+
+    # The tests that are selected but not run are reported by the first shard.
+    not_run_tests = set(test_expectations).difference(driver.tests_to_run)
+    for index, shard_tests in enumerate(
+        _split_tests_into_shards(test_durations, num_shards)):
+      shard_test_names = set(shard_tests)
+      if index == 0:
+        shard_test_names.update(not_run_tests)
+      shard_driver = _create_test_driver(
+          runner.create_shard(index, shard_test_names),
+          dict((name, test_expectations[name]) for name in shard_test_names),
+          shard_tests, args)
+      result.append((shard_driver,
+                     sum(test_durations[name] for name in shard_tests)))
+  return result
+
+
+def _record_test_durations(test_driver_list):
+  history = test_duration_history.TestDurationHistory(
+      _TEST_DURATION_HISTORY_PATH)
+  for driver in test_driver_list:
+    history.update(driver.name, driver.scoreboard.get_test_durations())
+  history.save()
+
+
 def _select_tests_to_run(all_suite_runners, args):
   test_list_filter = test_filter.TestListFilter(
       include_pattern_list=args.include_patterns,
@@ -151,24 +291,34 @@ def _select_tests_to_run(all_suite_runners, args):
       continue
 
     # Create TestDriver to run the test suite with setting test expectations.
-    test_driver_list.append(test_driver.TestDriver(
-        runner, updated_suite_test_expectations, tests_to_run,
-        _TEST_METHOD_MAX_RETRY_COUNT if not args.keep_running else sys.maxint,
-        stop_on_unexpected_failures=not args.keep_running))
+    test_driver_list.append((
+        _create_test_driver(runner, updated_suite_test_expectations,
+                            tests_to_run, args),
+        updated_suite_test_expectations))
 
-  def sort_keys(driver):
+  def sort_keys(driver_and_duration):
     # Take the negative time to sort descending, while otherwise sorting by name
-    # ascending.
-    return (-expected_driver_times.get_expected_driver_time(driver),
-            driver.name)
+    # ascending. Running the longest ones first makes the ThreadPoolExecutor
+    # pack them onto the jobs evenly.
+    driver, duration = driver_and_duration
+    return (-duration, driver.name)
 
-  return sorted(test_driver_list, key=sort_keys)
+  return [driver for driver, _ in sorted(
+      _shard_test_drivers(test_driver_list, args), key=sort_keys)]
 
 
-def _get_test_driver_list(args):
+def _get_suite_runners(args):
+  """Returns all the suite runners, or those affected by --changed-files."""
   all_suite_runners = get_all_suite_runners(
       args.buildbot, not args.use_xvfb, args.remote_host_type)
-  return _select_tests_to_run(all_suite_runners, args)
+  if args.changed_files is not None:
+    all_suite_runners = _select_affected_suite_runners(
+        all_suite_runners, args.changed_files)
+  return all_suite_runners
+
+
+def _get_test_driver_list(args):
+  return _select_tests_to_run(_get_suite_runners(args), args)
 
 
 def _run_driver(driver, args, prepare_only):
@@ -266,8 +416,7 @@ def prepare_suites(args):
 
 
 def pretty_print_tests(args):
-  all_suite_runners = get_all_suite_runners(
-      args.buildbot, not args.use_xvfb, args.remote_host_type)
+  all_suite_runners = _get_suite_runners(args)
   test_list_filter = test_filter.TestListFilter(
       include_pattern_list=args.include_patterns,
       exclude_pattern_list=args.exclude_patterns)
@@ -328,6 +477,11 @@ def parse_args(args):
                       help='Color output using ansi escape sequence')
   parser.add_argument('--cts-bot', action='store_true',
                       help='Run with CTS bot specific config.')
+  parser.add_argument('--changed-files', nargs='*', metavar='PATH',
+                      help=('Run only the suites which may be affected by '
+                            'these changed files. For example, '
+                            '--changed-files $(git diff --name-only '
+                            'origin/master)'))
   parser.add_argument('--enable-osmesa', action='store_true',
                       help=('This flag wlll be passed to launch_chome '
                             'to control GL emulation with OSMesa.'))
@@ -448,6 +602,7 @@ def _run_suites_and_output_results_remote(args, raw_args):
 def _run_suites_and_output_results_local(test_driver_list, args):
   """Runs integration tests locally and returns the status code on exit."""
   run_result = _run_suites(test_driver_list, args)
+  _record_test_durations(test_driver_list)
   test_failed, passed, total = suite_results.summarize(args.output_dir)
 
   if args.cts_bot:
@@ -25,6 +25,7 @@ import unittest
 
 import mock
 
+from src.build import dependency_graph
 from src.build import run_integration_tests
 from src.build.build_options import OPTIONS
 from src.build.util.test import flags
@@ -595,5 +596,59 @@ class RunIntegrationTestsFastTest(_RunIntegrationTestsTestBase):
     self.assertOutputListDoesNotListTest(
         self.EXAMPLE_SUITE_NAME, self.EXAMPLE_TEST_NAME2)
 
+
+class SplitTestsIntoShardsTest(unittest.TestCase):
+  def test_split_evenly(self):
+    shards = run_integration_tests._split_tests_into_shards(
+        {'a': 5, 'b': 4, 'c': 3, 'd': 3, 'e': 1}, 2)
+    self.assertEquals([['a', 'd'], ['b', 'c', 'e']], shards)
+
+  def test_more_shards_than_tests(self):
+    shards = run_integration_tests._split_tests_into_shards({'a': 1}, 2)
+    self.assertEquals([['a'], []], shards)
+
+
+class _FakeSuiteRunner(object):
+  def __init__(self, build_dependencies):
+    self._build_dependencies = build_dependencies
+
+  def get_build_dependencies(self):
+    return self._build_dependencies
+
+
+class SelectAffectedSuiteRunnersTest(unittest.TestCase):
+  def setUp(self):
+    graph = dependency_graph.DependencyGraph({
+        'src/foo/Foo.java': ['out/Foo.apk'],
+        'src/bar/Bar.java': ['out/Bar.apk'],
+    })
+    patcher = mock.patch(
+        'src.build.dependency_graph.load', return_value=graph)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self._foo = _FakeSuiteRunner(['out/Foo.apk'])
+    self._bar = _FakeSuiteRunner(['out/Bar.apk'])
+    self._unknown = _FakeSuiteRunner(None)
+
+  def _select(self, changed_files):
+    return run_integration_tests._select_affected_suite_runners(
+        [self._foo, self._bar, self._unknown], changed_files)
+
+  def test_select_affected_suites(self):
+    self.assertEquals([self._foo, self._unknown],
+                      self._select(['src/foo/Foo.java']))
+
+  def test_unknown_file_affects_all_suites(self):
+    # Headers are found via depfiles and are not in the dependency graph.
+    self.assertEquals([self._foo, self._bar, self._unknown],
+                      self._select(['src/foo/foo.h']))
+    self.assertEquals([self._foo, self._bar, self._unknown],
+                      self._select(['src/foo/Foo.java', 'docs/README']))
+
+  def test_test_framework_change_affects_all_suites(self):
+    self.assertEquals([self._foo, self._bar, self._unknown],
+                      self._select(['src/build/run_integration_tests.py']))
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,162 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Indexes of the file system shared by the ninja generators.
+
+An index maps a path to an entry computed from the file system, e.g. the
+tracking path of a source file, so that the file is read again only when it is
+changed. Each index is registered here with a name, and one instance of it is
+shared by all the ninja generators:
+
+- config_runner loads all the indexes from the config cache directory, and
+  refreshes them at once in the main process before running the generators.
+- ninja_generator_runner sends the entries added or removed in its
+  subprocesses back to the main process with pop_new_entries() and
+  merge_entries(). The main process pops the entries updated by the refresh
+  before forking the subprocesses, so that they are not sent back again.
+- config_runner saves the updated indexes after the ninja files are generated.
+"""
+
+import errno
+import marshal
+import os
+
+from src.build.util import file_util
+
+# A map from the name of a registered index to its class.
+_index_classes = {}
+
+# A map from the name of a registered index to its shared instance.
+_indexes = {}
+
+
+class SharedIndex(object):
+  """The base class of the indexes.
+
+  Subclasses add or update an entry with _update_entry(), and implement
+  refresh(). The entries must be marshal-able.
+  """
+
+  # Subclasses increment this when the format of the entries is changed.
+  VERSION = 0
+
+  def __init__(self, entries=None):
+    # A map from a path to its entry.
+    self._entries = {} if entries is None else entries
+    # The entries added or updated since the last pop_new_entries(). The entry
+    # of a removed path is None.
+    self._new_entries = {}
+    self.is_updated = False
+
+  def _update_entry(self, path, entry):
+    self._entries[path] = entry
+    self._new_entries[path] = entry
+    self.is_updated = True
+
+  def _remove_entry(self, path):
+    del self._entries[path]
+    self._new_entries[path] = None
+    self.is_updated = True
+
+  def refresh(self):
+    """Updates the entries of the paths changed since they were added."""
+    raise NotImplementedError()
+
+  def pop_new_entries(self):
+    """Returns the entries updated since the last call, and forgets them.
+
+    The entry of a path removed from the index is None.
+    """
+    new_entries = self._new_entries
+    self._new_entries = {}
+    return new_entries
+
+  def merge_entries(self, entries):
+    """Merges the entries returned by pop_new_entries() in another process."""
+    for path, entry in entries.iteritems():
+      if entry is None:
+        if self._entries.pop(path, None) is not None:
+          self.is_updated = True
+      elif self._entries.get(path) != entry:
+        self._entries[path] = entry
+        self.is_updated = True
+
+  def to_dict(self):
+    return {
+        'version': self.VERSION,
+        'entries': self._entries,
+    }
+
+  @classmethod
+  def load(cls, file_path):
+    """Returns the index persisted in |file_path|, or an empty index."""
+    try:
+      with open(file_path, 'rb') as f:
+        data = marshal.load(f)
+    except (EOFError, ValueError, TypeError):
+      return cls()
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return cls()
+      raise
+    if data.get('version') != cls.VERSION:
+      return cls()
+    return cls(data['entries'])
+
+  def save(self, file_path):
+    """Saves the index to |file_path| if it is updated."""
+    if not self.is_updated:
+      return
+    data = self.to_dict()
+    file_util.makedirs_safely(os.path.dirname(file_path))
+    file_util.generate_file_atomically(file_path,
+                                       lambda f: marshal.dump(data, f))
+    self.is_updated = False
+
+
+def register(name, index_class):
+  """Registers |index_class| as a shared index persisted as |name|."""
+  assert name not in _index_classes, '%s is already registered' % name
+  _index_classes[name] = index_class
+  _indexes[name] = index_class()
+
+
+def get(name):
+  """Returns the shared instance of the index registered as |name|."""
+  return _indexes[name]
+
+
+def reset(name):
+  """Starts a new empty shared instance of the index registered as |name|."""
+  _indexes[name] = _index_classes[name]()
+
+
+def load_all(directory):
+  """Loads all the shared indexes persisted in |directory|."""
+  for name, index_class in _index_classes.iteritems():
+    _indexes[name] = index_class.load(os.path.join(directory, name))
+
+
+def save_all(directory):
+  """Saves all the updated shared indexes to |directory|."""
+  for name, index in _indexes.iteritems():
+    index.save(os.path.join(directory, name))
+
+
+def refresh_all():
+  """Refreshes all the shared indexes."""
+  for index in _indexes.itervalues():
+    index.refresh()
+
+
+def pop_new_entries():
+  """Returns the entries updated in the shared indexes in this process."""
+  return dict((name, index.pop_new_entries())
+              for name, index in _indexes.iteritems())
+
+
+def merge_entries(entries):
+  """Merges the entries returned by pop_new_entries() in another process."""
+  for name, index_entries in entries.iteritems():
+    _indexes[name].merge_entries(index_entries)
@@ -0,0 +1,119 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for shared_index.py."""
+
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from src.build import shared_index
+
+
+class _SizeIndex(shared_index.SharedIndex):
+  """An index from a path to its size."""
+
+  def get_size(self, path):
+    if path not in self._entries:
+      self._update_entry(path, os.path.getsize(path))
+    return self._entries[path]
+
+  def refresh(self):
+    for path in self._entries.keys():
+      if not os.path.exists(path):
+        self._remove_entry(path)
+      elif os.path.getsize(path) != self._entries[path]:
+        self._update_entry(path, os.path.getsize(path))
+
+
+class SharedIndexTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._cache_dir = os.path.join(self._tmpdir, 'cache')
+    self._foo = self._write('foo', 'foo')
+    for name in ('_index_classes', '_indexes'):
+      patcher = mock.patch.dict(getattr(shared_index, name), clear=True)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    shared_index.register('sizes', _SizeIndex)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def _write(self, name, content):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    return path
+
+  def test_pop_and_merge_entries(self):
+    child = _SizeIndex()
+    child.get_size(self._foo)
+    entries = child.pop_new_entries()
+    self.assertEquals({self._foo: 3}, entries)
+    self.assertEquals({}, child.pop_new_entries())
+
+    parent = _SizeIndex()
+    parent.merge_entries(entries)
+    self.assertTrue(parent.is_updated)
+    self.assertEquals({self._foo: 3}, parent.to_dict()['entries'])
+
+  def test_merge_removed_entries(self):
+    parent = _SizeIndex({self._foo: 3})
+    child = _SizeIndex({self._foo: 3})
+    os.remove(self._foo)
+    child.refresh()
+    entries = child.pop_new_entries()
+    self.assertEquals({self._foo: None}, entries)
+
+    parent.merge_entries(entries)
+    self.assertTrue(parent.is_updated)
+    self.assertEquals({}, parent.to_dict()['entries'])
+
+  def test_save_and_load(self):
+    path = os.path.join(self._cache_dir, 'sizes')
+    index = _SizeIndex.load(path)
+    self.assertFalse(index.is_updated)
+    index.get_size(self._foo)
+    index.save(path)
+    self.assertFalse(index.is_updated)
+    self.assertEquals({self._foo: 3},
+                      _SizeIndex.load(path).to_dict()['entries'])
+
+    with mock.patch.object(_SizeIndex, 'VERSION', 1):
+      self.assertEquals({}, _SizeIndex.load(path).to_dict()['entries'])
+
+    with open(path, 'w') as f:
+      f.write('broken')
+    self.assertEquals({}, _SizeIndex.load(path).to_dict()['entries'])
+
+  def test_shared_instances(self):
+    shared_index.get('sizes').get_size(self._foo)
+    shared_index.save_all(self._cache_dir)
+    with open(os.path.join(self._cache_dir, 'sizes'), 'rb') as f:
+      self.assertEquals({self._foo: 3}, marshal.load(f)['entries'])
+
+    shared_index.reset('sizes')
+    self.assertEquals({}, shared_index.get('sizes').to_dict()['entries'])
+    shared_index.load_all(self._cache_dir)
+    self.assertEquals({self._foo: 3},
+                      shared_index.get('sizes').to_dict()['entries'])
+
+    self._write('foo', 'foobar')
+    shared_index.refresh_all()
+    entries = shared_index.pop_new_entries()
+    self.assertEquals({'sizes': {self._foo: 6}}, entries)
+
+    shared_index.reset('sizes')
+    shared_index.merge_entries(entries)
+    self.assertEquals({self._foo: 6},
+                      shared_index.get('sizes').to_dict()['entries'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -14,6 +14,8 @@ Code to create out/staging of properly overlaid files.  All files are created
 as symlinks.
 """
 
+import errno
+import marshal
 import os
 import subprocess
 import sys
@@ -28,6 +30,7 @@ _MODS_DIR = 'mods'
 _THIRD_PARTY_DIR = 'third_party'
 _INTERNAL_MODS_PATH = 'internal/mods'
 _INTERNAL_THIRD_PARTY_PATH = 'internal/third_party'
+_MANIFEST_VERSION = 0
 
 TESTS_BASE_PATH = 'src/build/tests/analyze_diffs'
 TESTS_MODS_PATH = os.path.join(TESTS_BASE_PATH, 'mods')
@@ -116,16 +119,55 @@ def third_party_to_staging(path):
   return path
 
 
-def _create_symlink(src_path, dest_dir):
-  """Creates a symlink pointing to src_path in dest_dir with the same name."""
-  os.symlink(os.path.relpath(src_path, dest_dir),
-             os.path.join(dest_dir, os.path.basename(src_path)))
+class _DirectoryLister(object):
+  """Lists directories, reusing the previous result when mtime is unchanged.
 
+  A directory's mtime changes whenever an entry is added, removed or renamed in
+  it, so an unchanged mtime means the same listing as in the previous run.
+  """
 
-def _create_overlay_base(base_dir, overlays, dest_dir):
-  """Creates symlinks to files and directories in base_dir.
-
-  This is a helper of _create_symlink_tree(). it creates symlinks to files and
+  def __init__(self, cache=None):
+    self._cache = {} if cache is None else cache
+    self._new_cache = {}
+
+  def list(self, path):
+    """Returns (dirs, fnames, walk_dirs) of |path|, or None if it is missing.
+
+    |dirs| and |fnames| are classified as os.walk does, and |walk_dirs| is the
+    subset of |dirs| that os.walk recurses into (i.e. not symbolic links).
+    """
+    try:
+      mtime = os.stat(path).st_mtime
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        raise
+      return None
+    entry = self._cache.get(path)
+    if entry is None or entry[0] != mtime:
+      dirs = []
+      fnames = []
+      walk_dirs = []
+      for name in os.listdir(path):
+        child = os.path.join(path, name)
+        if os.path.isdir(child):
+          dirs.append(name)
+          if not os.path.islink(child):
+            walk_dirs.append(name)
+        else:
+          fnames.append(name)
+      entry = (mtime, dirs, fnames, walk_dirs)
+    self._new_cache[path] = entry
+    return entry[1:]
+
+  def get_cache(self):
+    """Returns the listings used in this run, to be passed to the next run."""
+    return self._new_cache
+
+
+def _collect_overlay_base(lister, base_dir, overlays, dest_dir, links):
+  """Collects symlinks to files and directories in base_dir.
+
+  This is a helper of _collect_symlink_tree(). it adds symlinks to files and
   directories in base_dir, except ones in overlays, into dest_dir.
   "overlays" is a list of file and directory basenames in the overlay directory
   corresponding to the given base_dir.
@@ -151,24 +193,29 @@ def _create_overlay_base(base_dir, overlays, dest_dir):
 
   # If there is no directory at base_dir, it means a new directory is
   # introduced under the corresponding path in mods_root of
-  # _create_symlink_tree(). Skip it.
-  if not os.path.lexists(base_dir):
+  # _collect_symlink_tree(). Skip it.
+  listing = lister.list(base_dir)
+  if listing is None:
     return
 
-  for name in os.listdir(base_dir):
+  dirs, fnames, _ = listing
+  for name in dirs + fnames:
     if not relevant(name):
       continue
     if name == _GIT_DIR or name in overlays:
       continue
-    _create_symlink(os.path.join(base_dir, name), dest_dir)
+    links[os.path.join(dest_dir, name)] = os.path.relpath(
+        os.path.join(base_dir, name), dest_dir)
 
 
-def _create_symlink_tree(mods_root, third_party_root, staging_root):
-  """Creates a symlink tree of mods_root overlaid on third_party_root.
+def _collect_symlink_tree(lister, mods_root, third_party_root, staging_root,
+                          links, dirs):
+  """Collects a symlink tree of mods_root overlaid on third_party_root.
 
-  This method creates the symlink tree of mods_root directory (working as
+  This method computes the symlink tree of mods_root directory (working as
   same as recursive copy, but all files are symlinked instead of actual file
-  copy).
+  copy). Directories to be created are added to |dirs|, and symlinks to be
+  created are added to |links| as a map from the link path to its target.
 
   If third_party_root is given, each created directory is overlaid on the
   corresponding directory in third_party_root (if exists).
@@ -178,33 +225,36 @@ def _create_symlink_tree(mods_root, third_party_root, staging_root):
   will be created at out/staging/android/..., with overlaying
   third_party/android/...
   """
-  staging_root_parent = os.path.dirname(staging_root)
-  file_util.makedirs_safely(staging_root_parent)
-
   if os.path.exists('mods/chromium-ppapi/base'):
-    # See comments in _create_overlay_base.
+    # See comments in _collect_overlay_base.
     raise Exception('Putting headers in mods/chromium-ppapi/base will '
                     'cause code in chromium_org libbase implementation to '
                     'include headers from chromium-ppapi libbase and will '
                     'result in compilation errors or worse.')
 
-  for dirpath, dirs, fnames in os.walk(mods_root):
+  pending = [mods_root]
+  while pending:
+    dirpath = pending.pop()
+    listing = lister.list(dirpath)
+    if listing is None:
+      continue
+    subdirs, fnames, walk_dirs = listing
     # Do not track .git directory.
-    if _GIT_DIR in dirs:
-      dirs.remove(_GIT_DIR)
+    subdirs = [name for name in subdirs if name != _GIT_DIR]
+    pending.extend(os.path.join(dirpath, name) for name in walk_dirs
+                   if name != _GIT_DIR)
 
     relpath = os.path.relpath(dirpath, mods_root)
     dest_dir = os.path.normpath(os.path.join(staging_root, relpath))
-    if not os.path.exists(dest_dir):
-      os.mkdir(dest_dir)
+    dirs.add(dest_dir)
 
-    # Create symlinks for files.
     for name in fnames:
-      _create_symlink(os.path.join(dirpath, name), dest_dir)
+      links[os.path.join(dest_dir, name)] = os.path.relpath(
+          os.path.join(dirpath, name), dest_dir)
 
     if third_party_root:
-      _create_overlay_base(
-          os.path.join(third_party_root, relpath), dirs + fnames, dest_dir)
+      _collect_overlay_base(lister, os.path.join(third_party_root, relpath),
+                            subdirs + fnames, dest_dir, links)
 
 
 def _get_link_targets(root):
@@ -219,40 +269,155 @@ def _get_link_targets(root):
   return link_target_map
 
 
-def create_staging():
-  timer = build_common.SimpleTimer()
-  timer.start('Staging source files', True)
+def _get_manifest_path():
+  return os.path.join(build_common.OUT_DIR, 'staging.manifest')
+
+
+def _load_manifest():
+  """Loads the state of the staging tree saved by the previous run."""
+  try:
+    with open(_get_manifest_path()) as f:
+      data = marshal.load(f)
+  except (EOFError, ValueError, TypeError):
+    return None
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+  if data.get('version') != _MANIFEST_VERSION:
+    return None
+  return data
+
+
+def _save_manifest(links, dirs, listings):
+  data = {
+      'version': _MANIFEST_VERSION,
+      'links': links,
+      'dirs': list(dirs),
+      'listings': listings,
+  }
+  file_util.makedirs_safely(os.path.dirname(_get_manifest_path()))
+  file_util.generate_file_atomically(_get_manifest_path(),
+                                     lambda f: marshal.dump(data, f))
+
+
+def _update_staging_tree(old_links, old_dirs, new_links, new_dirs):
+  """Applies the difference between the old and new staging trees."""
+  # Remove directories no longer needed with their contents first. Sorting
+  # makes parents visited first, so removed children are just skipped.
+  for path in sorted(old_dirs - new_dirs):
+    if os.path.lexists(path):
+      file_util.rmtree(path)
+  for path, target in old_links.iteritems():
+    if new_links.get(path) != target and os.path.islink(path):
+      os.unlink(path)
+
+  for path in sorted(new_dirs - old_dirs):
+    file_util.makedirs_safely(path)
+  for path, target in new_links.iteritems():
+    if old_links.get(path) != target:
+      if os.path.lexists(path):
+        file_util.rmtree(path)
+      os.symlink(target, path)
 
-  staging_root = build_common.get_staging_root()
+
+def _create_symlink_tree(mods_root, third_party_root, staging_root):
+  """Creates the symlink tree collected by _collect_symlink_tree()."""
+  links = {}
+  dirs = set()
+  _collect_symlink_tree(_DirectoryLister(), mods_root, third_party_root,
+                        staging_root, links, dirs)
+  _update_staging_tree({}, set(), links, dirs)
+
+
+def _recreate_staging_with_internal(staging_root):
+  """Recreates the whole staging tree including internal/ checkout.
+
+  internal/build/fix_staging.py rewrites the tree behind the manifest, so the
+  tree is always rebuilt from scratch in this case.
+  Returns the old and new maps from a link path to its target.
+  """
+  assert build_common.has_internal_checkout()
 
   # Store where all the old staging links pointed so we can compare after.
   old_staging_links = _get_link_targets(staging_root)
 
   if os.path.lexists(staging_root):
     file_util.rmtree(staging_root)
+  file_util.remove_file_force(_get_manifest_path())
 
   _create_symlink_tree(_MODS_DIR, _THIRD_PARTY_DIR, staging_root)
 
-  # internal/ is an optional checkout
-  if build_options.OPTIONS.internal_apks_source_is_internal():
-    assert build_common.has_internal_checkout()
-    for name in os.listdir(_INTERNAL_THIRD_PARTY_PATH):
-      if os.path.exists(os.path.join(_THIRD_PARTY_DIR, name)):
-        raise Exception('Name conflict between internal/third_party and '
-                        'third_party: ' + name)
-    _create_symlink_tree(_INTERNAL_MODS_PATH, _INTERNAL_THIRD_PARTY_PATH,
-                         staging_root)
-    subprocess.check_call('internal/build/fix_staging.py')
+  for name in os.listdir(_INTERNAL_THIRD_PARTY_PATH):
+    if os.path.exists(os.path.join(_THIRD_PARTY_DIR, name)):
+      raise Exception('Name conflict between internal/third_party and '
+                      'third_party: ' + name)
+  _create_symlink_tree(_INTERNAL_MODS_PATH, _INTERNAL_THIRD_PARTY_PATH,
+                       staging_root)
+  subprocess.check_call('internal/build/fix_staging.py')
 
   # src/ is not overlaid on any directory.
   _create_symlink_tree(_SRC_DIR, None, os.path.join(staging_root, 'src'))
 
+  return old_staging_links, _get_link_targets(staging_root)
+
+
+def _update_staging(staging_root):
+  """Updates the staging tree to match mods/, third_party/ and src/.
+
+  If the manifest of the previous run is available, only the entries that
+  changed are created, removed or retargeted. Otherwise the tree is rebuilt.
+  Returns the old and new maps from a link path to its target.
+  """
+  manifest = None
+  if os.path.isdir(staging_root):
+    manifest = _load_manifest()
+  # Remove the manifest while the tree is being updated, so that an
+  # interrupted run falls back to rebuilding the tree next time.
+  file_util.remove_file_force(_get_manifest_path())
+
+  lister = _DirectoryLister(manifest['listings'] if manifest else None)
+  new_staging_links = {}
+  new_dirs = set()
+  _collect_symlink_tree(lister, _MODS_DIR, _THIRD_PARTY_DIR, staging_root,
+                        new_staging_links, new_dirs)
+  # src/ is not overlaid on any directory.
+  _collect_symlink_tree(lister, _SRC_DIR, None,
+                        os.path.join(staging_root, 'src'),
+                        new_staging_links, new_dirs)
+
+  if manifest is not None:
+    old_staging_links = manifest['links']
+    _update_staging_tree(old_staging_links, set(manifest['dirs']),
+                         new_staging_links, new_dirs)
+  else:
+    # Store where all the old staging links pointed so we can compare after.
+    old_staging_links = _get_link_targets(staging_root)
+    if os.path.lexists(staging_root):
+      file_util.rmtree(staging_root)
+    _update_staging_tree({}, set(), new_staging_links, new_dirs)
+
+  _save_manifest(new_staging_links, new_dirs, lister.get_cache())
+  return old_staging_links, new_staging_links
+
+
+def create_staging():
+  timer = build_common.SimpleTimer()
+  timer.start('Staging source files', True)
+
+  staging_root = build_common.get_staging_root()
+
+  # internal/ is an optional checkout
+  if build_options.OPTIONS.internal_apks_source_is_internal():
+    old_staging_links, new_staging_links = (
+        _recreate_staging_with_internal(staging_root))
+  else:
+    old_staging_links, new_staging_links = _update_staging(staging_root)
+
   # Update modification time for files that do not point to the same location
   # that they pointed to in the previous tree to make sure they are built.
 
   if old_staging_links:
-    new_staging_links = _get_link_targets(staging_root)
-
     # Every file (not directory) under staging is in either one of following
     # two states:
     #
@@ -275,17 +440,16 @@ def create_staging():
     # staging. For this purpose we can iterate through |*_staging_links| as
     # they contain all files in state F.
     #
-    # Note that |*_staging_links| may contain directory symbolic links, but
-    # it is okay to visit them too because directory timestamps do not matter.
-    # Actually excluding directory symbolic links from |old_staging_links| is
-    # difficult because link targets might be already removed.
+    # Note that |*_staging_links| may contain directory symbolic links. They
+    # are skipped as directory timestamps do not matter, and touching them
+    # would invalidate the directory listings cached in the manifest.
 
     for path in set(list(old_staging_links) + list(new_staging_links)):
       if path in old_staging_links and path in new_staging_links:
         should_touch = old_staging_links[path] != new_staging_links[path]
       else:
         should_touch = True
-      if should_touch and os.path.exists(path):
+      if should_touch and os.path.isfile(path):
         os.utime(path, None)
 
   timer.done()
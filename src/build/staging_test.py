@@ -4,6 +4,9 @@
 
 """Tests for staging."""
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from src.build import staging
@@ -67,5 +70,68 @@ class StagingTest(unittest.TestCase):
     self.assertEquals('mods/foo/bar', mods)
 
 
+def _touch(path):
+  if not os.path.exists(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  open(path, 'w').close()
+
+
+class IncrementalStagingTest(unittest.TestCase):
+  def setUp(self):
+    self._cwd = os.getcwd()
+    self._tmpdir = tempfile.mkdtemp()
+    os.chdir(self._tmpdir)
+    _touch('third_party/android/NOTICE')
+    _touch('third_party/android/bionic/libc.c')
+    _touch('mods/android/bionic/libm.c')
+    _touch('src/common/foo.cc')
+
+  def tearDown(self):
+    os.chdir(self._cwd)
+    shutil.rmtree(self._tmpdir)
+
+  def _update(self):
+    _, new_links = staging._update_staging('out/staging')
+    # The manifest also has symlinks to directories, which os.walk() does not
+    # list as files.
+    for path, target in staging._get_link_targets('out/staging').iteritems():
+      self.assertEquals(target, new_links[path])
+
+  def test_create(self):
+    self._update()
+    self.assertTrue(os.path.isfile('out/staging/android/NOTICE'))
+    self.assertTrue(os.path.islink('out/staging/android/bionic/libc.c'))
+    self.assertTrue(os.path.islink('out/staging/android/bionic/libm.c'))
+    self.assertTrue(os.path.islink('out/staging/src/common/foo.cc'))
+
+  def test_update(self):
+    self._update()
+    _touch('mods/android/NOTICE')
+    _touch('mods/android/external/libz/zlib.c')
+    _touch('third_party/android/external/libpng/png.c')
+    os.remove('mods/android/bionic/libm.c')
+    self._update()
+    self.assertEquals('../../../mods/android/NOTICE',
+                      os.readlink('out/staging/android/NOTICE'))
+    self.assertTrue(os.path.islink('out/staging/android/external/libz/zlib.c'))
+    self.assertTrue(os.path.isfile('out/staging/android/external/libpng/png.c'))
+    self.assertFalse(os.path.lexists('out/staging/android/bionic/libm.c'))
+
+    # The directory overlaid by mods/ is replaced with a symlink when the
+    # mods/ directory is removed.
+    shutil.rmtree('mods/android/bionic')
+    self._update()
+    self.assertTrue(os.path.islink('out/staging/android/bionic'))
+    self.assertTrue(os.path.isfile('out/staging/android/bionic/libc.c'))
+
+  def test_update_without_manifest(self):
+    self._update()
+    os.remove(staging._get_manifest_path())
+    _touch('mods/android/NOTICE')
+    self._update()
+    self.assertEquals('../../../mods/android/NOTICE',
+                      os.readlink('out/staging/android/NOTICE'))
+
+
 if __name__ == '__main__':
   unittest.main()
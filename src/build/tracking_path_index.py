@@ -0,0 +1,93 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""An index of the tracking paths of source files shared across configure runs.
+
+NinjaGenerator.add_notice_sources() needs the tracking path of every input
+file, which is found by reading the first lines of the file. The index records
+the tracking path of each file with its mtime and size, so that the file is
+read again only when it is changed.
+
+The index is shared by the ninja generators. See shared_index.py.
+"""
+
+import errno
+import os
+
+from src.build import analyze_diffs
+from src.build import shared_index
+from src.build.util import concurrent
+
+# The name of the shared index, which is also the name of its file.
+_INDEX_NAME = 'tracking_paths'
+
+_NUM_SCAN_THREADS = 16
+
+
+def _stat_or_none(path):
+  try:
+    return os.stat(path)
+  except OSError as e:
+    if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+      raise
+    return None
+
+
+def _scan_tracking_path(path):
+  """Returns the tracking path of |path| without checking its existence."""
+  with open(path) as f:
+    return analyze_diffs.compute_tracking_path(None, path, f,
+                                               check_exist=False)
+
+
+class TrackingPathIndex(shared_index.SharedIndex):
+  """An index from a path to (mtime, size, tracking path or None)."""
+
+  def get_tracking_path(self, path):
+    """Returns the existing tracking path of |path|, or None.
+
+    |path| is read only when it is not in the index or it has been changed.
+    None is returned also when |path| does not exist.
+    """
+    st = _stat_or_none(path)
+    if st is None:
+      return None
+    entry = self._entries.get(path)
+    if entry is None or entry[:2] != (st.st_mtime, st.st_size):
+      entry = (st.st_mtime, st.st_size, _scan_tracking_path(path))
+      self._update_entry(path, entry)
+    tracking_path = entry[2]
+    if not tracking_path or not os.path.exists(tracking_path):
+      return None
+    return tracking_path
+
+  def refresh(self):
+    """Re-scans the changed files, and drops the removed files.
+
+    Files are scanned in threads, as most of the time is spent in I/O.
+    """
+    changed = []
+    for path, entry in self._entries.items():
+      st = _stat_or_none(path)
+      if st is None:
+        self._remove_entry(path)
+      elif entry[:2] != (st.st_mtime, st.st_size):
+        changed.append((path, st))
+    if not changed:
+      return
+
+    with concurrent.ThreadPoolExecutor(min(_NUM_SCAN_THREADS, len(changed)),
+                                       daemon=True) as executor:
+      future_list = [executor.submit(_scan_tracking_path, path)
+                     for path, _ in changed]
+    for (path, st), future in zip(changed, future_list):
+      self._update_entry(path, (st.st_mtime, st.st_size, future.result()))
+
+
+shared_index.register(_INDEX_NAME, TrackingPathIndex)
+
+
+def get_tracking_path(path):
+  """Returns the tracking path of |path| using the shared index."""
+  return shared_index.get(_INDEX_NAME).get_tracking_path(path)
@@ -0,0 +1,105 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for tracking_path_index.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from src.build import shared_index
+from src.build import tracking_path_index
+
+
+class TrackingPathIndexTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._upstream = self._write('upstream', 'upstream')
+    patcher = mock.patch.object(tracking_path_index, '_scan_tracking_path',
+                                wraps=tracking_path_index._scan_tracking_path)
+    self._scan = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+    shared_index.reset(tracking_path_index._INDEX_NAME)
+
+  def _write(self, name, content, mtime=100):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    os.utime(path, (mtime, mtime))
+    return path
+
+  def _write_tracking(self, name, mtime=100):
+    return self._write(name, '// ARC MOD TRACK "%s"\n' % self._upstream,
+                       mtime=mtime)
+
+  def test_get_tracking_path(self):
+    index = tracking_path_index.TrackingPathIndex()
+    tracking = self._write_tracking('tracking')
+    plain = self._write('plain', 'int x;\n')
+    self.assertEquals(self._upstream, index.get_tracking_path(tracking))
+    self.assertIsNone(index.get_tracking_path(plain))
+    self.assertIsNone(
+        index.get_tracking_path(os.path.join(self._tmpdir, 'missing')))
+    self.assertEquals(2, self._scan.call_count)
+
+    # Unchanged files are not read again.
+    self.assertEquals(self._upstream, index.get_tracking_path(tracking))
+    self.assertIsNone(index.get_tracking_path(plain))
+    self.assertEquals(2, self._scan.call_count)
+
+    # The existence of the tracking path is checked on every lookup.
+    os.remove(self._upstream)
+    self.assertIsNone(index.get_tracking_path(tracking))
+    self.assertEquals(2, self._scan.call_count)
+
+    self._write('plain', 'int x;\n', mtime=200)
+    self.assertIsNone(index.get_tracking_path(plain))
+    self.assertEquals(3, self._scan.call_count)
+
+  def test_refresh(self):
+    index = tracking_path_index.TrackingPathIndex()
+    tracking = self._write_tracking('tracking')
+    plain = self._write('plain', 'int x;\n')
+    index.get_tracking_path(tracking)
+    index.get_tracking_path(plain)
+
+    self._write_tracking('plain', mtime=200)
+    os.remove(tracking)
+    index.refresh()
+    self.assertEquals(3, self._scan.call_count)
+    self.assertEquals([plain], index.to_dict()['entries'].keys())
+    self.assertEquals(self._upstream, index.get_tracking_path(plain))
+    self.assertEquals(3, self._scan.call_count)
+
+  def test_merge_entries(self):
+    child = tracking_path_index.TrackingPathIndex()
+    tracking = self._write_tracking('tracking')
+    child.get_tracking_path(tracking)
+    entries = child.pop_new_entries()
+    self.assertEquals([tracking], entries.keys())
+    self.assertEquals({}, child.pop_new_entries())
+
+    parent = tracking_path_index.TrackingPathIndex()
+    parent.merge_entries(entries)
+    self.assertTrue(parent.is_updated)
+    self.assertEquals(self._upstream, parent.get_tracking_path(tracking))
+    self.assertEquals(1, self._scan.call_count)
+
+  def test_shared_index(self):
+    tracking = self._write_tracking('tracking')
+    self.assertEquals(self._upstream,
+                      tracking_path_index.get_tracking_path(tracking))
+    self.assertEquals(
+        [tracking],
+        shared_index.pop_new_entries()[tracking_path_index._INDEX_NAME].keys())
+
+
+if __name__ == '__main__':
+  unittest.main()
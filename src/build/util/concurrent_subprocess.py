@@ -2,8 +2,14 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import collections
+import errno
+import fcntl
+import heapq
 import io
+import itertools
 import logging
+import os
 import re
 import select
 import signal
@@ -56,15 +62,15 @@ def _maybe_create_line_reader(reader):
   return nonblocking_io.LineReader(reader)
 
 
+# The event queued to _OutputWatch when the watch is finished.
+_FINISHED = object()
+
+
 def _handle_output(reader, handler):
   """Reads lines from |reader| and invoke handler for each line.
 
-  At EOF, this closes the |reader|, and returns True.
-  Otherwise, returns False.
+  At EOF, returns True. Otherwise, returns False.
   """
-  if reader is None:
-    return False
-
   try:
     for line in reader:
       handler(line)
@@ -72,8 +78,394 @@ def _handle_output(reader, handler):
     # All available lines are read. No more line is available for now.
     return False
   else:
-    reader.close()  # EOF is found.
-    return True
+    return True  # EOF is found.
+
+
+def _create_wakeup_pipe():
+  """Returns the read and write fds of a non-blocking close-on-exec pipe."""
+  read_fd, write_fd = os.pipe()
+  for fd in (read_fd, write_fd):
+    fcntl.fcntl(fd, fcntl.F_SETFD,
+                fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    fcntl.fcntl(fd, fcntl.F_SETFL,
+                fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+  return read_fd, write_fd
+
+
+def _write_wakeup(write_fd):
+  try:
+    os.write(write_fd, 'x')
+  except OSError as e:
+    # The pipe is full, so the reader will wake up anyway.
+    if e.errno != errno.EAGAIN:
+      raise
+
+
+def _read_wakeup(read_fd):
+  try:
+    while os.read(read_fd, 4096):
+      pass
+  except OSError as e:
+    if e.errno != errno.EAGAIN:
+      raise
+
+
+def _wait_readable(fd):
+  """Waits until |fd| is readable.
+
+  Unlike Queue.get() with a timeout, which polls with sleeps on Python 2,
+  select() wakes up as soon as |fd| is readable. It is still interrupted by
+  signals, so KeyboardInterrupt initiated by Ctrl-C is raised on the main
+  thread.
+  """
+  while True:
+    try:
+      select.select([fd], [], [])
+      return
+    except select.error as e:
+      if e.args[0] != errno.EINTR:
+        raise
+
+
+class _Timer(object):
+  """A timer run by the reactor. See _Reactor.call_later()."""
+
+  def __init__(self, deadline, callback, args):
+    self.deadline = deadline
+    self.callback = callback
+    self.args = args
+    self.cancelled = False
+
+  def cancel(self):
+    self.cancelled = True
+
+
+class _Poller(object):
+  """Thin wrapper of select.epoll, which falls back to select.poll."""
+
+  def __init__(self):
+    if hasattr(select, 'epoll'):
+      self._poller = select.epoll()
+      self._events = select.EPOLLIN
+      self._timeout_unit = 1.
+    else:
+      self._poller = select.poll()
+      self._events = select.POLLIN
+      self._timeout_unit = 1000.
+
+  def register(self, fd):
+    self._poller.register(fd, self._events)
+
+  def unregister(self, fd):
+    self._poller.unregister(fd)
+
+  def poll(self, timeout):
+    """Returns the list of the readable file descriptors."""
+    try:
+      return [fd for fd, _ in self._poller.poll(timeout * self._timeout_unit)]
+    except EnvironmentError as e:
+      if e.errno != errno.EINTR:
+        raise
+      return []
+
+
+class _OutputWatch(object):
+  """The state of a Popen.handle_output() invocation in the reactor."""
+
+  # The reactor stops reading the output while this many lines are queued or
+  # being handled, so that a slow OutputHandler does not let the queue grow
+  # without bound.
+  _MAX_PENDING_LINES = 1000
+
+  def __init__(self, popen, output_handler, stdout, stderr):
+    self.popen = popen
+    self.output_handler = output_handler
+    # A map from a file descriptor to a pair of the LineReader and the
+    # callback of |output_handler| for its lines.
+    self.readers = {}
+    if stdout:
+      self.readers[stdout.fileno()] = (stdout, output_handler.handle_stdout)
+    if stderr:
+      self.readers[stderr.fileno()] = (stderr, output_handler.handle_stderr)
+    # The events queued by the reactor for the thread running
+    # Popen.handle_output(). Each event is a pair of the callback and the list
+    # of the lines for it, or _FINISHED as the last event. The callback is None
+    # for the periodic output_handler.is_done() check.
+    self._events = collections.deque()
+    # The number of the lines queued or being handled.
+    self._num_pending_lines = 0
+    # Set True while the reactor stops reading the output, as too many lines
+    # are pending.
+    self._is_paused = False
+    self._lock = threading.Lock()
+    # The reactor writes to this pipe to wake up the thread running
+    # Popen.handle_output().
+    self._wakeup_read_fd, self._wakeup_write_fd = _create_wakeup_pipe()
+    # Set True once output_handler.is_done() returns True.
+    self.done = False
+    self.is_done_timer = None
+    # The exception raised by reading the output or by |output_handler|, which
+    # is re-raised by Popen.handle_output().
+    self.exc_info = None
+    self.finished = threading.Event()
+
+  def put_event(self, event, num_lines=0):
+    """Queues |event| with |num_lines| lines. Called on the reactor thread.
+
+    Returns True if the reactor should stop reading the output until
+    release_lines() asks to resume it.
+    """
+    with self._lock:
+      self._events.append(event)
+      self._num_pending_lines += num_lines
+      should_pause = (
+          not self._is_paused and
+          self._num_pending_lines >= _OutputWatch._MAX_PENDING_LINES)
+      if should_pause:
+        self._is_paused = True
+    _write_wakeup(self._wakeup_write_fd)
+    return should_pause
+
+  def take_events(self):
+    """Waits for the queued events, and returns them."""
+    while True:
+      with self._lock:
+        if self._events:
+          events = list(self._events)
+          self._events.clear()
+          return events
+      _wait_readable(self._wakeup_read_fd)
+      _read_wakeup(self._wakeup_read_fd)
+
+  def release_lines(self, num_lines):
+    """Marks |num_lines| lines as handled.
+
+    Returns True if the reactor should resume reading the output.
+    """
+    with self._lock:
+      self._num_pending_lines -= num_lines
+      should_resume = (
+          self._is_paused and
+          self._num_pending_lines < _OutputWatch._MAX_PENDING_LINES)
+      if should_resume:
+        self._is_paused = False
+    return should_resume
+
+  def close(self):
+    """Closes the wakeup pipe. Called after _FINISHED is taken."""
+    os.close(self._wakeup_read_fd)
+    os.close(self._wakeup_write_fd)
+
+
+class _Reactor(object):
+  """Multiplexes the output and the timers of all the Popen instances.
+
+  A single daemon thread waits for the output of all the subprocesses with
+  epoll, reads the available lines, and queues them to the thread calling
+  Popen.handle_output(), which invokes the OutputHandler of the subprocess.
+  The reactor also runs the timers of the subprocesses, such as the timeout,
+  instead of running a thread for each timer.
+
+  The OutputHandler methods may block, e.g. to symbolize a crash, as they are
+  not invoked on the reactor thread. Only the timer callbacks are, so they
+  should not block.
+  """
+
+  # OutputHandler.is_done() is called at this interval even if nothing is
+  # output.
+  _IS_DONE_INTERVAL_SECONDS = 5
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # A heap of (deadline, sequence number, _Timer).
+    self._timers = []
+    self._timer_sequence = itertools.count()
+    # The following fields are accessed only on the reactor thread.
+    self._poller = _Poller()
+    # A map from a file descriptor to the _OutputWatch reading it.
+    self._watches = {}
+
+    # The timers are added from the other threads. Writing to this pipe wakes
+    # up the reactor thread to re-compute the poll timeout.
+    self._wakeup_read_fd, self._wakeup_write_fd = _create_wakeup_pipe()
+    self._poller.register(self._wakeup_read_fd)
+
+    self._thread = threading.Thread(
+        target=self._run, name='concurrent_subprocess reactor')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def call_later(self, interval, callback, *args):
+    """Invokes |callback| on the reactor thread |interval| secs later.
+
+    Returns the timer, which can be cancel()ed, similar to threading.Timer.
+    """
+    timer = _Timer(time.time() + interval, callback, args)
+    with self._lock:
+      heapq.heappush(self._timers,
+                     (timer.deadline, next(self._timer_sequence), timer))
+    if threading.current_thread() is not self._thread:
+      _write_wakeup(self._wakeup_write_fd)
+    return timer
+
+  def add_watch(self, watch):
+    """Starts dispatching the output to |watch.output_handler|."""
+    self.call_later(0, self._add_watch, watch)
+
+  def finish_watch(self, watch):
+    """Stops reading the output, and lets Popen.handle_output() return."""
+    self.call_later(0, self._finish_watch, watch)
+
+  def resume_watch(self, watch):
+    """Resumes reading the output paused by _OutputWatch.put_event()."""
+    self.call_later(0, self._resume_watch, watch)
+
+  def _add_watch(self, watch):
+    if watch.finished.is_set():
+      return
+    if not watch.readers:
+      self._finish_watch(watch)
+      return
+    self._start_polling(watch)
+    watch.is_done_timer = self.call_later(
+        _Reactor._IS_DONE_INTERVAL_SECONDS, self._check_is_done, watch)
+
+  def _finish_watch(self, watch):
+    if watch.finished.is_set():
+      return
+    for fd, (reader, _) in watch.readers.iteritems():
+      self._close_reader(fd, reader)
+    watch.readers.clear()
+    if watch.is_done_timer:
+      watch.is_done_timer.cancel()
+    watch.finished.set()
+    watch.put_event(_FINISHED)
+
+  def _resume_watch(self, watch):
+    if not watch.finished.is_set():
+      self._start_polling(watch)
+
+  def _start_polling(self, watch):
+    for fd in watch.readers:
+      self._watches[fd] = watch
+      self._poller.register(fd)
+
+  def _stop_polling(self, watch):
+    for fd in watch.readers:
+      if self._watches.pop(fd, None):
+        self._poller.unregister(fd)
+
+  def _close_reader(self, fd, reader):
+    if self._watches.pop(fd, None):
+      self._poller.unregister(fd)
+    reader.close()
+
+  def _check_is_done(self, watch):
+    if watch.finished.is_set():
+      return
+    watch.put_event((None, []))
+    watch.is_done_timer = self.call_later(
+        _Reactor._IS_DONE_INTERVAL_SECONDS, self._check_is_done, watch)
+
+  def _handle_readable(self, fd):
+    watch = self._watches.get(fd)
+    if not watch:
+      return
+    reader, callback = watch.readers[fd]
+    lines = []
+    try:
+      is_eof = _handle_output(reader, lines.append)
+    except Exception:
+      watch.exc_info = sys.exc_info()
+      self._finish_watch(watch)
+      return
+    if lines and watch.put_event((callback, lines), len(lines)):
+      self._stop_polling(watch)
+    if is_eof:
+      self._close_reader(fd, reader)
+      del watch.readers[fd]
+      if not watch.readers:
+        self._finish_watch(watch)
+
+  def _pop_expired_timers(self):
+    """Returns the expired timers, and the timeout until the next one."""
+    expired = []
+    now = time.time()
+    with self._lock:
+      while self._timers and self._timers[0][0] <= now:
+        expired.append(heapq.heappop(self._timers)[2])
+      # Wait without a deadline if no timer is pending. Even then, wake up
+      # occasionally, in case the system clock jumps.
+      timeout = self._timers[0][0] - now if self._timers else 60
+    return expired, timeout
+
+  def _run(self):
+    while True:
+      expired, timeout = self._pop_expired_timers()
+      for timer in expired:
+        if timer.cancelled:
+          continue
+        try:
+          timer.callback(*timer.args)
+        except Exception:
+          logging.exception('Timer callback failed')
+      if expired:
+        # The callbacks may have added timers.
+        continue
+
+      for fd in self._poller.poll(timeout):
+        if fd == self._wakeup_read_fd:
+          _read_wakeup(self._wakeup_read_fd)
+        else:
+          self._handle_readable(fd)
+
+
+def _dispatch_output(watch):
+  """Invokes |watch.output_handler| for the events queued by the reactor.
+
+  Returns when the watch is finished. Once the handler raises an exception,
+  the reactor stops reading the output, and the remaining events are dropped.
+  """
+  while True:
+    num_lines = 0
+    for event in watch.take_events():
+      if event is _FINISHED:
+        watch.close()
+        return
+      callback, lines = event
+      num_lines += len(lines)
+      if watch.exc_info:
+        continue
+      try:
+        for line in lines:
+          callback(line)
+        if not watch.done and watch.output_handler.is_done():
+          watch.done = True
+          watch.popen.terminate()
+      except BaseException:
+        watch.exc_info = sys.exc_info()
+        _get_reactor().finish_watch(watch)
+    if watch.release_lines(num_lines):
+      _get_reactor().resume_watch(watch)
+
+
+_reactor = None
+_reactor_pid = None
+_reactor_lock = threading.Lock()
+
+
+def _get_reactor():
+  """Returns the reactor, starting it if necessary.
+
+  The reactor thread does not survive fork(), so a forked process starts its
+  own reactor.
+  """
+  global _reactor, _reactor_pid
+  with _reactor_lock:
+    if _reactor_pid != os.getpid():
+      _reactor = _Reactor()
+      _reactor_pid = os.getpid()
+    return _reactor
 
 
 class Popen(object):
@@ -84,6 +476,8 @@ class Popen(object):
   This wrapper additionally supports defining a timeout after which the
   process should automatically be terminated, and supports monitoring
   the subprocess output in a non-blocking way.
+  The output and the timers of all the instances are handled by a single
+  reactor thread. See _Reactor for details.
   """
 
   # If the subprocess is not terminated even 5 secs after sending terminate(),
@@ -120,8 +514,10 @@ class Popen(object):
     self._handle_output_invoked = False
     # Set when kill() is called.
     self._kill_event = threading.Event()
+    # The _OutputWatch while handle_output() is running.
+    self._watch = None
 
-    # threading.Timer instances for timeout or terminate_later.
+    # Timers for timeout or terminate_later.
     # When the subprocess is poll()ed, all timers will be cancelled and
     # _timers will be set to None. See _poll_locked() for more details.
     self._timers = []
@@ -149,9 +545,8 @@ class Popen(object):
   def _start_timer_locked(self, interval, callback):
     """Starts the timer.
 
-    threading.Timer is based on threading.Thread. Each Timer invocation creates
-    a thread. We set it as daemon, so that even if there is pending timeout
-    we can terminate the main scripts.
+    The timer runs |callback| on the reactor thread, rather than creating a
+    thread for each timer like threading.Timer does.
     For thread safety, any method that is called by a callback should acquire
     |self._lock|, and call |self._poll_locked()| to ensure the process still
     exists. If it does, it should continue performing its functionality while
@@ -159,10 +554,7 @@ class Popen(object):
     """
     assert self._timers is not None, (
         '_start_timer_locked() must be called while the subprocess is alive.')
-    timer = threading.Timer(interval, callback)
-    timer.daemon = True
-    timer.start()
-    self._timers.append(timer)
+    self._timers.append(_get_reactor().call_later(interval, callback))
 
   @property
   def pid(self):
@@ -203,6 +595,8 @@ class Popen(object):
         self._process.kill()
         signal_util.kill_recursively(self._process.pid)
         self._kill_event.set()
+        if self._watch:
+          _get_reactor().finish_watch(self._watch)
 
   def poll(self):
     with self._lock:
@@ -231,22 +625,28 @@ class Popen(object):
     Returns status code, or None if timed out.
     """
     deadline = None if timeout is None else time.time() + timeout
+    # Because poll is guarded by the lock, we can just use busy-loop. The
+    # interval starts from 1 msec, as the subprocess usually terminates soon
+    # after closing its output, and grows up to 0.1 secs (chosen
+    # heuristically).
+    interval = 0.001
     while True:
-      # Because poll is guarded by the lock, we can just use busy-loop with
-      # 0.1 secs interval (chosen heuristically).
       result = self.poll()
       if (result is not None or
           (deadline is not None and time.time() >= deadline)):
         # If subprocess is terminated or timed out, return the result.
         return result
-      time.sleep(0.1)
+      time.sleep(interval)
+      interval = min(interval * 2, 0.1)
 
   def handle_output(self, output_handler):
     """Reads output from the subprocess, wait()s until the termination.
 
-    This function reads stdout and stderr (if available), and invokes
-    the corresponding callback of |output_handler|.
-    For each iteration, |output_handler.is_done()| is invoked. If it returns
+    This function reads stdout and stderr (if available) on the reactor
+    thread, and invokes the corresponding callback of |output_handler| on the
+    calling thread.
+    Whenever output is handled, and at least every 5 seconds,
+    |output_handler.is_done()| is invoked. If it returns
     True, this tries to terminate the subprocess. Later, is_done() will no
     longer be called, but handle_output and handle_error will be as long as
     there is still output to be processed.
@@ -259,49 +659,39 @@ class Popen(object):
       assert not self._handle_output_invoked, (
           'handle_output() must be called at most once.')
       self._handle_output_invoked = True
-
-    stdout = _maybe_create_line_reader(self._process.stdout)
-    stderr = _maybe_create_line_reader(self._process.stderr)
-
-    # Note: Exit from the loop, whenever kill() is invoked.
-    # In most cases, when kill() is called, all the descendant processes should
-    # be terminated immediately, and then the write-end of stdout and stderr
-    # are closed, which triggers graceful shutdown of this method.
-    # However, there seems some process which keeps the write-end opened,
-    # so that it causes TIMEOUT flakiness in some cases.
-    # To avoid such a situation, even if either stdout or stderr is still
-    # available, exit from the loop. It should be ok to ignore the
-    # remaining stdout and stderr, because nothing valuable should be output
-    # in such cases.
-    # Note that it is *not* necessary to exit from select() immediately,
-    # because it is timed out on every 5 seconds, and it is ok to rely on
-    # that fact, as this is last-resort.
-    # Note that it does not exit from the loop on terminate(), because
-    # graceful shutdown is expected for the terminate().
-    done = False
-    while (stdout or stderr) and not self._kill_event.is_set():
-      # We do not take care about subprocess termination here, because
-      # on the subprocess termination, write-side of stdout and stderr are
-      # closed, so that select() should return at the time. Then,
-      # stdout and stderr will reach to EOF and those are closed, so that
-      # we exit from the loop.
-      # Also note that, on Windows, select for non-socket FDs are not supported.
-      # For such a case, we time out the loop by 5 seconds at most.
-      select.select(filter(None, [stdout, stderr]), [], [], 5)
-      if _handle_output(stdout, output_handler.handle_stdout):
-        stdout = None
-      if _handle_output(stderr, output_handler.handle_stderr):
-        stderr = None
-      if not done and output_handler.is_done():
-        done = True
-        self.terminate()
-
-    # In case of kill() termination, stdout and stderr may be kept opened.
-    # Here, close() them if necessary.
-    if stdout:
-      stdout.close()
-    if stderr:
-      stderr.close()
+      watch = _OutputWatch(
+          self, output_handler,
+          _maybe_create_line_reader(self._process.stdout),
+          _maybe_create_line_reader(self._process.stderr))
+      # Note: Stop reading the output, whenever kill() is invoked.
+      # In most cases, when kill() is called, all the descendant processes
+      # should be terminated immediately, and then the write-end of stdout and
+      # stderr are closed, which triggers graceful shutdown of this method.
+      # However, there seems some process which keeps the write-end opened,
+      # so that it causes TIMEOUT flakiness in some cases.
+      # To avoid such a situation, even if either stdout or stderr is still
+      # available, stop reading. It should be ok to ignore the remaining
+      # stdout and stderr, because nothing valuable should be output in such
+      # cases.
+      # Note that it does not stop reading on terminate(), because graceful
+      # shutdown is expected for the terminate().
+      killed = self._kill_event.is_set()
+      if not killed:
+        self._watch = watch
+
+    # The reactor reads stdout and stderr until they reach EOF. We do not take
+    # care about subprocess termination here, because on the subprocess
+    # termination, write-side of stdout and stderr are closed.
+    reactor = _get_reactor()
+    if killed:
+      reactor.finish_watch(watch)
+    else:
+      reactor.add_watch(watch)
+    _dispatch_output(watch)
+    with self._lock:
+      self._watch = None
+    if watch.exc_info:
+      raise watch.exc_info[0], watch.exc_info[1], watch.exc_info[2]
 
     # Wait for the subprocess terminate.
     returncode = self.wait()
@@ -318,6 +708,7 @@ class OutputHandler(object):
   """Default (stub) definition for the handler Popen.handle_output() requires.
 
   This handler does almost nothing.
+  All the methods are called on the thread calling Popen.handle_output().
   """
 
   def handle_stdout(self, line):
@@ -378,6 +769,10 @@ class DelegateOutputHandlerBase(OutputHandler):
   interesting events (like stdout line, stderr line etc.), and delegating
   anything else to other OutputHandler.
   This is the base class for such purposes.
+  The methods are called on the thread calling Popen.handle_output(), not on
+  the reactor thread shared by all the subprocesses. So a handler may block,
+  e.g. to run addr2line or ssh, without delaying the output of the other
+  subprocesses. While it blocks, the output of its own subprocess is queued.
   """
   def __init__(self, base_handler):
     super(DelegateOutputHandlerBase, self).__init__()
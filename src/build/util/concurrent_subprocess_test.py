@@ -8,6 +8,7 @@
 import os
 import signal
 import threading
+import time
 import unittest
 
 from src.build.util import concurrent_subprocess
@@ -294,6 +295,17 @@ class FakePopenTest(unittest.TestCase):
     # Even timer should not be created.
     self.assertEquals([], popen.created_timer_list)
 
+  def test_handler_exception(self):
+    class FailingOutputHandler(SimpleOutputHandler):
+      def handle_stderr(self, line):
+        raise ValueError(line)
+
+    with FakePopen() as p:
+      popen = TestPopen(p, ['cmd'])
+      p.write_stderr('abc\n')
+      with self.assertRaisesRegexp(ValueError, 'abc'):
+        popen.handle_output(FailingOutputHandler())
+
 
 class PopenTest(unittest.TestCase):
   # For sanity check, we run real Popen.
@@ -315,3 +327,82 @@ class PopenTest(unittest.TestCase):
     self.assertEquals('', output_handler.stderr)
     self.assertTrue(output_handler.timeout)
     self.assertEquals(-signal.SIGTERM, returncode)
+
+  def test_concurrent_run(self):
+    processes = [
+        concurrent_subprocess.Popen(
+            ['python', '-c', 'import sys; print %d; sys.stderr.write("e")' % i])
+        for i in xrange(20)]
+    output_handlers = [SimpleOutputHandler() for _ in processes]
+    threads = [threading.Thread(target=p.handle_output, args=(handler,))
+               for p, handler in zip(processes, output_handlers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEquals(['%d\n' % i for i in xrange(20)],
+                      [handler.stdout for handler in output_handlers])
+    self.assertTrue(all(handler.stderr == 'e' for handler in output_handlers))
+
+  def test_blocking_handler_does_not_block_other_subprocesses(self):
+    handled = threading.Event()
+
+    class BlockingOutputHandler(SimpleOutputHandler):
+      def handle_stdout(self, line):
+        # Blocks until the output of the other subprocess is handled.
+        self.unblocked = handled.wait(10)
+        super(BlockingOutputHandler, self).handle_stdout(line)
+
+    class NotifyingOutputHandler(SimpleOutputHandler):
+      def handle_stdout(self, line):
+        super(NotifyingOutputHandler, self).handle_stdout(line)
+        handled.set()
+
+    blocking_handler = BlockingOutputHandler()
+    blocking_thread = threading.Thread(
+        target=concurrent_subprocess.Popen(
+            ['python', '-c', 'print "a"']).handle_output,
+        args=(blocking_handler,))
+    blocking_thread.start()
+    notifying_handler = NotifyingOutputHandler()
+    concurrent_subprocess.Popen(['python', '-c', 'print "b"']).handle_output(
+        notifying_handler)
+    blocking_thread.join()
+    self.assertTrue(blocking_handler.unblocked)
+    self.assertEquals('a\n', blocking_handler.stdout)
+    self.assertEquals('b\n', notifying_handler.stdout)
+
+  def test_output_is_paused_while_lines_are_pending(self):
+    class SlowOutputHandler(SimpleOutputHandler):
+      def handle_stdout(self, line):
+        # Lets the reactor read more lines than the limit meanwhile.
+        time.sleep(0.001)
+        super(SlowOutputHandler, self).handle_stdout(line)
+
+    watch_class = concurrent_subprocess._OutputWatch
+    original_max_pending_lines = watch_class._MAX_PENDING_LINES
+    watch_class._MAX_PENDING_LINES = 2
+    try:
+      p = concurrent_subprocess.Popen(
+          ['python', '-c',
+           'import sys\n'
+           'for i in xrange(100):\n'
+           '  print i\n'
+           '  sys.stdout.flush()'])
+      output_handler = SlowOutputHandler()
+      returncode = p.handle_output(output_handler)
+    finally:
+      watch_class._MAX_PENDING_LINES = original_max_pending_lines
+    self.assertEquals(''.join('%d\n' % i for i in xrange(100)),
+                      output_handler.stdout)
+    self.assertEquals(0, returncode)
+
+  def test_timer_does_not_create_thread(self):
+    # Start the reactor in advance.
+    concurrent_subprocess._get_reactor()
+    num_threads = threading.active_count()
+    p = concurrent_subprocess.Popen(['sleep', '10'], timeout=100)
+    p.terminate_later(100)
+    self.assertEquals(num_threads, threading.active_count())
+    p.kill()
+    self.assertEquals(-signal.SIGKILL, p.handle_output(SimpleOutputHandler()))
@@ -5,6 +5,7 @@
 """Functions for downloading and unpacking archives, with caching."""
 
 import contextlib
+import errno
 import hashlib
 import json
 import logging
@@ -13,16 +14,39 @@ import shutil
 import stat
 import subprocess
 import tempfile
+import threading
 import time
 import urllib
 
 from src.build import build_common
+from src.build.util import concurrent
 from src.build.util import file_util
 
 
 _DEFAULT_CACHE_BASE_PATH = os.path.join(build_common.get_arc_root(), 'cache')
 _DEFAULT_CACHE_HISTORY_SIZE = 3
 
+# The directory under the cache base path for the blob store.
+_BLOB_STORE_DIR = 'blobs'
+
+# The directory under the cache base path for the manifests of the cache
+# entries deleted from the history, which can be restored from the blob store.
+_MANIFEST_DIR = 'manifests'
+
+# The blobs which are no longer linked from any cache entry are kept up to this
+# total size, so that the deleted cache entries can be restored without
+# downloading them again. The least-recently used ones are deleted first.
+_MAX_UNUSED_BLOB_SIZE = 2 * 1024 * 1024 * 1024
+
+# The maximum number of packages to update concurrently.
+_MAX_CONCURRENT_UPDATES = 4
+
+_READ_SIZE = 1024 * 1024
+
+# Serializes the accesses to contents.json and the garbage collection of the
+# blob store, as packages may be updated concurrently by threads.
+_cache_lock = threading.Lock()
+
 
 class CacheHistory(object):
   """Interface for the working with the history of a particular package."""
@@ -33,14 +57,28 @@ class CacheHistory(object):
     self._history_size = history_size
     self._contents = contents
 
+  @property
+  def contents(self):
+    return self._contents
+
   def clean_old(self):
-    """Cleans out the least-recently used entries, deleting cache paths."""
+    """Cleans out the least-recently used entries, deleting cache paths.
+
+    The files of the deleted entries are recorded in the blob store, so that
+    they can be restored while their blobs are kept.
+    Returns True if any entry is deleted.
+    """
+    cleaned = False
     while len(self._contents) > self._history_size:
       path = self._contents.pop(0)
       assert path.startswith(self._base_path)
       logging.info('%s: Cleaning old cache entry %s', self._name,
                    os.path.basename(path))
+      if os.path.isdir(path):
+        _BlobStore(self._base_path).archive_tree(path)
       shutil.rmtree(path, ignore_errors=True)
+      cleaned = True
+    return cleaned
 
   def ensure_recent(self, path):
     """Ensures the path is moved to a recently-used position in the history."""
@@ -49,6 +87,16 @@ class CacheHistory(object):
     self._contents.append(path)
 
 
+def _load_cache_contents(cache_contents_path):
+  if os.path.exists(cache_contents_path):
+    with open(cache_contents_path) as cache_contents_file:
+      try:
+        return json.load(cache_contents_file)
+      except ValueError:
+        pass
+  return {}
+
+
 @contextlib.contextmanager
 def _persisted_cache_history(name, base_path, history_size):
   """Persists the cache history using a context."""
@@ -58,13 +106,8 @@ def _persisted_cache_history(name, base_path, history_size):
   cache_contents_path = os.path.join(base_path, 'contents.json')
 
   # Load in the existing cache content history.
-  cache_contents = {}
-  if os.path.exists(cache_contents_path):
-    with open(cache_contents_path) as cache_contents_file:
-      try:
-        cache_contents = json.load(cache_contents_file)
-      except ValueError:
-        pass
+  with _cache_lock:
+    cache_contents = _load_cache_contents(cache_contents_path)
 
   # Get the history for this particular download, and yield it for use by the
   # caller.
@@ -78,11 +121,265 @@ def _persisted_cache_history(name, base_path, history_size):
   # here.
   yield history
 
-  history.clean_old()
+  with _cache_lock:
+    if history.clean_old():
+      _BlobStore(base_path).collect_garbage()
+
+    # Save out the modified cache content history. The history of the other
+    # packages is loaded again, as they may have been updated concurrently.
+    cache_contents = _load_cache_contents(cache_contents_path)
+    cache_contents.setdefault('cache', {})[name] = history.contents
+    with open(cache_contents_path, 'w') as cache_contents_file:
+      json.dump(cache_contents, cache_contents_file, indent=2, sort_keys=True)
+
+
+def _compute_sha1(path):
+  digest = hashlib.sha1()
+  with open(path, 'rb') as f:
+    while True:
+      data = f.read(_READ_SIZE)
+      if not data:
+        break
+      digest.update(data)
+  return digest.hexdigest()
+
+
+class _BlobStore(object):
+  """A content-addressed store of the files in the cache entries.
+
+  Package versions share most of their files, so each file unpacked into a
+  cache entry is replaced with a hardlink to the blob with the same content and
+  mode. The cache entries of all the versions share the disk space for the
+  same files, and a blob is deleted once no cache entry links to it.
+
+  As the blobs are shared, the files in a cache entry must not be modified in
+  place once they are added to the store. Use unshare_tree() to copy them
+  before modifying.
+
+  When a cache entry is deleted, archive_tree() records the blobs of its files
+  in a manifest, and restore_tree() links them again instead of downloading
+  the package. The unused blobs are kept up to _MAX_UNUSED_BLOB_SIZE for this.
+  """
+
+  def __init__(self, base_path):
+    self._path = os.path.join(base_path, _BLOB_STORE_DIR)
+    self._manifest_dir = os.path.join(base_path, _MANIFEST_DIR)
+
+  def _get_blob_path(self, digest, mode):
+    return os.path.join(self._path, digest[:2],
+                        '%s-%o' % (digest, stat.S_IMODE(mode)))
+
+  def _get_blob_names_by_inode(self):
+    """Returns a map from the (st_dev, st_ino) of each blob to its name."""
+    blob_names = {}
+    for dirpath, _, filenames in os.walk(self._path):
+      for filename in filenames:
+        blob_path = os.path.join(dirpath, filename)
+        st = os.lstat(blob_path)
+        blob_names[(st.st_dev, st.st_ino)] = os.path.relpath(blob_path,
+                                                             self._path)
+    return blob_names
+
+  def _get_manifest_path(self, path):
+    return os.path.join(self._manifest_dir, os.path.basename(path) + '.json')
+
+  def _link_to_blob(self, blob_path, path):
+    """Replaces |path| with a hardlink to |blob_path| if the blob exists.
 
-  # Save out the modified cache content history.
-  with open(cache_contents_path, 'w') as cache_contents_file:
-    json.dump(cache_contents, cache_contents_file, indent=2, sort_keys=True)
+    Returns False if the blob does not exist.
+    """
+    tmp_path = path + '.blob-tmp'
+    try:
+      os.link(blob_path, tmp_path)
+    except OSError as e:
+      if e.errno == errno.ENOENT:
+        return False
+      raise
+    os.rename(tmp_path, path)
+    return True
+
+  def _add_file(self, path, st):
+    blob_path = self._get_blob_path(_compute_sha1(path), st.st_mode)
+    if self._link_to_blob(blob_path, path):
+      return True
+    file_util.makedirs_safely(os.path.dirname(blob_path))
+    try:
+      os.link(path, blob_path)
+      return False
+    except OSError as e:
+      # The same blob may be added concurrently by another package.
+      if e.errno != errno.EEXIST:
+        raise
+    return self._link_to_blob(blob_path, path)
+
+  def add_tree(self, path, unshared_files=None):
+    """Adds the files under |path| to the store, replacing them with links.
+
+    |unshared_files| is the map returned by unshare_tree(). The files which
+    are not modified since then are linked to their blobs again without
+    computing their digests.
+    Returns a tuple of the number of the files and the number of the files
+    which were already in the store.
+    """
+    unshared_files = unshared_files or {}
+    num_files = 0
+    num_shared_files = 0
+    for dirpath, _, filenames in os.walk(path):
+      for filename in filenames:
+        file_path = os.path.join(dirpath, filename)
+        st = os.lstat(file_path)
+        # A file with multiple links is already in the store, or is hardlinked
+        # in the archive.
+        if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1:
+          continue
+        blob_name, copied_stat = unshared_files.get(file_path, (None, None))
+        try:
+          if (copied_stat == (st.st_mtime, st.st_size, st.st_mode) and
+              self._link_to_blob(os.path.join(self._path, blob_name),
+                                 file_path)):
+            num_shared_files += 1
+          elif self._add_file(file_path, st):
+            num_shared_files += 1
+        except OSError as e:
+          # The file system does not support hardlinks, or the blob has too
+          # many links. Leave the file as is.
+          if e.errno not in (errno.EMLINK, errno.EPERM, errno.EXDEV):
+            raise
+          logging.warning('Cannot add %s to the blob store: %s', file_path, e)
+          continue
+        num_files += 1
+    return num_files, num_shared_files
+
+  def unshare_tree(self, path):
+    """Replaces the files under |path| linked to blobs with their copies.
+
+    The files can be modified in place afterwards. Returns a map from the path
+    of each copied file to the name of its blob and the (st_mtime, st_size,
+    st_mode) of the copy, to be passed to add_tree().
+    """
+    blob_names = self._get_blob_names_by_inode()
+    unshared_files = {}
+    for dirpath, _, filenames in os.walk(path):
+      for filename in filenames:
+        file_path = os.path.join(dirpath, filename)
+        st = os.lstat(file_path)
+        if not stat.S_ISREG(st.st_mode) or st.st_nlink == 1:
+          continue
+        tmp_path = file_path + '.blob-tmp'
+        shutil.copy2(file_path, tmp_path)
+        os.rename(tmp_path, file_path)
+        blob_name = blob_names.get((st.st_dev, st.st_ino))
+        if blob_name:
+          copied_st = os.lstat(file_path)
+          unshared_files[file_path] = (
+              blob_name,
+              (copied_st.st_mtime, copied_st.st_size, copied_st.st_mode))
+    return unshared_files
+
+  def archive_tree(self, path):
+    """Records the blobs of the files under |path| to restore it later.
+
+    Returns False if any file is not in the store, as |path| cannot be
+    restored then.
+    """
+    blob_names = self._get_blob_names_by_inode()
+    manifest = {'dirs': [], 'symlinks': {}, 'files': {}}
+    for dirpath, dirnames, filenames in os.walk(path):
+      for name in dirnames + filenames:
+        file_path = os.path.join(dirpath, name)
+        relpath = os.path.relpath(file_path, path)
+        st = os.lstat(file_path)
+        if stat.S_ISLNK(st.st_mode):
+          manifest['symlinks'][relpath] = os.readlink(file_path)
+        elif stat.S_ISDIR(st.st_mode):
+          manifest['dirs'].append(relpath)
+        elif (st.st_dev, st.st_ino) in blob_names:
+          manifest['files'][relpath] = blob_names[(st.st_dev, st.st_ino)]
+        else:
+          logging.info('%s cannot be restored, as %s is not in the blob store',
+                       path, file_path)
+          return False
+    file_util.makedirs_safely(self._manifest_dir)
+    file_util.generate_file_atomically(
+        self._get_manifest_path(path), lambda f: json.dump(manifest, f))
+    return True
+
+  def restore_tree(self, path):
+    """Restores |path| recorded by archive_tree() by linking to the blobs.
+
+    Returns False if |path| is not recorded, or its blobs are deleted.
+    """
+    manifest_path = self._get_manifest_path(path)
+    try:
+      with open(manifest_path) as f:
+        manifest = json.load(f)
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return False
+      raise
+    except ValueError:
+      return False
+    try:
+      file_util.makedirs_safely(path)
+      # The directories are listed from the top by archive_tree().
+      for relpath in manifest['dirs']:
+        os.mkdir(os.path.join(path, relpath))
+      for relpath, target in manifest['symlinks'].iteritems():
+        os.symlink(target, os.path.join(path, relpath))
+      for relpath, blob_name in manifest['files'].iteritems():
+        os.link(os.path.join(self._path, blob_name),
+                os.path.join(path, relpath))
+    except OSError as e:
+      # The blob is deleted, or has too many links.
+      if e.errno not in (errno.ENOENT, errno.EMLINK):
+        raise
+      logging.warning('Cannot restore %s from the blob store: %s', path, e)
+      file_util.rmtree(path, ignore_errors=True)
+      return False
+    os.remove(manifest_path)
+    return True
+
+  def collect_garbage(self):
+    """Deletes the least-recently used blobs not linked from any cache entry.
+
+    The unused blobs are kept up to _MAX_UNUSED_BLOB_SIZE in total. The blobs
+    are touched with the cache entries linking to them, so their mtime tells
+    when they are used last.
+    """
+    unused_blobs = []
+    for dirpath, _, filenames in os.walk(self._path):
+      for filename in filenames:
+        blob_path = os.path.join(dirpath, filename)
+        st = os.lstat(blob_path)
+        if st.st_nlink == 1:
+          unused_blobs.append((st.st_mtime, st.st_size, blob_path))
+    unused_size = 0
+    num_deleted = 0
+    for _, size, blob_path in sorted(unused_blobs, reverse=True):
+      unused_size += size
+      if unused_size > _MAX_UNUSED_BLOB_SIZE:
+        os.unlink(blob_path)
+        num_deleted += 1
+    logging.info('Deleted %d of %d unused blobs', num_deleted,
+                 len(unused_blobs))
+    if num_deleted:
+      self._remove_broken_manifests()
+
+  def _remove_broken_manifests(self):
+    """Removes the manifests of the cache entries which lost their blobs."""
+    if not os.path.isdir(self._manifest_dir):
+      return
+    for filename in os.listdir(self._manifest_dir):
+      manifest_path = os.path.join(self._manifest_dir, filename)
+      try:
+        with open(manifest_path) as f:
+          blob_names = json.load(f)['files'].values()
+      except ValueError:
+        blob_names = None
+      if blob_names is None or not all(
+          os.path.exists(os.path.join(self._path, blob_name))
+          for blob_name in blob_names):
+        os.remove(manifest_path)
 
 
 def execute_subprocess(cmd, cwd=None):
@@ -199,6 +496,7 @@ class BasicCachedPackage(object):
     self._url = url or self._deps_file_lines[0]
     self._unpacked_cache_path = (
         self._get_cache_entry_path(self._deps_file_lines))
+    self._blob_store = _BlobStore(self._cache_base_path)
 
   @property
   def name(self):
@@ -272,13 +570,62 @@ class BasicCachedPackage(object):
       file_util.rmtree(self._unpacked_cache_path, ignore_errors=True)
       raise
 
+  def _add_cache_to_blob_store(self, unshared_files=None):
+    logging.info('%s: Adding %s to the blob store', self._name,
+                 self._unpacked_cache_path)
+    num_files, num_shared_files = self._blob_store.add_tree(
+        self._unpacked_cache_path, unshared_files)
+    logging.info('%s: %d of %d files are shared with other versions',
+                 self._name, num_shared_files, num_files)
+
+  def _restore_cache_from_blob_store(self, cached_stamp_file):
+    """Restores the cache entry deleted from the history from the blob store.
+
+    Returns False if it cannot be restored, e.g. as its blobs are deleted.
+    """
+    file_util.rmtree(self._unpacked_cache_path, ignore_errors=True)
+    if not self._blob_store.restore_tree(self._unpacked_cache_path):
+      return False
+    if not cached_stamp_file.is_up_to_date():
+      file_util.rmtree(self._unpacked_cache_path, ignore_errors=True)
+      return False
+    logging.info('%s: Restored %s from the blob store', self._name,
+                 self._unpacked_cache_path)
+    return True
+
+  @contextlib.contextmanager
+  def modify_cache_in_place(self):
+    """Allows the files in the cache entry to be modified in place.
+
+    The files shared with the other versions are copied before they are
+    modified, and the cache entry is added to the blob store again afterwards.
+    """
+    unshared_files = self._blob_store.unshare_tree(self._unpacked_cache_path)
+    logging.info('%s: Copied %d shared files in %s', self._name,
+                 len(unshared_files), self._unpacked_cache_path)
+    yield
+    self._add_cache_to_blob_store(unshared_files)
+
   def touch_all_files_in_cache(self):
     logging.info('%s: Touching all files in cache %s', self._name,
                  self.unpacked_linked_cache_path)
     cache_path = self.unpacked_linked_cache_path
+    # The files in the blob store may be linked several times in the cache
+    # entry. Touch each of them only once.
+    touched = set()
     for dirpath, dirnames, filenames in os.walk(cache_path):
       for filename in filenames:
-        file_util.touch(os.path.join(cache_path, dirpath, filename))
+        path = os.path.join(cache_path, dirpath, filename)
+        try:
+          st = os.stat(path)
+        except OSError as e:
+          # A dangling symbolic link.
+          if e.errno != errno.ENOENT:
+            raise
+          continue
+        if (st.st_dev, st.st_ino) not in touched:
+          touched.add((st.st_dev, st.st_ino))
+          file_util.touch(path)
 
   def populate_final_directory(self):
     """Sets up the final location for the download from the cache."""
@@ -354,7 +701,8 @@ class BasicCachedPackage(object):
       cached_stamp_file = build_common.StampFile(
           self._get_stampfile_content(),
           os.path.join(self.unpacked_linked_cache_path, 'URL'))
-      if not cached_stamp_file.is_up_to_date():
+      if (not cached_stamp_file.is_up_to_date() and
+          not self._restore_cache_from_blob_store(cached_stamp_file)):
         self._fetch_and_cache_package()
 
         # We do this now so that the post_update_work step can run out of
@@ -367,6 +715,9 @@ class BasicCachedPackage(object):
         # Write out the updated stamp file
         cached_stamp_file.update()
 
+        # Share the files with the other versions of the package.
+        self._add_cache_to_blob_store()
+
       # Reset the mtime on all the entries in the cache.
       self.touch_all_files_in_cache()
 
@@ -379,3 +730,20 @@ class BasicCachedPackage(object):
           self._name[:-5] if self._name.endswith('Files') else self._name,
           total_time)
     logging.info('%s: Done. [%0.3fs]', self._name, total_time)
+
+
+def update_packages_concurrently(packages, max_workers=None):
+  """Calls check_and_perform_update() of |packages| concurrently.
+
+  The packages are downloaded and unpacked in parallel, and if any update
+  fails, its exception is raised after the other updates finish.
+  """
+  max_workers = min(len(packages), max_workers or _MAX_CONCURRENT_UPDATES)
+  if max_workers <= 1:
+    for package in packages:
+      package.check_and_perform_update()
+    return
+  with concurrent.CheckedExecutor(concurrent.ThreadPoolExecutor(
+      max_workers, daemon=True)) as executor:
+    for package in packages:
+      executor.submit(package.check_and_perform_update)
@@ -4,12 +4,15 @@
 
 """Tests for download_package_util."""
 
+import json
 import logging
 import os
 import shutil
 import tempfile
 import unittest
 
+import mock
+
 from src.build.util import download_package_util
 
 
@@ -66,7 +69,7 @@ class DownloadFailedMock(object):
 
 
 class UpdateMock(object):
-  def __init__(self, test, version, url, link_subdir=None):
+  def __init__(self, test, version, url, link_subdir=None, files=None):
     self._test = test
     self.retrieved = False
     self.unpacked = False
@@ -74,6 +77,7 @@ class UpdateMock(object):
     self.version = version or 'unknown'
     self.link_subdir = link_subdir
     self.url = url
+    self.files = files or {}
 
   def retrieve(self, url, download_file):
     self._test.assertFalse(self.retrieved)
@@ -84,6 +88,9 @@ class UpdateMock(object):
     self._test.assertFalse(self.unpacked)
     self.unpacked = True
     os.makedirs(os.path.join(unpack_path, self.link_subdir))
+    for name, content in self.files.iteritems():
+      with open(os.path.join(unpack_path, self.link_subdir, name), 'w') as f:
+        f.write(content)
 
   def post_update_work(self, cache_path):
     self._test.assertFalse(self.post_update)
@@ -107,10 +114,10 @@ class DownloadPackageUtilTest(unittest.TestCase):
     with open(self._deps_file, 'w') as f:
       f.write(version or 'unknown')
 
-  def _create_stub(self, mock, url=None, link_subdir=None):
+  def _create_stub(self, mock, url=None, link_subdir=None, final_dir=None):
     self._stub = TestPackageStub(
-        mock, self._deps_file, self._final_dir, self._cache_base_path, url=url,
-        link_subdir=link_subdir)
+        mock, self._deps_file, final_dir or self._final_dir,
+        self._cache_base_path, url=url, link_subdir=link_subdir)
     return self._stub
 
   def _setup_cache(self, version):
@@ -242,5 +249,146 @@ class DownloadPackageUtilTest(unittest.TestCase):
     self.assertTrue(self._check_cache('v5'))
     self.assertTrue(self._check_final('v5'))
 
+  def _get_cached_file_stat(self, version, name):
+    cache_path = self._stub._get_cache_entry_path([version])
+    return os.stat(os.path.join(cache_path, 'sub', name))
+
+  def _list_blobs(self):
+    blobs = []
+    for _, _, filenames in os.walk(
+        os.path.join(self._cache_base_path, 'blobs')):
+      blobs.extend(filenames)
+    return blobs
+
+  def test_files_shared_between_versions(self):
+    def _rollTo(version, files):
+      mock = UpdateMock(self, version, version, link_subdir='sub', files=files)
+      self._setup_deps(version)
+      stub = self._create_stub(mock, link_subdir='sub')
+      stub.check_and_perform_update()
+
+    _rollTo('v1', {'shared': 'shared', 'changed': 'v1'})
+    _rollTo('v2', {'shared': 'shared', 'changed': 'v2'})
+    self.assertEquals(self._get_cached_file_stat('v1', 'shared').st_ino,
+                      self._get_cached_file_stat('v2', 'shared').st_ino)
+    self.assertNotEquals(self._get_cached_file_stat('v1', 'changed').st_ino,
+                         self._get_cached_file_stat('v2', 'changed').st_ino)
+    with open(os.path.join(self._final_dir, 'changed')) as f:
+      self.assertEquals('v2', f.read())
+    # 'shared', two 'changed' and two 'URL'.
+    self.assertEquals(5, len(self._list_blobs()))
+
+    # The blobs only used by the cleaned entry are kept while they fit in the
+    # limit, and deleted otherwise.
+    _rollTo('v3', {'shared': 'shared', 'changed': 'v3'})
+    _rollTo('v4', {'shared': 'shared', 'changed': 'v4'})
+    self.assertRaises(NoVersionFileError, self._check_cache, 'v1')
+    self.assertEquals(9, len(self._list_blobs()))
+    with mock.patch.object(download_package_util, '_MAX_UNUSED_BLOB_SIZE', 0):
+      _rollTo('v5', {'shared': 'shared', 'changed': 'v5'})
+    self.assertRaises(NoVersionFileError, self._check_cache, 'v2')
+    self.assertEquals(7, len(self._list_blobs()))
+    # The cleaned entries cannot be restored without their blobs.
+    self.assertEquals(
+        [], os.listdir(os.path.join(self._cache_base_path, 'manifests')))
+
+  def test_cleaned_version_restored_from_blob_store(self):
+    for version in ['v1', 'v2', 'v3', 'v4']:
+      mock = UpdateMock(self, version, version, link_subdir='sub',
+                        files={'shared': 'shared', 'changed': version})
+      self._setup_deps(version)
+      self._create_stub(mock, link_subdir='sub').check_and_perform_update()
+    self.assertRaises(NoVersionFileError, self._check_cache, 'v1')
+
+    # v1 is restored without downloading it again.
+    self._setup_deps('v1')
+    self._create_stub(NoUpdateMock(self),
+                      link_subdir='sub').check_and_perform_update()
+    self.assertTrue(self._check_cache('v1'))
+    self.assertTrue(self._check_final('v1'))
+    with open(os.path.join(self._final_dir, 'changed')) as f:
+      self.assertEquals('v1', f.read())
+    self.assertEquals(self._get_cached_file_stat('v1', 'shared').st_ino,
+                      self._get_cached_file_stat('v4', 'shared').st_ino)
+
+  def test_cleaned_version_downloaded_without_blobs(self):
+    with mock.patch.object(download_package_util, '_MAX_UNUSED_BLOB_SIZE', 0):
+      for version in ['v1', 'v2', 'v3', 'v4']:
+        update_mock = UpdateMock(self, version, version, link_subdir='sub',
+                                 files={'changed': version})
+        self._setup_deps(version)
+        self._create_stub(update_mock,
+                          link_subdir='sub').check_and_perform_update()
+
+    update_mock = UpdateMock(self, 'v1', 'v1', link_subdir='sub',
+                             files={'changed': 'v1'})
+    self._setup_deps('v1')
+    self._create_stub(update_mock, link_subdir='sub').check_and_perform_update()
+    self.assertTrue(update_mock.retrieved)
+    self.assertTrue(self._check_final('v1'))
+
+  def test_modify_cache_in_place(self):
+    for version in ['v1', 'v2']:
+      update_mock = UpdateMock(self, version, version, link_subdir='sub',
+                               files={'shared': 'shared',
+                                      'unmodified': 'unmodified'})
+      self._setup_deps(version)
+      stub = self._create_stub(update_mock, link_subdir='sub')
+      stub.check_and_perform_update()
+
+    with mock.patch.object(
+        download_package_util, '_compute_sha1',
+        wraps=download_package_util._compute_sha1) as compute_sha1:
+      with stub.modify_cache_in_place():
+        with open(os.path.join(stub.unpacked_linked_cache_path, 'shared'),
+                  'a') as f:
+          f.write(' and modified')
+        with open(os.path.join(stub.unpacked_linked_cache_path, 'added'),
+                  'w') as f:
+          f.write('added')
+
+    with open(os.path.join(self._final_dir, 'shared')) as f:
+      self.assertEquals('shared and modified', f.read())
+    cache_path = self._stub._get_cache_entry_path(['v1'])
+    with open(os.path.join(cache_path, 'sub', 'shared')) as f:
+      self.assertEquals('shared', f.read())
+    # The modified and added files are added to the blob store.
+    self.assertEquals(2, self._get_cached_file_stat('v2', 'shared').st_nlink)
+    self.assertEquals(2, self._get_cached_file_stat('v2', 'added').st_nlink)
+    # The unmodified file is linked to its blob again without reading it.
+    self.assertEquals(3,
+                      self._get_cached_file_stat('v2', 'unmodified').st_nlink)
+    self.assertEquals(2, compute_sha1.call_count)
+
+  def test_update_packages_concurrently(self):
+    self._setup_deps('v1')
+    final_dirs = [os.path.join(self._final_dir, name) for name in 'ab']
+    mocks = [UpdateMock(self, 'v1', 'v1', link_subdir='sub',
+                        files={'file': 'content'}) for _ in final_dirs]
+    stubs = [self._create_stub(mock, link_subdir='sub', final_dir=final_dir)
+             for mock, final_dir in zip(mocks, final_dirs)]
+    download_package_util.update_packages_concurrently(stubs)
+
+    self.assertTrue(all(mock.post_update for mock in mocks))
+    for final_dir in final_dirs:
+      with open(os.path.join(final_dir, 'file')) as f:
+        self.assertEquals('content', f.read())
+    with open(os.path.join(self._cache_base_path, 'contents.json')) as f:
+      self.assertEquals(['a', 'b'], sorted(json.load(f)['cache']))
+
+  def test_update_packages_concurrently_failure(self):
+    self._setup_deps('v1')
+    stubs = [
+        self._create_stub(DownloadFailedMock(self), link_subdir='sub',
+                          final_dir=os.path.join(self._final_dir, 'a')),
+        self._create_stub(NoUpdateMock(self), link_subdir='sub',
+                          final_dir=os.path.join(self._final_dir, 'b')),
+    ]
+    self._setup_cache('v1')
+    self.assertRaises(AssertionError,
+                      download_package_util.update_packages_concurrently,
+                      stubs)
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -6,6 +6,7 @@ import atexit
 import cStringIO
 import errno
 import glob as _glob  # To avoid conflict with glob() defined in this module.
+import hashlib
 import itertools
 import logging
 import os
@@ -84,6 +85,15 @@ def remove_file_force(filename):
       raise
 
 
+def compute_file_digest(path):
+  """Returns the SHA-1 hex digest of the contents of |path|."""
+  digest = hashlib.sha1()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(65536), ''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
 def read_metadata_file(path):
   """Read given metadata file into a list.
 
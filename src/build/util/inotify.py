@@ -0,0 +1,137 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A minimal wrapper of Linux inotify API to watch changes in directories."""
+
+import collections
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+
+
+# Constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 02000000
+
+# Events which mean the contents of the directory, or a file in it, are
+# changed.
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+               IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+               IN_MOVE_SELF)
+
+# struct inotify_event without the trailing name.
+_EVENT_HEADER = struct.Struct('iIII')
+
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _get_libc():
+  global _libc
+  if _libc is None:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+  return _libc
+
+
+def _raise_os_error():
+  error = ctypes.get_errno()
+  raise OSError(error, os.strerror(error))
+
+
+class QueueOverflowError(Exception):
+  """Raised when the kernel dropped events, so changes may be missed."""
+
+
+class Watcher(object):
+  """Watches directories, and reports the paths changed in them.
+
+  Note that a directory is watched by its inode, so the same directory can be
+  watched via multiple paths, e.g. via symbolic links in out/staging. The
+  changes are reported for each of such paths.
+  """
+
+  def __init__(self):
+    self._fd = _get_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self._fd < 0:
+      _raise_os_error()
+    self._wd_to_paths = collections.defaultdict(set)
+    self._watched_paths = set()
+
+  def fileno(self):
+    return self._fd
+
+  def close(self):
+    if self._fd >= 0:
+      os.close(self._fd)
+      self._fd = -1
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def add_watch(self, path):
+    """Starts watching the directory at |path|.
+
+    Returns False if |path| is not an existing directory.
+    """
+    if path in self._watched_paths:
+      return True
+    wd = _get_libc().inotify_add_watch(self._fd, path,
+                                       _WATCH_MASK | IN_ONLYDIR)
+    if wd < 0:
+      if ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR):
+        return False
+      _raise_os_error()
+    self._wd_to_paths[wd].add(path)
+    self._watched_paths.add(path)
+    return True
+
+  def get_watched_paths(self):
+    return self._watched_paths
+
+  def read_changed_paths(self):
+    """Returns a set of the paths changed since the last call.
+
+    This does not block. If the kernel dropped some events because of the
+    queue overflow, QueueOverflowError is raised.
+    """
+    changed_paths = set()
+    while True:
+      try:
+        data = os.read(self._fd, _READ_SIZE)
+      except OSError as e:
+        if e.errno == errno.EAGAIN:
+          return changed_paths
+        raise
+      offset = 0
+      while offset < len(data):
+        wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        name = data[offset:offset + name_length].rstrip('\0')
+        offset += name_length
+        if mask & IN_Q_OVERFLOW:
+          raise QueueOverflowError()
+        if mask & IN_IGNORED:
+          # The directory is removed or no longer watched.
+          self._watched_paths.difference_update(self._wd_to_paths.pop(wd, ()))
+          continue
+        for path in self._wd_to_paths.get(wd, ()):
+          changed_paths.add(os.path.join(path, name) if name else path)
@@ -0,0 +1,71 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for inotify.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.build.util import inotify
+
+
+def _write(path, content):
+  with open(path, 'w') as f:
+    f.write(content)
+
+
+class TestWatcher(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._watcher = inotify.Watcher()
+
+  def tearDown(self):
+    self._watcher.close()
+    shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+  def test_no_change(self):
+    self.assertTrue(self._watcher.add_watch(self._tmpdir))
+    self.assertEquals(set(), self._watcher.read_changed_paths())
+
+  def test_file_changes(self):
+    path = os.path.join(self._tmpdir, 'foo')
+    _write(path, 'foo')
+    self._watcher.add_watch(self._tmpdir)
+
+    _write(path, 'bar')
+    self.assertEquals({path}, self._watcher.read_changed_paths())
+    self.assertEquals(set(), self._watcher.read_changed_paths())
+
+    os.remove(path)
+    self.assertEquals({path}, self._watcher.read_changed_paths())
+
+  def test_missing_directory(self):
+    self.assertFalse(self._watcher.add_watch(
+        os.path.join(self._tmpdir, 'missing')))
+
+  def test_symlinked_directory(self):
+    link = os.path.join(self._tmpdir, 'link')
+    os.symlink(self._tmpdir, link)
+    self._watcher.add_watch(self._tmpdir)
+    self._watcher.add_watch(link)
+
+    _write(os.path.join(self._tmpdir, 'foo'), 'foo')
+    self.assertEquals({os.path.join(self._tmpdir, 'foo'),
+                       os.path.join(link, 'foo')},
+                      self._watcher.read_changed_paths())
+
+  def test_removed_directory(self):
+    subdir = os.path.join(self._tmpdir, 'subdir')
+    os.mkdir(subdir)
+    self._watcher.add_watch(subdir)
+
+    os.rmdir(subdir)
+    self.assertIn(subdir, self._watcher.read_changed_paths())
+    self.assertNotIn(subdir, self._watcher.get_watched_paths())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -247,7 +247,8 @@ _START_MESSAGE_PATTERN = re.compile(
 
 
 class PerfTestHandler(concurrent_subprocess.OutputHandler):
-  def __init__(self, parsed_args, stats, chrome_process, cache_warming=False):
+  def __init__(self, parsed_args, stats, chrome_process, cache_warming=False,
+               profiler=None):
     super(PerfTestHandler, self).__init__()
     self.parsed_args = parsed_args
     self.in_exception = False
@@ -259,6 +260,7 @@ class PerfTestHandler(concurrent_subprocess.OutputHandler):
     self.full_output = []
     self.resumed_time = None
     self.chrome_process = chrome_process
+    self.profiler = profiler
 
   def handle_timeout(self):
     if not self.reached_done:
@@ -307,6 +309,8 @@ class PerfTestHandler(concurrent_subprocess.OutputHandler):
 
   def handle_stderr(self, line):
     self._handle_line_common(line)
+    if self.profiler:
+      self.profiler.handle_line(line)
     if self._parse_pre_plugin_perf_message(line):
       return
 
@@ -0,0 +1,173 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Keeps the history of perftest results in a local SQLite database.
+
+Every run of "launch_chrome perftest" appends its samples to the database
+with the build tag, the configure options and the host, so that a run can be
+compared with the preceding runs of the same setup without a dashboard
+service. The database is append-only.
+"""
+
+import collections
+import os
+import sqlite3
+import time
+
+from src.build import build_common
+from src.build.util import file_util
+from src.build.util import statistics
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  timestamp REAL NOT NULL,
+  build_tag TEXT NOT NULL,
+  configure_options TEXT NOT NULL,
+  host TEXT NOT NULL,
+  label TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_setup
+  ON runs (label, configure_options, host);
+CREATE TABLE IF NOT EXISTS samples (
+  run_id INTEGER NOT NULL REFERENCES runs (id),
+  name TEXT NOT NULL,
+  value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_run_id ON samples (run_id);
+"""
+
+# Metrics checked for regressions. A larger value is worse for all of them.
+REGRESSION_METRICS = ['boot_time_ms', 'plugin_load_time_ms', 'app_virt_mem',
+                      'app_res_mem', 'app_pdirt_mem']
+
+# |samples| is a dict from a metric name to the list of its values.
+Run = collections.namedtuple(
+    'Run', ['id', 'timestamp', 'build_tag', 'configure_options', 'host',
+            'label', 'samples'])
+
+Regression = collections.namedtuple(
+    'Regression', ['name', 'baseline_median', 'median', 'diff_lower',
+                   'diff_upper', 'p_value'])
+
+
+def get_default_path():
+  return os.path.join(build_common.OUT_DIR, 'perf_results.db')
+
+
+def get_build_tag():
+  """Returns the version of the current build, or 'unknown'.
+
+  The version file written by configure is read instead of running git, as
+  perftest may run in a stashed copy or on a remote host without the git
+  repository.
+  """
+  try:
+    with open(build_common.get_build_version_path()) as f:
+      return f.read().strip() or 'unknown'
+  except IOError:
+    return 'unknown'
+
+
+class PerfResultsStore(object):
+  def __init__(self, path):
+    file_util.makedirs_safely(os.path.dirname(os.path.abspath(path)))
+    self._connection = sqlite3.connect(path)
+    self._connection.executescript(_SCHEMA)
+
+  def close(self):
+    self._connection.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def add_run(self, samples, build_tag, configure_options, host, label,
+              timestamp=None):
+    """Appends a run with |samples|, a dict from a metric name to its values.
+
+    Returns the ID of the added run.
+    """
+    if timestamp is None:
+      timestamp = time.time()
+    with self._connection:
+      cursor = self._connection.execute(
+          'INSERT INTO runs '
+          '(timestamp, build_tag, configure_options, host, label) '
+          'VALUES (?, ?, ?, ?, ?)',
+          (timestamp, build_tag, configure_options, host, label))
+      run_id = cursor.lastrowid
+      self._connection.executemany(
+          'INSERT INTO samples (run_id, name, value) VALUES (?, ?, ?)',
+          ((run_id, name, value)
+           for name, values in sorted(samples.iteritems())
+           for value in values))
+    return run_id
+
+  def get_setups(self):
+    """Returns a list of distinct (label, configure_options, host) tuples."""
+    return self._connection.execute(
+        'SELECT DISTINCT label, configure_options, host FROM runs '
+        'ORDER BY label, configure_options, host').fetchall()
+
+  def get_runs(self, label=None, configure_options=None, host=None,
+               limit=None):
+    """Returns a list of the runs matching the conditions, newest first."""
+    conditions = []
+    params = []
+    for column, value in (('label', label),
+                          ('configure_options', configure_options),
+                          ('host', host)):
+      if value is not None:
+        conditions.append('%s = ?' % column)
+        params.append(value)
+    query = ('SELECT id, timestamp, build_tag, configure_options, host, label '
+             'FROM runs')
+    if conditions:
+      query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id DESC'
+    if limit is not None:
+      query += ' LIMIT ?'
+      params.append(limit)
+    rows = self._connection.execute(query, params).fetchall()
+    return [Run(*(row + (self._get_samples(row[0]),))) for row in rows]
+
+  def _get_samples(self, run_id):
+    samples = collections.defaultdict(list)
+    for name, value in self._connection.execute(
+        'SELECT name, value FROM samples WHERE run_id = ? ORDER BY rowid',
+        (run_id,)):
+      samples[name].append(value)
+    return dict(samples)
+
+
+def find_regressions(run, baseline_runs, confidence_level=95,
+                     significance_level=0.05, threshold=2.):
+  """Returns a list of Regression of |run| against |baseline_runs|.
+
+  The samples of the baseline runs are pooled. A metric regresses when the
+  Mann-Whitney U test rejects that it is unchanged at |significance_level|,
+  and the lower end of the confidence interval of the increase of the median
+  is more than |threshold| percent of the baseline median.
+  """
+  regressions = []
+  for name in REGRESSION_METRICS:
+    sample = run.samples.get(name)
+    baseline_sample = sum((baseline_run.samples.get(name, [])
+                           for baseline_run in baseline_runs), [])
+    if not sample or not baseline_sample:
+      continue
+    _, p_value = statistics.compute_mann_whitney_u_test(baseline_sample,
+                                                        sample)
+    diff_lower, diff_upper = statistics.bootstrap_difference_interval(
+        baseline_sample, sample, confidence_level)
+    baseline_median = statistics.compute_median(baseline_sample)
+    if (p_value < significance_level and
+        diff_lower > abs(baseline_median) * threshold / 100.):
+      regressions.append(Regression(
+          name, baseline_median, statistics.compute_median(sample),
+          diff_lower, diff_upper, p_value))
+  return regressions
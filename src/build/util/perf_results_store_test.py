@@ -0,0 +1,78 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for perf_results_store.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.build.util import perf_results_store
+
+
+def _make_samples(boot_time_ms, res_mem):
+  return {
+      'boot_time_ms': [boot_time_ms + i % 5 for i in xrange(20)],
+      'app_res_mem': [res_mem + i % 3 * 0.1 for i in xrange(20)],
+  }
+
+
+class PerfResultsStoreTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._path = os.path.join(self._tmpdir, 'out', 'perf_results.db')
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def _add_run(self, store, samples, label='foo.apk', host='host'):
+    return store.add_run(samples, 'arc-1', '--opt', host, label)
+
+  def test_add_and_get_runs(self):
+    with perf_results_store.PerfResultsStore(self._path) as store:
+      self._add_run(store, {'boot_time_ms': [3, 1, 2]})
+      self._add_run(store, {'boot_time_ms': [4]}, host='other')
+
+    # Runs are kept across the connections.
+    with perf_results_store.PerfResultsStore(self._path) as store:
+      second_id = self._add_run(store, {'boot_time_ms': [5], 'app_res_mem': []})
+      self.assertEquals([('foo.apk', '--opt', 'host'),
+                         ('foo.apk', '--opt', 'other')], store.get_setups())
+
+      runs = store.get_runs(host='host')
+      self.assertEquals([second_id, second_id - 2], [run.id for run in runs])
+      self.assertEquals({'boot_time_ms': [5]}, runs[0].samples)
+      self.assertEquals({'boot_time_ms': [3, 1, 2]}, runs[1].samples)
+      self.assertEquals('arc-1', runs[1].build_tag)
+
+      self.assertEquals(3, len(store.get_runs()))
+      self.assertEquals([second_id],
+                        [run.id for run in store.get_runs(limit=1)])
+      self.assertEquals([], store.get_runs(label='bar.apk'))
+
+  def test_find_regressions(self):
+    with perf_results_store.PerfResultsStore(self._path) as store:
+      for _ in xrange(3):
+        self._add_run(store, _make_samples(1000, 50))
+      self._add_run(store, _make_samples(1001, 60))
+      runs = store.get_runs()
+
+    regressions = perf_results_store.find_regressions(runs[0], runs[1:])
+    # The boot time increases only by 0.1%.
+    self.assertEquals(['app_res_mem'],
+                      [regression.name for regression in regressions])
+    regression = regressions[0]
+    self.assertAlmostEqual(50.1, regression.baseline_median)
+    self.assertAlmostEqual(60.1, regression.median)
+    self.assertTrue(regression.diff_lower > 9)
+    self.assertTrue(regression.p_value < 0.05)
+
+    # Improvements are not regressions.
+    self.assertEquals([], perf_results_store.find_regressions(runs[1],
+                                                              [runs[0]]))
+
+
+if __name__ == '__main__':
+  unittest.main()
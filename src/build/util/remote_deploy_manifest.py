@@ -0,0 +1,107 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Keeps track of the files deployed to a directory on a remote host.
+
+The manifest records the content hash of each deployed file, so that the next
+deployment sends only the files which have changed since then, and removes the
+files which are no longer deployed. The local stat of each file is recorded
+too, so that a file is not hashed again unless it has been touched.
+
+The manifest has an ID which is also written to the remote directory. If the
+IDs do not match, e.g. the remote host has been rebooted and its /tmp has been
+cleaned, the manifest does not describe the remote directory any more.
+"""
+
+import errno
+import hashlib
+import marshal
+import os
+import re
+import uuid
+
+from src.build import build_common
+from src.build.util import file_util
+
+# The name of the file in the remote directory which has the manifest ID.
+REMOTE_ID_FILE = '.arc_deploy_id'
+
+_MANIFEST_VERSION = 0
+
+_READ_SIZE = 1024 * 1024
+
+
+def get_manifest_path(user, remote, port, remote_dest_root):
+  name = '%s@%s:%s:%s' % (user, remote, port or '', remote_dest_root)
+  return os.path.join(build_common.OUT_DIR, 'remote_deploy_manifests',
+                      re.sub(r'[^\w.@-]', '_', name))
+
+
+def _compute_sha1(path):
+  digest = hashlib.sha1()
+  with open(path, 'rb') as f:
+    while True:
+      data = f.read(_READ_SIZE)
+      if not data:
+        break
+      digest.update(data)
+  return digest.hexdigest()
+
+
+class DeployManifest(object):
+  def __init__(self, deploy_id=None, files=None):
+    self.deploy_id = deploy_id or uuid.uuid4().hex
+    # A map from a deployed path to a tuple of the local source path, its size
+    # and mtime, and the SHA-1 of the content.
+    self._files = files or {}
+
+  @staticmethod
+  def load(path):
+    """Loads the manifest, or returns None if it is not available."""
+    try:
+      with open(path, 'rb') as f:
+        data = marshal.load(f)
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return None
+      raise
+    except (EOFError, ValueError, TypeError):
+      return None
+    if data.get('version') != _MANIFEST_VERSION:
+      return None
+    return DeployManifest(data['deploy_id'], data['files'])
+
+  def save(self, path):
+    data = {
+        'version': _MANIFEST_VERSION,
+        'deploy_id': self.deploy_id,
+        'files': self._files,
+    }
+    file_util.makedirs_safely(os.path.dirname(path))
+    file_util.generate_file_atomically(path, lambda f: marshal.dump(data, f))
+
+  def update(self, deploy_files):
+    """Updates the manifest to |deploy_files| and returns the difference.
+
+    |deploy_files| is a dict from a path relative to the remote directory to
+    the local source path of the file.
+
+    Returns a tuple of the sorted list of the paths which need to be sent, and
+    the sorted list of the paths which need to be removed from the remote
+    directory.
+    """
+    files = {}
+    changed_paths = []
+    for path, source_path in sorted(deploy_files.iteritems()):
+      stat = os.stat(source_path)
+      entry = self._files.get(path)
+      if not entry or entry[:3] != (source_path, stat.st_size, stat.st_mtime):
+        digest = _compute_sha1(source_path)
+        if not entry or entry[3] != digest:
+          changed_paths.append(path)
+        entry = (source_path, stat.st_size, stat.st_mtime, digest)
+      files[path] = entry
+    removed_paths = sorted(set(self._files) - set(files))
+    self._files = files
+    return changed_paths, removed_paths
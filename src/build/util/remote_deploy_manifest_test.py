@@ -0,0 +1,76 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for remote_deploy_manifest.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.build.util import remote_deploy_manifest
+
+
+class DeployManifestTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def _write(self, name, content, mtime=100):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    os.utime(path, (mtime, mtime))
+    return path
+
+  def test_update(self):
+    foo = self._write('foo', 'foo')
+    bar = self._write('bar', 'bar')
+    stripped_bar = self._write('stripped_bar', 'stripped bar')
+    manifest = remote_deploy_manifest.DeployManifest()
+    self.assertEquals((['bar', 'foo'], []),
+                      manifest.update({'foo': foo, 'bar': bar}))
+    self.assertEquals(([], []), manifest.update({'foo': foo, 'bar': bar}))
+
+    # Touching a file without changing its content does not send it.
+    self._write('foo', 'foo', mtime=200)
+    self.assertEquals(([], []), manifest.update({'foo': foo, 'bar': bar}))
+    self._write('foo', 'FOO', mtime=300)
+    self.assertEquals((['foo'], []), manifest.update({'foo': foo, 'bar': bar}))
+
+    # Switching to the stripped binary sends it.
+    self.assertEquals((['bar'], []),
+                      manifest.update({'foo': foo, 'bar': stripped_bar}))
+    self.assertEquals(([], ['bar']), manifest.update({'foo': foo}))
+
+  def test_save_and_load(self):
+    path = os.path.join(self._tmpdir, 'manifests', 'manifest')
+    self.assertIsNone(remote_deploy_manifest.DeployManifest.load(path))
+
+    foo = self._write('foo', 'foo')
+    manifest = remote_deploy_manifest.DeployManifest()
+    manifest.update({'foo': foo})
+    manifest.save(path)
+
+    loaded = remote_deploy_manifest.DeployManifest.load(path)
+    self.assertEquals(manifest.deploy_id, loaded.deploy_id)
+    self.assertEquals(([], []), loaded.update({'foo': foo}))
+    self.assertNotEquals(manifest.deploy_id,
+                         remote_deploy_manifest.DeployManifest().deploy_id)
+
+    with open(path, 'w') as f:
+      f.write('broken')
+    self.assertIsNone(remote_deploy_manifest.DeployManifest.load(path))
+
+  def test_get_manifest_path(self):
+    self.assertEquals(
+        os.path.join('out', 'remote_deploy_manifests', 'root@host_22__tmp_arc'),
+        remote_deploy_manifest.get_manifest_path('root', 'host', '22',
+                                                 '/tmp/arc'))
+
+
+if __name__ == '__main__':
+  unittest.main()
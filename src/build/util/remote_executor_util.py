@@ -9,13 +9,16 @@ Chrome OS, Windows (Cygwin), and Mac.
 """
 
 import atexit
+import contextlib
 import itertools
 import logging
 import os
 import pipes
 import shutil
 import subprocess
+import tarfile
 import tempfile
+import time
 
 from src.build import build_common
 from src.build import toolchain
@@ -26,6 +29,7 @@ from src.build.util import gdb_util
 from src.build.util import jdb_util
 from src.build.util import logging_util
 from src.build.util import minidump_filter
+from src.build.util import remote_deploy_manifest
 from src.build.util.test import unittest_util
 
 RUN_UNITTEST = 'src/build/run_unittest.py'
@@ -70,6 +74,8 @@ _INTEGRATION_TEST_GLOB_TEMPLATE_LIST = [
     # The following two files are needed only for 901-perf test.
     '{out}/staging/android/art/test/901-perf/README.benchmark',
     '{out}/staging/android/art/test/901-perf/test_cases',
+    # Used to select the suites affected by --changed-files.
+    '{out}/target/{target}/dependency_graph',
     '{out}/target/{target}/integration_tests',
     '{out}/target/{target}/root/system/usr/icu/icudt48l.dat',
     '{out}/target/{target}/intermediates/libarttest_so/libarttest.so',
@@ -125,6 +131,11 @@ _PROTECT_GLOB_TEMPLATE_LIST = [
     '{out}/adb',
 ]
 
+# If more files than this are removed since the last deploy, the remote
+# directory is synchronized by rsync instead, as they are removed by a command
+# line.
+_MAX_REMOVED_FILES_IN_DELTA = 1000
+
 # Flags to remove when launching Chrome on remote host.
 _REMOTE_FLAGS = ['--nacl-helper-nonsfi-binary', '--remote', '--ssh-key']
 
@@ -262,6 +273,13 @@ class RemoteExecutor(object):
     - Files newly created in the remote machine will be deleted. Specifically,
       if a file in the host machine is deleted, the corresponding file in the
       remote machine is also deleted after the rsync.
+    - What is sent is recorded in a local manifest per remote directory. Once
+      the remote directory is known to match the manifest, only the files
+      whose contents have changed are sent, in a tar stream, and only the
+      files sent before but not in the sending list any more are deleted.
+      Files modified in the remote machine are not restored then. The remote
+      directory is synchronized by rsync again when it does not match the
+      manifest, e.g. after the remote machine is rebooted.
 
     Args:
         source_paths: a list of paths to be sent. Each path can be a file or
@@ -273,8 +291,37 @@ class RemoteExecutor(object):
             sending path list. Similar to |source_paths|, if a path is
             directory, all paths under the directory will be excluded.
     """
+    exclude_paths = exclude_paths or []
+    deploy_files = self._list_deploy_files(source_paths, exclude_paths)
+    manifest_path = remote_deploy_manifest.get_manifest_path(
+        self._user, self._remote, self._port, remote_dest_root)
+    manifest = remote_deploy_manifest.DeployManifest.load(manifest_path)
+    if (manifest and
+        self._read_remote_deploy_id(remote_dest_root) == manifest.deploy_id):
+      changed_paths, removed_paths = manifest.update(deploy_files)
+      if len(removed_paths) <= _MAX_REMOVED_FILES_IN_DELTA:
+        self._send_delta(remote_dest_root, deploy_files, changed_paths,
+                         removed_paths)
+        manifest.save(manifest_path)
+        return
+
+    # The remote directory is unknown. Synchronize everything by rsync and
+    # start a new manifest.
+    self._rsync_all(source_paths, remote_dest_root, exclude_paths,
+                    deploy_files)
+    manifest = remote_deploy_manifest.DeployManifest()
+    manifest.update(deploy_files)
+    self._run_ssh_command('echo %s > %s' % (
+        manifest.deploy_id,
+        pipes.quote(os.path.join(remote_dest_root,
+                                 remote_deploy_manifest.REMOTE_ID_FILE))))
+    manifest.save(manifest_path)
+
+  def _rsync_all(self, source_paths, remote_dest_root, exclude_paths,
+                 deploy_files):
+    """Sends all the files by rsync, and removes other remote files."""
     filter_list = (
-        self._build_rsync_filter_list(source_paths, exclude_paths or []))
+        self._build_rsync_filter_list(source_paths, exclude_paths))
     rsync_options = [
         # The remote files need to be writable and executable by chronos. This
         # option sets read, write, and execute permissions to all users.
@@ -291,24 +338,12 @@ class RemoteExecutor(object):
         '--times',
     ]
     dest = '%s@%s:%s' % (self._user, self._remote, remote_dest_root)
-    # Checks both whether to enable debug info and the existence of the stripped
-    # directory because build bots using test bundle may use the configure
-    # option with debug info enabled but binaries are not available in the
-    # stripped directory.
-    unstripped_paths = None
-    if (OPTIONS.is_debug_info_enabled() and
-        os.path.exists(build_common.get_stripped_dir())):
-      # When debug info is enabled, copy the corresponding stripped binaries if
-      # available to save the disk space on ChromeOS.
-      list_output = _run_command(
-          subprocess.check_output,
-          ['rsync'] + filter_list + ['.', dest] + rsync_options +
-          ['--list-only'])
-      paths = [
-          line.rsplit(' ', 1)[-1] for line in list_output.splitlines()[1:]]
-      unstripped_paths = [
-          path for path in paths if self._has_stripped_binary(path)]
-
+    # The files which have the corresponding stripped binaries are sent from
+    # the stripped directory. See _list_deploy_files().
+    unstripped_paths = sorted(
+        path for path, source_path in deploy_files.iteritems()
+        if source_path != path)
+    if unstripped_paths:
       # here, prepend filter rules to "protect" and "exclude" the files which
       # have the corresponding stripped binary.
       # Note: the stripped binraies will be sync'ed by the second rsync
@@ -339,6 +374,108 @@ class RemoteExecutor(object):
                     dest_build] + rsync_options,
                    input='\n'.join(stripped_binary_relative_paths))
 
+  def _list_deploy_files(self, source_paths, exclude_paths):
+    """Lists the files rsync() sends.
+
+    Returns a dict from the path of each file to send, relative to the remote
+    destination directory, to the local path to send it from. The filtering is
+    the same as _build_rsync_filter_list(), and symbolic links are followed as
+    rsync's --copy-links does.
+    If debug info is enabled and there is a corresponding stripped binary, it is
+    sent instead of the original (unstripped) binary.
+    """
+    # Checks both whether to enable debug info and the existence of the stripped
+    # directory because build bots using test bundle may use the configure
+    # option with debug info enabled but binaries are not available in the
+    # stripped directory.
+    use_stripped_binaries = (
+        OPTIONS.is_debug_info_enabled() and
+        os.path.exists(build_common.get_stripped_dir()))
+    exclude_paths = set(os.path.normpath(path) for path in exclude_paths)
+
+    def is_excluded(path):
+      name = os.path.basename(path)
+      return (path in exclude_paths or name.endswith('.pyc') or
+              bool(build_common.COMMON_EDITOR_TMP_FILE_REG.match(name)))
+
+    def add_file(path):
+      if use_stripped_binaries and self._has_stripped_binary(path):
+        result[path] = os.path.join(
+            build_common.get_stripped_dir(),
+            os.path.relpath(path, build_common.get_build_dir()))
+      else:
+        result[path] = path
+
+    result = {}
+    for source_path in source_paths:
+      source_path = os.path.normpath(source_path)
+      if any(is_excluded(path)
+             for path in file_util.walk_ancestor(source_path)):
+        continue
+      if os.path.isfile(source_path):
+        add_file(source_path)
+        continue
+      for dirpath, dirnames, filenames in os.walk(source_path,
+                                                  followlinks=True):
+        dirnames[:] = [name for name in dirnames
+                       if not is_excluded(os.path.join(dirpath, name))]
+        for name in filenames:
+          path = os.path.join(dirpath, name)
+          if not is_excluded(path) and os.path.isfile(path):
+            add_file(path)
+    return result
+
+  def _read_remote_deploy_id(self, remote_dest_root):
+    """Returns the ID of the deploy manifest written in the remote directory."""
+    try:
+      return self._run_ssh_command(
+          'cat %s 2>/dev/null || true' % pipes.quote(os.path.join(
+              remote_dest_root, remote_deploy_manifest.REMOTE_ID_FILE)),
+          func=subprocess.check_output).strip()
+    except subprocess.CalledProcessError:
+      return None
+
+  def _send_delta(self, remote_dest_root, deploy_files, changed_paths,
+                  removed_paths):
+    """Sends |changed_paths| and removes |removed_paths| in one ssh session.
+
+    The files are sent as a tar stream through the shared ssh connection.
+    """
+    logging.info('Sending %d changed files and removing %d files in %s',
+                 len(changed_paths), len(removed_paths), remote_dest_root)
+    if not changed_paths and not removed_paths:
+      return
+    commands = ['mkdir -p ' + pipes.quote(remote_dest_root),
+                'cd ' + pipes.quote(remote_dest_root)]
+    if changed_paths:
+      commands.append('tar -x --no-same-owner -f -')
+    if removed_paths:
+      commands.append(
+          'rm -f -- ' + ' '.join(pipes.quote(path) for path in removed_paths))
+    process = self._run_ssh_command(
+        ' && '.join(commands), func=subprocess.Popen,
+        extra_options=['-o', 'Compression=yes'], stdin=subprocess.PIPE)
+    try:
+      if changed_paths:
+        _write_tar(process.stdin, deploy_files, changed_paths)
+    finally:
+      process.stdin.close()
+      returncode = process.wait()
+    if returncode:
+      raise subprocess.CalledProcessError(returncode, 'tar')
+
+  def _run_ssh_command(self, cmd, func=subprocess.check_call,
+                       extra_options=None, **kwargs):
+    """Runs |cmd| on the remote host without a pseudo terminal.
+
+    Unlike run(), the command does not run in the remote ARC root, so that it
+    can be used before the directory exists.
+    """
+    ssh_cmd = (['ssh', '%s@%s' % (self._user, self._remote)] +
+               self._build_shared_command_options() + ['-T'] +
+               (extra_options or []) + ['--', cmd])
+    return _run_command(func, ssh_cmd, **kwargs)
+
   def _build_rsync_filter_list(self, source_paths, exclude_paths):
     """Builds rsync's filter options to send |source_paths|.
 
@@ -527,6 +664,33 @@ class RemoteExecutor(object):
     return ssh_cmd
 
 
+def _write_tar(fileobj, deploy_files, paths):
+  """Writes a tar stream of |paths| to |fileobj|.
+
+  The files and their parent directories are readable, writable, and
+  executable by all users, as rsync() does with --chmod=a=rwx.
+  """
+  with contextlib.closing(tarfile.open(fileobj=fileobj, mode='w|',
+                                       dereference=True)) as tar:
+    directories = sorted(set(itertools.chain.from_iterable(
+        itertools.islice(file_util.walk_ancestor(path), 1, None)
+        for path in paths)))
+    for directory in directories:
+      info = tarfile.TarInfo(directory)
+      info.type = tarfile.DIRTYPE
+      info.mode = 0777
+      info.mtime = time.time()
+      tar.addfile(info)
+    for path in paths:
+      source_path = deploy_files[path]
+      info = tar.gettarinfo(source_path, path)
+      info.mode = 0777
+      info.uid = info.gid = 0
+      info.uname = info.gname = ''
+      with open(source_path, 'rb') as f:
+        tar.addfile(info, f)
+
+
 def _get_command(*args, **kwargs):
   """Returns command line from Popen's arguments."""
   command = kwargs.get('args')
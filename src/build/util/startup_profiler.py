@@ -0,0 +1,225 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Profiles a launch of Chrome phase by phase for perftest.
+
+While Chrome runs, the memory and the CPU usage of Chrome and its descendant
+processes, including the NaCl helper running ARC, are sampled from /proc at a
+fixed interval. The phase markers printed by arc::Performance::Print() are
+parsed from the output. The result is written as a timeline in Chrome's trace
+event format, which can be opened in chrome://tracing.
+"""
+
+import os
+import re
+import threading
+import time
+
+from src.build.util import trace_event_stream
+
+# The default sampling interval in seconds.
+DEFAULT_INTERVAL = 0.05
+
+# A line printed by arc::Performance::Print(), e.g.
+# 0.512s + 1.234s = 1.746s (+12.3M virt, +4.5M res): Activity onResume
+# The times are the plugin start, the time since the plugin start, and the
+# total, relative to the app launch.
+_PHASE_MARKER_PATTERN = re.compile(
+    r'(?P<pre_plugin>\d+\.\d+)s \+ \d+\.\d+s = (?P<total>\d+\.\d+)s '
+    r'\(\+(?P<virt_mem>[\d.]+)M virt, \+(?P<res_mem>[\d.]+)M res.*\): '
+    r'(?P<description>.*\S)')
+
+_PRE_PLUGIN_PERF_MESSAGE_PATTERN = re.compile(
+    r'Time spent before plugin: '
+    r'(?P<pre_plugin>\d+)ms = (?P<pre_embed>\d+)ms \+ (?P<plugin_load>\d+)ms')
+
+# The pseudo process ID under which the phases are shown.
+_PHASES_PID = 0
+
+
+def _read_process_stat(pid):
+  """Returns the name, parent PID, CPU ticks, vsize and RSS pages of |pid|."""
+  with open('/proc/%d/stat' % pid) as f:
+    stat = f.read()
+  # The name may contain spaces and parentheses.
+  name = stat[stat.index('(') + 1:stat.rindex(')')]
+  fields = stat[stat.rindex(')') + 2:].split()
+  return (name, int(fields[1]), int(fields[11]) + int(fields[12]),
+          int(fields[20]), int(fields[21]))
+
+
+def _read_process_tree_stats(root_pid):
+  """Returns a dict from a PID to the stat of |root_pid| and descendants."""
+  stats = {}
+  for entry in os.listdir('/proc'):
+    if not entry.isdigit():
+      continue
+    try:
+      stats[int(entry)] = _read_process_stat(int(entry))
+    except (IOError, OSError, ValueError):
+      # The process has exited.
+      pass
+
+  children = {}
+  for pid, stat in stats.iteritems():
+    children.setdefault(stat[1], []).append(pid)
+  result = {}
+  pending = [root_pid]
+  while pending:
+    pid = pending.pop()
+    if pid in stats:
+      result[pid] = stats[pid]
+      pending.extend(children.get(pid, []))
+  return result
+
+
+class StartupProfiler(object):
+  """Samples the processes of a Chrome and collects the phase markers.
+
+  Usage:
+
+    profiler = StartupProfiler(chrome_process.pid)
+    profiler.start()
+    ... call handle_line() for each line of the Chrome output ...
+    profiler.stop()
+    profiler.write(path)
+  """
+
+  def __init__(self, chrome_pid, interval=DEFAULT_INTERVAL):
+    self._chrome_pid = chrome_pid
+    self._interval = interval
+    self._start_time = None
+    self._stop_event = threading.Event()
+    self._thread = None
+    self._lock = threading.Lock()
+    # A list of (time, {pid: stat}) tuples.
+    self._samples = []
+    # A list of (time observed, match of _PHASE_MARKER_PATTERN) tuples.
+    self._phase_markers = []
+    self._pre_plugin_message = None
+
+  def start(self):
+    self._start_time = time.time()
+    self._thread = threading.Thread(target=self._run_sampler,
+                                    name='StartupProfiler')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    if not self._thread:
+      return
+    self._stop_event.set()
+    self._thread.join()
+    self._thread = None
+
+  def _run_sampler(self):
+    while True:
+      try:
+        sample = _read_process_tree_stats(self._chrome_pid)
+      except OSError:
+        # /proc is not available.
+        return
+      with self._lock:
+        self._samples.append((time.time(), sample))
+      if self._stop_event.wait(self._interval):
+        return
+
+  def handle_line(self, line):
+    """Collects a phase marker in a line of the Chrome output."""
+    match = _PHASE_MARKER_PATTERN.search(line)
+    if match:
+      with self._lock:
+        self._phase_markers.append((time.time(), match))
+      return
+    match = _PRE_PLUGIN_PERF_MESSAGE_PATTERN.search(line)
+    if match:
+      with self._lock:
+        self._pre_plugin_message = (time.time(), match)
+
+  def _to_timestamp(self, t):
+    """Converts time.time() to a timestamp in the trace in microseconds."""
+    return int((t - self._start_time) * 1000000)
+
+  def _get_launch_time(self):
+    """Estimates the time.time() of the app launch.
+
+    The markers are relative to the app launch, which is estimated from the
+    earliest marker as the output reaches here with some delay.
+    """
+    estimates = [observed - float(match.group('total'))
+                 for observed, match in self._phase_markers]
+    if self._pre_plugin_message:
+      observed, match = self._pre_plugin_message
+      estimates.append(observed - int(match.group('pre_plugin')) / 1000.)
+    return min(estimates) if estimates else None
+
+  def _get_phase_events(self):
+    launch_time = self._get_launch_time()
+    if launch_time is None:
+      return []
+
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': _PHASES_PID,
+               'args': {'name': 'Startup phases'}}]
+
+    def add_phase(name, begin, end, args=None):
+      event = {'name': name, 'cat': 'phase', 'ph': 'X', 'pid': _PHASES_PID,
+               'tid': 0, 'ts': self._to_timestamp(launch_time + begin),
+               'dur': int((end - begin) * 1000000)}
+      if args:
+        event['args'] = args
+      events.append(event)
+
+    if self._pre_plugin_message:
+      match = self._pre_plugin_message[1]
+      pre_embed = int(match.group('pre_embed')) / 1000.
+      pre_plugin = int(match.group('pre_plugin')) / 1000.
+      add_phase('preEmbed', 0, pre_embed)
+      add_phase('pluginLoad', pre_embed, pre_plugin)
+
+    begin = None
+    for _, match in self._phase_markers:
+      if begin is None:
+        begin = float(match.group('pre_plugin'))
+      end = float(match.group('total'))
+      add_phase(match.group('description'), begin, end, {
+          'virt_mem_mb': float(match.group('virt_mem')),
+          'res_mem_mb': float(match.group('res_mem')),
+      })
+      begin = end
+    return events
+
+  def _get_sample_events(self):
+    events = []
+    names = {}
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    ticks_per_second = float(os.sysconf('SC_CLK_TCK'))
+    previous_time = None
+    previous_sample = {}
+    for t, sample in self._samples:
+      ts = self._to_timestamp(t)
+      for pid, (name, _, ticks, vsize, rss) in sorted(sample.iteritems()):
+        names[pid] = name
+        events.append({'name': 'Memory', 'ph': 'C', 'pid': pid, 'ts': ts,
+                       'args': {'res_mb': rss * page_size / 1024. / 1024,
+                                'virt_mb': vsize / 1024. / 1024}})
+        if pid in previous_sample and t > previous_time:
+          cpu_seconds = (ticks - previous_sample[pid][2]) / ticks_per_second
+          events.append({'name': 'CPU', 'ph': 'C', 'pid': pid, 'ts': ts,
+                         'args': {'percent':
+                                  cpu_seconds / (t - previous_time) * 100}})
+      previous_time = t
+      previous_sample = sample
+    for pid, name in sorted(names.iteritems()):
+      events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                     'args': {'name': name}})
+    return events
+
+  def get_trace_events(self):
+    """Returns the timeline as a list of trace events."""
+    with self._lock:
+      return self._get_phase_events() + self._get_sample_events()
+
+  def write(self, path):
+    with open(path, 'w') as f:
+      trace_event_stream.write_events(iter(self.get_trace_events()), f)
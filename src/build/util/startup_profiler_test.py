@@ -0,0 +1,86 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for startup_profiler.py."""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from src.build.util import startup_profiler
+
+
+class StartupProfilerTest(unittest.TestCase):
+  def test_read_process_tree_stats(self):
+    child = subprocess.Popen(['sleep', '10'])
+    try:
+      stats = startup_profiler._read_process_tree_stats(os.getpid())
+    finally:
+      child.kill()
+      child.wait()
+    self.assertIn(os.getpid(), stats)
+    name, parent_pid, _, vsize, rss = stats[child.pid]
+    self.assertEquals('sleep', name)
+    self.assertEquals(os.getpid(), parent_pid)
+    self.assertTrue(vsize > 0 and rss > 0)
+
+  def test_trace_events(self):
+    profiler = startup_profiler.StartupProfiler(os.getpid(), interval=0.01)
+    profiler.start()
+    profiler.handle_line(
+        '[123] W/libplugin: Time spent before plugin: 500ms = 200ms + 300ms\n')
+    profiler.handle_line('0.500s + 0.250s = 0.750s '
+                         '(+10.0M virt, +2.5M res): Runtime initialized\n')
+    profiler.handle_line('unrelated line\n')
+    profiler.handle_line('0.500s + 1.000s = 1.500s '
+                         '(+20.0M virt, +5.0M res): Activity onResume\n')
+    time.sleep(0.05)
+    profiler.stop()
+    events = profiler.get_trace_events()
+
+    phases = [event for event in events
+              if event['ph'] == 'X' and event['pid'] == 0]
+    self.assertEquals(
+        [('preEmbed', 200000), ('pluginLoad', 300000),
+         ('Runtime initialized', 250000), ('Activity onResume', 750000)],
+        [(event['name'], event['dur']) for event in phases])
+    for previous, event in zip(phases, phases[1:]):
+      self.assertAlmostEqual(previous['ts'] + previous['dur'], event['ts'],
+                             delta=1)
+    self.assertEquals({'virt_mem_mb': 20.0, 'res_mem_mb': 5.0},
+                      phases[-1]['args'])
+
+    memory_events = [event for event in events if event['name'] == 'Memory']
+    self.assertTrue(len(memory_events) >= 2)
+    self.assertTrue(all(event['pid'] == os.getpid()
+                        for event in memory_events))
+    self.assertTrue(memory_events[0]['args']['res_mb'] > 0)
+    self.assertTrue(any(event['name'] == 'CPU' for event in events))
+    self.assertIn({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                   'args': {'name': startup_profiler._read_process_stat(
+                       os.getpid())[0]}}, events)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir, 'startup.json')
+      profiler.write(path)
+      with open(path) as f:
+        self.assertEquals(len(events), len(json.load(f)['traceEvents']))
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_no_markers(self):
+    profiler = startup_profiler.StartupProfiler(os.getpid())
+    profiler.start()
+    profiler.stop()
+    events = profiler.get_trace_events()
+    self.assertFalse(any(event['ph'] == 'X' for event in events))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -32,7 +32,7 @@ class StartupStats:
     return self.pre_plugin_time_ms + self.on_resume_time_ms
 
 
-def _build_raw_stats(stats_list):
+def build_raw_stats(stats_list):
   """Builds a dict from stat key to a list of stat values."""
   raw_stats = collections.defaultdict(list)
   for stats in stats_list:
@@ -44,7 +44,7 @@ def _build_raw_stats(stats_list):
 
 def print_raw_stats(stats):
   """Prints the VRAWPERF= line of the given |stats|."""
-  print 'VRAWPERF=%s' % dict(_build_raw_stats([stats]))
+  print 'VRAWPERF=%s' % dict(build_raw_stats([stats]))
 
 
 def print_aggregated_stats(stats_list):
@@ -53,7 +53,7 @@ def print_aggregated_stats(stats_list):
   # enough runs to make up for an occasional missed run.
   stat_list = [stats for stats in stats_list if stats.is_complete()]
 
-  raw_stats = _build_raw_stats(stats_list)
+  raw_stats = build_raw_stats(stats_list)
 
   # Builds a dict from key to (median, 90-percentile).
   aggregated_stats = {
@@ -4,6 +4,15 @@
 
 """Utility functions which compute statistical values."""
 
+import math
+import random
+
+try:
+  import numpy
+except ImportError:
+  # NumPy is optional. The bootstrap falls back to pure Python without it.
+  numpy = None
+
 
 def compute_average(values):
   if not values:
@@ -44,3 +53,104 @@ def compute_percentiles(values, percentiles=(50, 90)):
       d.append(((100 - w) * values[idx] +
                 w * values[idx + 1]) / 100.0)
   return tuple(d)
+
+
+_STATISTIC_FUNCTIONS = {
+    'average': compute_average,
+    'median': compute_median,
+}
+
+_NUMPY_STATISTIC_FUNCTIONS = {
+    'average': 'mean',
+    'median': 'median',
+}
+
+
+def _resample_statistics_python(sample, statistic, num_resamples, rng):
+  function = _STATISTIC_FUNCTIONS[statistic]
+  n = len(sample)
+  return [function([sample[int(rng.random() * n)] for _ in xrange(n)])
+          for _ in xrange(num_resamples)]
+
+
+def _resample_statistics_numpy(sample, statistic, num_resamples, rng):
+  sample = numpy.asarray(sample, dtype=float)
+  resamples = sample[rng.randint(0, len(sample),
+                                 size=(num_resamples, len(sample)))]
+  return getattr(numpy, _NUMPY_STATISTIC_FUNCTIONS[statistic])(
+      resamples, axis=1)
+
+
+def bootstrap_difference_interval(ctrl_sample, expt_sample, confidence_level,
+                                  statistic='median', num_resamples=1000,
+                                  seed=None):
+  """Estimates the range of the difference of a statistic by Bootstrap.
+
+  Returns the |100 - confidence_level| and |confidence_level| percentiles of
+  the bootstrap distribution of statistic(expt_sample) -
+  statistic(ctrl_sample) as a tuple. |statistic| is either 'average' or
+  'median'. All the resamples are computed at once with NumPy if it is
+  available.
+  """
+  if not ctrl_sample or not expt_sample:
+    return (float('NaN'), float('NaN'))
+  percentiles = (100 - confidence_level, confidence_level)
+  if numpy:
+    rng = numpy.random.RandomState(seed)
+    distribution = (
+        _resample_statistics_numpy(expt_sample, statistic, num_resamples,
+                                   rng) -
+        _resample_statistics_numpy(ctrl_sample, statistic, num_resamples,
+                                   rng))
+    # The default linear interpolation of numpy.percentile is the same as
+    # compute_percentiles().
+    return tuple(float(v) for v in numpy.percentile(distribution,
+                                                    percentiles))
+  rng = random.Random(seed)
+  distribution = [
+      expt - ctrl for expt, ctrl in zip(
+          _resample_statistics_python(expt_sample, statistic, num_resamples,
+                                      rng),
+          _resample_statistics_python(ctrl_sample, statistic, num_resamples,
+                                      rng))]
+  return compute_percentiles(distribution, percentiles)
+
+
+def compute_mann_whitney_u_test(ctrl_sample, expt_sample):
+  """Performs the two-sided Mann-Whitney U test.
+
+  Returns the U statistic of |expt_sample|, which is the number of pairs in
+  which the value of |expt_sample| is greater than the one of |ctrl_sample|
+  (ties count half), and the p-value as a tuple. The p-value is computed by the
+  normal approximation with the tie and continuity corrections, which is good
+  enough for samples with 10 or more values.
+  """
+  n1 = len(ctrl_sample)
+  n2 = len(expt_sample)
+  if not n1 or not n2:
+    return (float('NaN'), float('NaN'))
+  n = n1 + n2
+  values = sorted([(value, False) for value in ctrl_sample] +
+                  [(value, True) for value in expt_sample])
+  expt_rank_sum = 0.
+  tie_sum = 0
+  begin = 0
+  while begin < n:
+    end = begin + 1
+    while end < n and values[end][0] == values[begin][0]:
+      end += 1
+    # The tied values at [begin, end) get the average of their ranks, which
+    # are 1-origin.
+    rank = (begin + 1 + end) * 0.5
+    expt_rank_sum += rank * sum(1 for i in xrange(begin, end) if values[i][1])
+    tie_sum += (end - begin) ** 3 - (end - begin)
+    begin = end
+
+  u = expt_rank_sum - n2 * (n2 + 1) * 0.5
+  mean = n1 * n2 * 0.5
+  variance = n1 * n2 / 12. * ((n + 1) - float(tie_sum) / (n * (n - 1)))
+  if variance <= 0:
+    # All the values are equal.
+    return (u, 1.)
+  z = max(abs(u - mean) - 0.5, 0) / math.sqrt(variance)
+  return (u, min(math.erfc(z / math.sqrt(2)), 1.))
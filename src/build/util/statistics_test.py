@@ -7,6 +7,8 @@
 import math
 import unittest
 
+import mock
+
 from src.build.util import statistics
 
 
@@ -48,6 +50,40 @@ class TestStatUtil(unittest.TestCase):
                       statistics.compute_percentiles([6, 7, 15, 36, 39, 40,
                                                       41, 42, 43]))
 
+  def _check_bootstrap_difference_interval(self):
+    lower, upper = statistics.bootstrap_difference_interval(
+        [10, 11, 12, 13, 14] * 4, [20, 21, 22, 23, 24] * 4, 90, seed=0)
+    self.assertTrue(8 <= lower <= upper <= 12, (lower, upper))
+    lower, upper = statistics.bootstrap_difference_interval(
+        [1, 2, 3] * 10, [1, 2, 3] * 10, 90, statistic='average', seed=0)
+    self.assertTrue(-1 < lower <= 0 <= upper < 1, (lower, upper))
+    self.assertEquals((5, 5), statistics.bootstrap_difference_interval(
+        [1], [6], 90, seed=0))
+    self.assertTrue(all(map(math.isnan,
+                            statistics.bootstrap_difference_interval(
+                                [], [1], 90))))
+
+  def test_bootstrap_difference_interval(self):
+    self._check_bootstrap_difference_interval()
+
+  def test_bootstrap_difference_interval_without_numpy(self):
+    with mock.patch('src.build.util.statistics.numpy', None):
+      self._check_bootstrap_difference_interval()
+
+  def test_compute_mann_whitney_u_test(self):
+    # The p-values are by the normal approximation with the corrections.
+    u, p = statistics.compute_mann_whitney_u_test([1, 2, 3, 4, 5],
+                                                  [6, 7, 8, 9, 10])
+    self.assertEquals(25, u)
+    self.assertAlmostEqual(0.012185, p, places=5)
+    u, p = statistics.compute_mann_whitney_u_test([1, 2, 2, 3], [2, 3, 3, 4])
+    self.assertEquals(13, u)
+    self.assertAlmostEqual(0.172034, p, places=5)
+    self.assertEquals((2, 1), statistics.compute_mann_whitney_u_test(
+        [1, 1], [1, 1]))
+    self.assertTrue(all(map(math.isnan,
+                            statistics.compute_mann_whitney_u_test([], [1]))))
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -35,6 +35,10 @@ _BARE_METAL_FILTER_PATTERN = re.compile('|'.join(
 # The remote directory where test files are written.
 _TEST_FILES_LOCATION = '/data/run-test'
 
+# The dalvik-cache entries compiled from the jars in _TEST_FILES_LOCATION. The
+# entries are in the subdirectory for the instruction set.
+_TEST_FILES_DALVIK_CACHE_PATTERN = '/data/dalvik-cache/*/data@run-test@*'
+
 
 def _cleanup_output(raw):
   if OPTIONS.is_nacl_build():
@@ -159,32 +163,53 @@ class ArtTestRunner(suite_runner.SuiteRunnerBase):
     prep_launch_chrome.prepare_crx_with_raw_args(args)
 
   def run(self, test_methods_to_run, scoreboard):
-    for case_name in test_methods_to_run:
-      output = None
-      with system_mode.SystemMode(self) as arc:
-        self._push_test_files(arc)
-        begin_time = time.time()
-        output = self._run_test(arc, case_name)
-        elapsed_time = time.time() - begin_time
-
-      # At this point, output can be None because evil SystemMode.__exit__()
-      # quietly suppress an exception raised from SystemMode.run_adb()!
-      if output is None:
-        # In this case, arc.run_adb() should have recorded some logs
-        # which will be retrieved by arc.get_log() later.
-        result = test_method_result.TestMethodResult(
-            case_name, test_method_result.TestMethodResult.FAIL)
-
-      elif self._is_benchmark:
-        self._logger.write(
-            'Benchmark %s: %d ms\n' % (case_name, elapsed_time * 1000))
-        result = test_method_result.TestMethodResult(
-            case_name, test_method_result.TestMethodResult.PASS)
-
-      else:
-        result = self._check_output(case_name, output)
-
-      scoreboard.update([result])
+    # The test cases share a booted system mode, and the test files are pushed
+    # only when a new one is booted. The files left by a test case are removed
+    # before the next one runs.
+    with system_mode.SystemModePool(
+        self, setup=self._push_test_files,
+        reset=self._remove_test_outputs) as pool:
+      for case_name in test_methods_to_run:
+        output = None
+        with pool.lease() as arc:
+          begin_time = time.time()
+          output = self._run_test(arc, case_name)
+          elapsed_time = time.time() - begin_time
+
+        # At this point, output can be None because evil SystemMode.__exit__()
+        # quietly suppress an exception raised from SystemMode.run_adb()!
+        if output is None:
+          # In this case, arc.run_adb() should have recorded some logs
+          # which will be retrieved by arc.get_log() later.
+          result = test_method_result.TestMethodResult(
+              case_name, test_method_result.TestMethodResult.FAIL)
+
+        elif self._is_benchmark:
+          self._logger.write(
+              'Benchmark %s: %d ms\n' % (case_name, elapsed_time * 1000))
+          result = test_method_result.TestMethodResult(
+              case_name, test_method_result.TestMethodResult.PASS)
+
+        else:
+          result = self._check_output(case_name, output)
+
+        scoreboard.update([result])
+
+  def _get_test_files(self):
+    """Returns the paths of the files pushed to _TEST_FILES_LOCATION."""
+    test_file = os.path.join(self._work_dir, '%s.jar' % self._suite_name)
+    assert os.access(test_file, os.R_OK), (
+        'can not read a test file %s' % test_file)
+    test_files = [test_file]
+    test_ex_file = os.path.join(self._work_dir, '%s-ex.jar' % self._suite_name)
+    if os.access(test_ex_file, os.R_OK):
+      test_files.append(test_ex_file)
+    # Shared libraries needed for ART integration tests but not installed in
+    # the official runtime. We set LD_LIBRARY_PATH later to use them.
+    test_files.append(build_common.get_build_path_for_library('libarttest.so'))
+    test_files.append(
+        build_common.get_build_path_for_library('libnativebridgetest.so'))
+    return test_files
 
   def _push_test_files(self, arc):
     """Pushes test files via ADB.
@@ -195,24 +220,29 @@ class ArtTestRunner(suite_runner.SuiteRunnerBase):
     Args:
       arc: SystemMode object.
     """
-    test_file = os.path.join(self._work_dir, '%s.jar' % self._suite_name)
-    assert os.access(test_file, os.R_OK), (
-        'can not read a test file %s' % test_file)
     arc.run_adb(['shell', 'mkdir', _TEST_FILES_LOCATION])
-    arc.run_adb(['push', test_file, _TEST_FILES_LOCATION])
-    test_ex_file = os.path.join(self._work_dir, '%s-ex.jar' % self._suite_name)
-    if os.access(test_ex_file, os.R_OK):
-      arc.run_adb(['push', test_ex_file, _TEST_FILES_LOCATION])
-    # Push shared libraries needed for ART integration tests but not installed
-    # in the official runtime. We set LD_LIBRARY_PATH later to use them.
-    arc.run_adb(
-        ['push',
-         build_common.get_build_path_for_library('libarttest.so'),
-         _TEST_FILES_LOCATION])
-    arc.run_adb(
-        ['push',
-         build_common.get_build_path_for_library('libnativebridgetest.so'),
-         _TEST_FILES_LOCATION])
+    for test_file in self._get_test_files():
+      arc.run_adb(['push', test_file, _TEST_FILES_LOCATION])
+
+  def _remove_test_outputs(self, arc):
+    """Removes the files written by a test case via ADB.
+
+    The files in _TEST_FILES_LOCATION other than the pushed ones, and the
+    dalvik-cache entries compiled from the test jars are removed, so that the
+    next test case runs as on a newly booted system mode.
+
+    Args:
+      arc: SystemMode object.
+    """
+    test_file_names = set(
+        os.path.basename(test_file) for test_file in self._get_test_files())
+    output = arc.run_adb(['shell', 'ls', '-a', _TEST_FILES_LOCATION])
+    remove_paths = [
+        os.path.join(_TEST_FILES_LOCATION, name)
+        for name in output.split()
+        if name not in test_file_names and name not in ('.', '..')]
+    arc.run_adb(['shell', 'rm', '-r', '-f', _TEST_FILES_DALVIK_CACHE_PATTERN] +
+                remove_paths)
 
   def _run_test(self, arc, case_name):
     """Runs the test case.
@@ -76,6 +76,9 @@ class AtfSuiteRunnerBase(suite_runner.SuiteRunnerBase):
   def set_extra_args(self, extra_args):
     self._extra_args = extra_args
 
+  def get_build_dependencies(self):
+    return filter(None, [self._test_apk, self._target_apk])
+
   def handle_output(self, line):
     self._result_parser.process_line(line)
     # We need to check if _scoreboard_updater exists as CtsMediaStressTestCases
@@ -150,3 +153,10 @@ class AtfSuiteRunner(AtfSuiteRunnerBase):
     super(AtfSuiteRunner, self).__init__(
         test_name, test_apk,
         suite_runner_util.read_test_list(test_list_path), **kwargs)
+
+  def is_shardable(self):
+    # Each run launches its own CRX named after the run name, and nothing else
+    # is shared among the runs. Subclasses, such as the CTS runners, may
+    # prepare or share other files, so they are not sharded unless they are
+    # verified to be independent and opt in by themselves.
+    return type(self) is AtfSuiteRunner and self._name_override is None
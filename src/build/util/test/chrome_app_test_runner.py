@@ -30,6 +30,10 @@ class ChromeAppTestRunner(suite_runner.SuiteRunnerBase):
         **kwargs)
     self._unpacked_dir = unpacked_dir
 
+  def get_build_dependencies(self):
+    return [build_common.get_integration_test_list_path(
+        'chrome_app_test_' + self._name)]
+
   def handle_output(self, line):
     self._result_parser.process_line(line)
 
@@ -59,6 +59,11 @@ class JavaScriptTestRunner(suite_runner.SuiteRunnerBase):
     self._apks = apks
     self._additional_launch_chrome_args = additional_launch_chrome_args
 
+  def get_build_dependencies(self):
+    return self._apks + [
+        build_common.get_integration_test_list_path('test_template_' +
+                                                    self._name)]
+
   def handle_output(self, line):
     self._result_parser.process_line(line)
 
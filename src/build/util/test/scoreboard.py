@@ -25,14 +25,21 @@ class Scoreboard:
       _SHOULD_PASS: scoreboard_constants.EXPECTED_PASS,
   }
 
-  def __init__(self, name, expectations):
+  def __init__(self, name, expectations, suite_name=None):
+    # The name of the run, which is also the name of the file in the output
+    # directory which has the raw output. For a shard of a suite, this is
+    # distinct from the other shards.
     self._name = name
+    # The name of the suite, which names its tests.
+    self._suite_name = suite_name or name
     self._complete_count = 0
     self._restart_count = 0
     self._start_time = None
     self._end_time = None
     self._expectations = {}
     self._results = {}
+    # The duration in seconds of each test, if reported by the suite runner.
+    self._durations = {}
 
     # Once a test has not been completed twice, it will be 'blacklisted' so
     # that the SuiteRunner can skip it going forward.
@@ -146,6 +153,8 @@ class Scoreboard:
       actual = self._determine_actual_status(result, expect)
       self._set_result(test.name, actual)
       self._complete_count += 1
+      if test.duration:
+        self._durations[test.name] = test.duration
       suite_results.report_update_test(self, test.name, actual, test.duration)
 
   def finalize(self):
@@ -165,6 +174,10 @@ class Scoreboard:
   def name(self):
     return self._name
 
+  @property
+  def suite_name(self):
+    return self._suite_name
+
   @property
   def duration(self):
     start_time = self._start_time or time.time()
@@ -219,6 +232,10 @@ class Scoreboard:
   def restarts(self):
     return self._restart_count
 
+  def get_test_durations(self):
+    """Returns a dict from a test name to its duration in seconds."""
+    return self._durations.copy()
+
   def get_flaky_tests(self):
     return self._get_list(scoreboard_constants.EXPECTED_FLAKE)
 
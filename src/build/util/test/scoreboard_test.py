@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 import collections
+import cStringIO
 import unittest
 
 from src.build.util.test import flags
@@ -546,6 +547,23 @@ class ScoreboardTests(unittest.TestCase):
     self.assertEquals(
         scoreboard_constants.EXPECTED_FLAKE, expectations['testFlaky'])
 
+  def test_shards_are_told_apart_by_name(self):
+    shards = [scoreboard.Scoreboard('suite.shard%d' % i, {},
+                                    suite_name='suite')
+              for i in xrange(2)]
+    self.assertEquals(['suite', 'suite'],
+                      [shard.suite_name for shard in shards])
+    self.assertEquals('suite',
+                      scoreboard.Scoreboard('suite', {}).suite_name)
+
+    logfile = cStringIO.StringIO()
+    results = suite_results.SuiteResultsPrepare(logfile)
+    for shard in shards:
+      results.finish_test(shard, 'test', scoreboard_constants.EXPECTED_PASS, 0)
+    self.assertEquals(
+        'Preparing: suite.shard0\nPreparing: suite.shard1\n',
+        logfile.getvalue())
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -750,7 +750,7 @@ class SuiteResultsBuildBot(SuiteResultsBase):
     result = []
     for scoreboard in self._all_suites:
       # TODO(lpique): Make _get_list public.
-      result.extend('%s:%s' % (scoreboard.name, test_name)
+      result.extend('%s:%s' % (scoreboard.suite_name, test_name)
                     for test_name in scoreboard._get_list(status))
     return result
 
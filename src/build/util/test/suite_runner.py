@@ -4,6 +4,7 @@
 
 """Defines the integration test interface to running a suite of tests."""
 
+import copy
 import fnmatch
 import json
 import os
@@ -187,6 +188,8 @@ class SuiteRunnerBase(object):
 
     self._lock = threading.Lock()
     self._name = name
+    # The index of the shard if this runs a part of the suite, or None.
+    self._shard_index = None
     self._terminated = False
     self._deadline = merged_config.pop('deadline')
     self._bug = merged_config.pop('bug')
@@ -213,6 +216,17 @@ class SuiteRunnerBase(object):
     """Returns the name of this test runner."""
     return self._name
 
+  @property
+  def run_name(self):
+    """Returns the name of this run, which is distinct among the shards.
+
+    This is used to name the files and the CRX of the run, while the results
+    are reported under |name|.
+    """
+    if self._shard_index is None:
+      return self._name
+    return '%s.shard%d' % (self._name, self._shard_index)
+
   @property
   def deadline(self):
     """Returns the deadline the test should run in."""
@@ -243,6 +257,41 @@ class SuiteRunnerBase(object):
   def is_runnable(self):
     return True
 
+  def is_shardable(self):
+    """Returns True if the tests can be split to run in parallel.
+
+    Overridden in actual implementations whose runs do not share any state,
+    such as files on the host, other than ones named after the runner name.
+    """
+    return False
+
+  def get_build_dependencies(self):
+    """Returns a list of the build outputs which the tests depend on.
+
+    This is used to select the suites affected by changed files. Returns None
+    if unknown, in which case the suite is always considered affected.
+    Overridden in actual implementations.
+    """
+    return None
+
+  def create_shard(self, shard_index, test_names):
+    """Returns a copy of this runner which handles only |test_names|.
+
+    The copy has a distinct run_name, so that it can run in parallel with the
+    other shards of the suite. This must be called before the runner is run.
+    """
+    assert self.is_shardable(), '%s cannot be sharded' % self._name
+    assert self._shard_index is None, '%s is a shard' % self._name
+    assert self._logger is None and self._subprocess is None, (
+        '%s has already run' % self._name)
+    # Deep-copy the runner so that no mutable state is shared with the other
+    # shards. A lock cannot be copied, so a new one is given instead.
+    shard = copy.deepcopy(self, {id(self._lock): threading.Lock()})
+    shard._shard_index = shard_index
+    shard._expectation_map = dict(
+        (name, self._expectation_map[name]) for name in test_names)
+    return shard
+
   def prepare(self, test_methods_to_run):
     """Overridden in actual implementations to do preparations on the host.
 
@@ -340,7 +389,7 @@ class SuiteRunnerBase(object):
     args = launch_chrome_util.get_launch_chrome_command()
     if mode:
       args.append(mode)
-    name = name_override if name_override else self._name
+    name = name_override if name_override else self.run_name
     args.extend(['--crx-name-override=' + name,
                  '--noninja',
                  '--disable-sleep-on-blur'])
@@ -425,7 +474,7 @@ class SuiteRunnerBase(object):
     args_dir = os.path.join(build_common.get_build_dir(), 'integration_tests')
     file_util.makedirs_safely(args_dir)
 
-    args_file = os.path.join(args_dir, self._name + '_args')
+    args_file = os.path.join(args_dir, self.run_name + '_args')
     with open(args_file, 'w') as f:
       f.write(args_string)
     return args[:-len(remaining_args)] + ['@' + args_file]
@@ -3,14 +3,18 @@
 # found in the LICENSE file.
 
 import copy
+import errno
 import glob
+import hashlib
 import imp
+import marshal
 import os.path
 import re
 import sys
 
 from src.build import build_common
 from src.build.build_options import OPTIONS
+from src.build.util import file_util
 from src.build.util.test import flags
 
 # For use in the suite configuration files, to identify a default configuration
@@ -23,6 +27,8 @@ _DEFAULT_OUTPUT_TIMEOUT = 300
 # 'bug' field must be matched with the following pattern.
 _BUG_PATTERN = re.compile(r'crbug.com/\d+$')
 
+_EXPECTATIONS_CACHE_VERSION = 0
+
 
 def _validate(raw_config):
   """Validates raw_config dict.
@@ -219,13 +225,10 @@ def _evaluate_suite_test_expectations(raw_dict):
   return result
 
 
-def _read_test_config(path, on_bot, use_gpu, remote_host_type):
-  """Reads the file, and eval() it with the test config context."""
-  if not os.path.exists(path):
-    return {}
-
-  with open(path) as stream:
-    content = stream.read()
+def _eval_test_config(path, content, on_bot, use_gpu, remote_host_type,
+                      options=OPTIONS):
+  """eval() the |content| of the file at |path| with the test config context.
+  """
   test_context = {
       '__builtin__': None,  # Do not inherit the current context.
 
@@ -238,7 +241,7 @@ def _read_test_config(path, on_bot, use_gpu, remote_host_type):
       'LARGE': flags.FlagSet(flags.LARGE),
 
       # OPTIONS is commonly used for the conditions.
-      'OPTIONS': OPTIONS,
+      'OPTIONS': options,
 
       # Variables which can be used to check runtime configurations.
       'ON_BOT': on_bot,
@@ -293,30 +296,189 @@ def make_suite_run_configs(raw_config):
   return _deferred  # Defer to pick up runtime configuration options properly.
 
 
+class _RecordingOptions(object):
+  """Proxies OPTIONS, and records the values the expectation files read."""
+
+  def __init__(self):
+    # A map from (the attribute name, the arguments or None if the attribute
+    # is not called) to the value.
+    self.records = {}
+
+  def __getattr__(self, name):
+    value = getattr(OPTIONS, name)
+    if not callable(value):
+      self.records[name, None] = value
+      return value
+
+    def _call(*args):
+      result = value(*args)
+      self.records[name, args] = result
+      return result
+    return _call
+
+
+def _options_match(records):
+  """Returns True if OPTIONS still has the values in |records|."""
+  for (name, args), value in records.iteritems():
+    try:
+      current = getattr(OPTIONS, name)
+      if args is not None:
+        current = current(*args)
+    except (AttributeError, TypeError):
+      return False
+    if current != value:
+      return False
+  return True
+
+
+def _flag_set_to_int(flag_set):
+  return flag_set.status | flag_set.attribute
+
+
+def _serialize_config(config):
+  """Converts an evaluated config to a form which marshal can dump."""
+  data = dict(config)
+  data['flags'] = _flag_set_to_int(config['flags'])
+  data['suite_test_expectations'] = dict(
+      (name, _flag_set_to_int(flag_set)) for name, flag_set
+      in config['suite_test_expectations'].iteritems())
+  return data
+
+
+def _deserialize_config(data):
+  config = dict(data)
+  config['flags'] = flags.FlagSet(data['flags'])
+  config['suite_test_expectations'] = dict(
+      (name, flags.FlagSet(value)) for name, value
+      in data['suite_test_expectations'].iteritems())
+  return config
+
+
+def _read_file_or_none(path):
+  try:
+    with open(path) as stream:
+      return stream.read()
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return None
+    raise
+
+
+def get_expectations_cache_path(expectations_base_path):
+  """Returns the path to cache the expectations in |expectations_base_path|."""
+  return os.path.join(build_common.OUT_DIR, 'expectations_cache',
+                      re.sub(r'[^\w.-]', '_', expectations_base_path))
+
+
 # TODO(crbug.com/384028): The class will eventually eliminate the need for
 # make_suite_run_configs and default_run_configuration above.
 class SuiteExpectationsLoader(object):
-  def __init__(self, base_path, on_bot, use_gpu, remote_host_type):
+  """Loads the expectations of suites, merged with their parents.
+
+  If |cache_path| is given, the merged expectations are cached in the file.
+  A cache entry is used when the contents of the expectation file and its
+  parents, the runtime configurations, and the values of OPTIONS read while
+  evaluating them are not changed. Call save() to update the file.
+  """
+
+  def __init__(self, base_path, on_bot, use_gpu, remote_host_type,
+               cache_path=None):
     self._base_path = base_path
     self._on_bot = on_bot
     self._use_gpu = use_gpu
     self._remote_host_type = remote_host_type
     self._cache = {}
+    self._cache_path = cache_path
+    # A map from a partial suite name to (a digest of the expectation files
+    # and the runtime configurations, OPTIONS records, serialized config).
+    self._compiled = {}
+    self._compiled_is_updated = False
+    if cache_path:
+      self._compiled = self._load_compiled(cache_path)
+
+  @staticmethod
+  def _load_compiled(cache_path):
+    try:
+      with open(cache_path) as f:
+        data = marshal.load(f)
+    except (EOFError, ValueError, TypeError):
+      return {}
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return {}
+      raise
+    if data.get('version') != _EXPECTATIONS_CACHE_VERSION:
+      return {}
+    return data['entries']
+
+  def _get_context_key(self):
+    return repr((self._on_bot, self._use_gpu, self._remote_host_type,
+                 build_common.use_ndk_direct_execution()))
+
+  def _load(self, partial_name, parent):
+    """Returns (config, key, OPTIONS records) of |partial_name|."""
+    parent_config, parent_key, parent_records = parent
+    path = os.path.join(self._base_path, partial_name)
+    content = _read_file_or_none(path)
+    digest = hashlib.sha1(parent_key)
+    if content is not None:
+      digest.update('\0' + content)
+    key = digest.hexdigest()
+
+    compiled = self._compiled.get(partial_name)
+    if (compiled is not None and compiled[0] == key and
+        _options_match(compiled[1])):
+      return (_deserialize_config(compiled[2]), key, compiled[1])
+
+    options = _RecordingOptions()
+    raw_config = {}
+    if content is not None:
+      raw_config = _eval_test_config(path, content, self._on_bot,
+                                     self._use_gpu, self._remote_host_type,
+                                     options=options)
+    config = _evaluate(raw_config, defaults=parent_config)
+    records = dict(parent_records)
+    records.update(options.records)
+    if self._cache_path:
+      compiled = (key, records, _serialize_config(config))
+      try:
+        marshal.dumps(compiled)
+      except ValueError:
+        # The config has a value which cannot be cached.
+        self._compiled.pop(partial_name, None)
+      else:
+        self._compiled[partial_name] = compiled
+      self._compiled_is_updated = True
+    return (config, key, records)
 
   def get(self, suite_name):
-    parent_config = None
+    entry = (None, self._get_context_key(), {})
     components = suite_name.split('.')
     for i in xrange(1 + len(components)):
       partial_name = '.'.join(components[:i]) if i else 'defaults'
-      config = self._cache.get(partial_name)
-      if config is None:
-        raw_config = _read_test_config(
-            os.path.join(self._base_path, partial_name),
-            self._on_bot, self._use_gpu, self._remote_host_type)
-        config = _evaluate(raw_config, defaults=parent_config)
-        self._cache[partial_name] = config
-      parent_config = config
-    return config
+      parent = entry
+      entry = self._cache.get(partial_name)
+      if entry is None:
+        entry = self._load(partial_name, parent)
+        self._cache[partial_name] = entry
+    return entry[0]
+
+  def save(self):
+    """Saves the expectations loaded so far to the cache file if updated."""
+    if not self._cache_path:
+      return
+    # Drop the entries of the suites which are no longer defined.
+    entries = dict((name, compiled)
+                   for name, compiled in self._compiled.iteritems()
+                   if name in self._cache)
+    if not self._compiled_is_updated and len(entries) == len(self._compiled):
+      return
+    data = {'version': _EXPECTATIONS_CACHE_VERSION, 'entries': entries}
+    file_util.makedirs_safely(os.path.dirname(self._cache_path))
+    file_util.generate_file_atomically(self._cache_path,
+                                       lambda f: marshal.dump(data, f))
+    self._compiled = entries
+    self._compiled_is_updated = False
 
 
 def get_suite_definitions_module(suite_filename):
@@ -332,15 +494,18 @@ def load_from_suite_definitions(definitions_base_path,
                                 expectations_base_path,
                                 on_bot,
                                 use_gpu,
-                                remote_host_type):
+                                remote_host_type,
+                                cache_path=None):
   """Loads all the suite definitions from a given path.
 
   |definitions_base_path| gives the path to the python files to load.
   |expectations_base_path| gives the path to the expectation files to load,
   which are matched up with each suite automatically.
+  If |cache_path| is given, the evaluated expectations are cached in the file.
   """
   expectations_loader = SuiteExpectationsLoader(
-      expectations_base_path, on_bot, use_gpu, remote_host_type)
+      expectations_base_path, on_bot, use_gpu, remote_host_type,
+      cache_path=cache_path)
   runners = []
 
   definition_files = glob.glob(os.path.join(definitions_base_path, '*.py'))
@@ -353,4 +518,5 @@ def load_from_suite_definitions(definitions_base_path,
     definitions_module = get_suite_definitions_module(suite_filename)
     runners += definitions_module.get_integration_test_runners(
         expectations_loader)
+  expectations_loader.save()
   return runners
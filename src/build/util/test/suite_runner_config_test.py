@@ -3,8 +3,13 @@
 # found in the LICENSE file.
 
 import collections
+import os
+import shutil
+import tempfile
 import unittest
 
+import mock
+
 from src.build.build_options import OPTIONS
 from src.build.util.test import flags
 from src.build.util.test import suite_runner
@@ -223,5 +228,69 @@ class SuiteRunConfigIntegrationTests(unittest.TestCase):
         runner.apply_test_ordering(['xyzMethod', 'abcMethod', 'priMethod']))
 
 
+class SuiteExpectationsLoaderTest(unittest.TestCase):
+  def setUp(self):
+    OPTIONS.parse([])
+    self._tmpdir = tempfile.mkdtemp()
+    self._cache_path = os.path.join(self._tmpdir, 'cache', 'expectations')
+    patcher = mock.patch.object(suite_runner_config, '_eval_test_config',
+                                wraps=suite_runner_config._eval_test_config)
+    self._eval = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+    OPTIONS.parse([])
+
+  def _write(self, name, content):
+    with open(os.path.join(self._tmpdir, name), 'w') as f:
+      f.write(content)
+
+  def _load(self, suite_name, on_bot=False):
+    loader = suite_runner_config.SuiteExpectationsLoader(
+        self._tmpdir, on_bot, False, None, cache_path=self._cache_path)
+    config = loader.get(suite_name)
+    loader.save()
+    return config
+
+  def test_cache(self):
+    self._write('defaults', "{'deadline': 60}")
+    self._write('foo', "{'flags': FAIL, 'bug': 'crbug.com/1'}")
+    self._write('foo.bar', "{'suite_test_expectations': {'C#m': FLAKY}}")
+    config = self._load('foo.bar.baz')
+    self.assertEquals(3, self._eval.call_count)
+    self.assertEquals(60, config['deadline'])
+    self.assertEquals(flags.FlagSet(flags.FAIL), config['flags'])
+    self.assertEquals('crbug.com/1', config['bug'])
+    self.assertEquals({'C#m': flags.FlagSet(flags.FLAKY)},
+                      config['suite_test_expectations'])
+
+    self.assertEquals(config, self._load('foo.bar.baz'))
+    self.assertEquals(3, self._eval.call_count)
+
+    # Changing a parent invalidates its children.
+    self._write('foo', "{'flags': PASS}")
+    config = self._load('foo.bar.baz')
+    self.assertEquals(5, self._eval.call_count)
+    self.assertEquals(flags.FlagSet(flags.PASS), config['flags'])
+    self.assertIsNone(config['bug'])
+
+    # So does changing the runtime configurations.
+    self._load('foo.bar.baz', on_bot=True)
+    self.assertEquals(8, self._eval.call_count)
+
+  def test_cache_with_options(self):
+    self._write('defaults',
+                "{'configurations': [{'enable_if': OPTIONS.weird(),"
+                " 'flags': FAIL}]}")
+    self.assertEquals(flags.FlagSet(flags.PASS), self._load('foo')['flags'])
+    self.assertEquals(flags.FlagSet(flags.PASS), self._load('foo')['flags'])
+    self.assertEquals(1, self._eval.call_count)
+
+    OPTIONS.parse(['--weird'])
+    self.assertEquals(flags.FlagSet(flags.FAIL), self._load('foo')['flags'])
+    self.assertEquals(2, self._eval.call_count)
+
+
 if __name__ == '__main__':
   unittest.main()
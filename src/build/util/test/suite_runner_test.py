@@ -0,0 +1,50 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for suite_runner.py."""
+
+import unittest
+
+from src.build.build_options import OPTIONS
+from src.build.util.test import flags
+from src.build.util.test import suite_runner
+
+
+class _ShardableSuiteRunner(suite_runner.SuiteRunnerBase):
+  def is_shardable(self):
+    return True
+
+
+class SuiteRunnerTest(unittest.TestCase):
+  def setUp(self):
+    OPTIONS.parse([])
+
+  def test_create_shard(self):
+    runner = _ShardableSuiteRunner(
+        'suite', {'C#a': flags.FlagSet(flags.PASS),
+                  'C#b': flags.FlagSet(flags.PASS)},
+        config={'metadata': {'key': ['value']}})
+    shard = runner.create_shard(1, ['C#b'])
+
+    # Results are reported under the suite name, while the files of the run
+    # are named distinctly.
+    self.assertEquals('suite', shard.name)
+    self.assertEquals('suite.shard1', shard.run_name)
+    self.assertEquals('suite', runner.run_name)
+    self.assertEquals(['C#b'], shard.expectation_map.keys())
+    self.assertEquals(['C#a', 'C#b'], sorted(runner.expectation_map))
+
+    # No mutable state is shared.
+    self.assertIsNot(runner._lock, shard._lock)
+    shard._metadata['key'].append('shard')
+    self.assertEquals({'key': ['value']}, runner._metadata)
+
+  def test_non_shardable(self):
+    runner = suite_runner.SuiteRunnerBase('suite', {})
+    self.assertFalse(runner.is_shardable())
+    self.assertRaises(AssertionError, runner.create_shard, 0, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
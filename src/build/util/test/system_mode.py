@@ -6,7 +6,10 @@
 # It contains helper routines for running dalvikvm in system mode.
 #
 
+import contextlib
 import re
+import subprocess
+import sys
 import threading
 import traceback
 
@@ -256,3 +259,113 @@ class SystemMode(object):
 
   def has_error(self):
     return self._has_error or self._thread.has_error
+
+  def is_healthy(self):
+    """Returns whether the system mode can still run adb commands."""
+    if (self._thread is None or not self._thread.is_alive() or
+        not self._thread.is_ready or self.has_error()):
+      return False
+    try:
+      return 'ready' in self.run_adb(['shell', 'echo', 'ready'])
+    except subprocess.CalledProcessError:
+      return False
+
+
+class SystemModePool(object):
+  """Keeps a booted SystemMode to share among the test cases of a suite.
+
+  Booting ARC takes most of the time to run a short test case. The pool leases
+  the same SystemMode to the test cases one after another, and boots a new one
+  only after the previous one crashes or is left in an unexpected state.
+
+  Example:
+
+    def run(self, test_methods_to_run, scoreboard):
+      with SystemModePool(self, setup=self._push_test_files) as pool:
+        for test_method in test_methods_to_run:
+          with pool.lease() as arc:
+            print arc.run_adb(['shell', 'echo', test_method])
+  """
+
+  def __init__(self, suite_runner, additional_launch_chrome_opts=None,
+               rebuild_crx=False, setup=None, reset=None):
+    """Constructs the pool.
+
+    |suite_runner|, |additional_launch_chrome_opts| and |rebuild_crx| are
+    passed to SystemMode.
+    |setup| is called with each newly booted SystemMode, e.g. to push the files
+    used by all the test cases.
+    |reset| is called with the SystemMode after each lease, to restore the
+    state for the next test case. If it raises an exception, the SystemMode is
+    shut down, and the next lease boots a new one.
+    """
+    self._suite_runner = suite_runner
+    self._additional_launch_chrome_opts = additional_launch_chrome_opts
+    self._rebuild_crx = rebuild_crx
+    self._setup = setup
+    self._reset = reset
+    self._arc = None
+    self._num_boots = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback):
+    self.close()
+
+  @property
+  def num_boots(self):
+    """The number of the SystemMode instances booted by this pool."""
+    return self._num_boots
+
+  def _boot(self):
+    arc = SystemMode(
+        self._suite_runner,
+        additional_launch_chrome_opts=self._additional_launch_chrome_opts,
+        rebuild_crx=self._rebuild_crx)
+    arc.__enter__()
+    self._num_boots += 1
+    if self._setup:
+      try:
+        self._setup(arc)
+      except Exception:
+        arc.__exit__(*sys.exc_info())
+        raise
+    return arc
+
+  def _discard(self):
+    arc, self._arc = self._arc, None
+    if arc:
+      arc.__exit__(None, None, None)
+
+  @contextlib.contextmanager
+  def lease(self):
+    """Yields a healthy SystemMode, booting a new one if necessary.
+
+    If the body raises an exception, the SystemMode is shut down.
+    """
+    if self._arc and not self._arc.is_healthy():
+      self._suite_runner.logger.write(
+          'System mode is in an unexpected state. Rebooting.\n')
+      self._discard()
+    if not self._arc:
+      self._arc = self._boot()
+
+    arc = self._arc
+    try:
+      yield arc
+    except Exception:
+      self._discard()
+      raise
+
+    if self._reset:
+      try:
+        self._reset(arc)
+      except Exception:
+        self._suite_runner.logger.write(
+            'Failed to reset system mode: ' + traceback.format_exc())
+        self._discard()
+
+  def close(self):
+    """Shuts down the pooled SystemMode."""
+    self._discard()
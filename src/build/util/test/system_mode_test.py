@@ -0,0 +1,91 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for system_mode.SystemModePool."""
+
+import unittest
+
+import mock
+
+from src.build.util.test import system_mode
+
+
+class FakeSystemMode(object):
+  def __init__(self, *args, **kwargs):
+    self.healthy = True
+    self.entered = False
+    self.exited = False
+
+  def __enter__(self):
+    self.entered = True
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback):
+    self.exited = True
+
+  def is_healthy(self):
+    return self.healthy
+
+
+class SystemModePoolTest(unittest.TestCase):
+  def setUp(self):
+    patcher = mock.patch.object(system_mode, 'SystemMode', FakeSystemMode)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self._suite_runner = mock.Mock()
+    self._setup = mock.Mock()
+
+  def test_reuse(self):
+    with system_mode.SystemModePool(self._suite_runner,
+                                    setup=self._setup) as pool:
+      with pool.lease() as arc1:
+        pass
+      with pool.lease() as arc2:
+        pass
+      self.assertIs(arc1, arc2)
+      self.assertFalse(arc1.exited)
+    self.assertTrue(arc1.exited)
+    self.assertEquals(1, pool.num_boots)
+    self._setup.assert_called_once_with(arc1)
+
+  def test_reboot_when_unhealthy(self):
+    with system_mode.SystemModePool(self._suite_runner,
+                                    setup=self._setup) as pool:
+      with pool.lease() as arc1:
+        arc1.healthy = False
+      with pool.lease() as arc2:
+        pass
+    self.assertIsNot(arc1, arc2)
+    self.assertTrue(arc1.exited)
+    self.assertEquals(2, pool.num_boots)
+    self.assertEquals([mock.call(arc1), mock.call(arc2)],
+                      self._setup.call_args_list)
+
+  def test_reboot_after_exception(self):
+    with system_mode.SystemModePool(self._suite_runner) as pool:
+      with self.assertRaises(ValueError):
+        with pool.lease() as arc1:
+          raise ValueError()
+      self.assertTrue(arc1.exited)
+      with pool.lease() as arc2:
+        pass
+    self.assertIsNot(arc1, arc2)
+
+  def test_reboot_after_reset_failure(self):
+    reset = mock.Mock(side_effect=[None, Exception()])
+    with system_mode.SystemModePool(self._suite_runner, reset=reset) as pool:
+      with pool.lease() as arc1:
+        pass
+      with pool.lease() as arc2:
+        pass
+      self.assertIs(arc1, arc2)
+      self.assertTrue(arc1.exited)
+      with pool.lease() as arc3:
+        pass
+    self.assertIsNot(arc1, arc3)
+    self.assertEquals(2, pool.num_boots)
+
+
+if __name__ == '__main__':
+  unittest.main()
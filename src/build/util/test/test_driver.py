@@ -42,8 +42,11 @@ class TestDriver(object):
     self._run_remaining_count = try_count if tests_to_run else 0
     self._stop_on_unexpected_failures = stop_on_unexpected_failures
 
+    # Each shard of a suite has its own scoreboard, which is told apart from
+    # the other shards by the run name.
     self._scoreboard = scoreboard.Scoreboard(
-        suite_runner.name, suite_runner.expectation_map)
+        suite_runner.run_name, suite_runner.expectation_map,
+        suite_name=suite_runner.name)
 
     # Mark planned tests INCOMPLETE to distinguish them from skipped tests.
     self._scoreboard.reset_results(self._tests_to_run)
@@ -59,6 +62,10 @@ class TestDriver(object):
   def name(self):
     return self._suite_runner.name
 
+  @property
+  def suite_runner(self):
+    return self._suite_runner
+
   @property
   def deadline(self):
     return self._suite_runner.deadline
@@ -136,7 +143,7 @@ class TestDriver(object):
 
     with contextlib.closing(suite_runner.SuiteRunnerLogger(
         self._suite_runner.name,
-        os.path.join(args.output_dir, self._suite_runner.name),
+        os.path.join(args.output_dir, self._suite_runner.run_name),
         args.output == 'verbose')) as logger:
       trial = 0
       while not self.done and not self._suite_runner.terminated:
@@ -0,0 +1,62 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Records the durations of integration tests to schedule the next runs."""
+
+import errno
+import json
+import logging
+import os
+
+from src.build.util import file_util
+
+# The duration in seconds assumed for a test which has never been run.
+DEFAULT_TEST_DURATION = 10.
+
+
+class TestDurationHistory(object):
+  """Holds the durations of the tests in the last runs, stored in a file."""
+
+  def __init__(self, path):
+    self._path = path
+    # A map from a suite name to a map from a test name to its duration.
+    self._durations = {}
+    try:
+      with open(path) as f:
+        self._durations = json.load(f)
+    except IOError as e:
+      if e.errno != errno.ENOENT:
+        raise
+    except ValueError:
+      logging.warning('Ignoring broken test duration history: %s', path)
+
+  def estimate_test_durations(self, suite_name, test_names,
+                              default_suite_duration=None):
+    """Returns a dict from each of |test_names| to its expected duration.
+
+    The tests which have never been run are expected to take the average
+    duration of the other tests in the suite. If none of them has been run, the
+    |default_suite_duration| is divided evenly among the tests.
+    """
+    suite_durations = self._durations.get(suite_name, {})
+    known_durations = [suite_durations[name] for name in test_names
+                       if name in suite_durations]
+    if known_durations:
+      default = sum(known_durations) / len(known_durations)
+    elif default_suite_duration and test_names:
+      default = float(default_suite_duration) / len(test_names)
+    else:
+      default = DEFAULT_TEST_DURATION
+    return dict((name, suite_durations.get(name, default))
+                for name in test_names)
+
+  def update(self, suite_name, test_durations):
+    """Records |test_durations|, a dict from a test name to its duration."""
+    if test_durations:
+      self._durations.setdefault(suite_name, {}).update(test_durations)
+
+  def save(self):
+    file_util.makedirs_safely(os.path.dirname(self._path))
+    file_util.generate_file_atomically(
+        self._path, lambda f: json.dump(self._durations, f, sort_keys=True))
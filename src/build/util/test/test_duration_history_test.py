@@ -0,0 +1,57 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for test_duration_history.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.build.util.test import test_duration_history
+
+
+class TestDurationHistoryTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._path = os.path.join(self._tmpdir, 'out', 'durations.json')
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+  def test_no_history(self):
+    history = test_duration_history.TestDurationHistory(self._path)
+    self.assertEquals(
+        {'a': test_duration_history.DEFAULT_TEST_DURATION},
+        history.estimate_test_durations('suite', ['a']))
+    self.assertEquals(
+        {'a': 15, 'b': 15},
+        history.estimate_test_durations('suite', ['a', 'b'], 30))
+
+  def test_save_and_load(self):
+    history = test_duration_history.TestDurationHistory(self._path)
+    history.update('suite', {'a': 1., 'b': 3.})
+    history.save()
+
+    history = test_duration_history.TestDurationHistory(self._path)
+    # The unknown test is expected to take the average of the known ones.
+    self.assertEquals(
+        {'a': 1., 'b': 3., 'c': 2.},
+        history.estimate_test_durations('suite', ['a', 'b', 'c'], 100))
+    self.assertEquals(
+        {'a': test_duration_history.DEFAULT_TEST_DURATION},
+        history.estimate_test_durations('other_suite', ['a']))
+
+  def test_broken_file(self):
+    os.makedirs(os.path.dirname(self._path))
+    with open(self._path, 'w') as f:
+      f.write('{broken')
+    history = test_duration_history.TestDurationHistory(self._path)
+    self.assertEquals(
+        {'a': test_duration_history.DEFAULT_TEST_DURATION},
+        history.estimate_test_durations('suite', ['a']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -54,6 +54,9 @@ class UiAutomatorSuiteRunner(suite_runner.SuiteRunnerBase):
       args.extend(['-c', test_method])
     return args
 
+  def get_build_dependencies(self):
+    return [self._apk_path, self._jar_path]
+
   def handle_output(self, line):
     # Since some of our output comes from ADB we might have \r that would
     # normally be removed by the adb command.
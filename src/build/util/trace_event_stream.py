@@ -0,0 +1,177 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Processes Chrome trace events as a stream.
+
+Trace files from long runs can be hundreds of MB, so the events are parsed one
+by one from the file, processed by generators, and written out as they come.
+When the events need to be sorted, they are sorted in runs of a bounded size
+which are merged from temporary files.
+"""
+
+import heapq
+import itertools
+import json
+import re
+import tempfile
+
+_TRACE_EVENTS = 'traceEvents'
+
+_READ_SIZE = 1024 * 1024
+
+# The number of events sorted in memory at once.
+_MAX_EVENTS_IN_MEMORY = 100000
+
+_WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+
+
+class _JsonReader(object):
+  """Reads JSON values one by one from a file."""
+
+  def __init__(self, f):
+    self._file = f
+    self._buffer = ''
+    self._pos = 0
+    self._eof = False
+    self._decoder = json.JSONDecoder()
+
+  def _fill(self):
+    data = self._file.read(_READ_SIZE)
+    if not data:
+      self._eof = True
+      return
+    self._buffer = self._buffer[self._pos:] + data
+    self._pos = 0
+
+  def peek(self):
+    """Returns the next non-whitespace character, or '' at the end."""
+    while True:
+      self._pos = _WHITESPACE_PATTERN.match(self._buffer, self._pos).end()
+      if self._pos < len(self._buffer):
+        return self._buffer[self._pos]
+      if self._eof:
+        return ''
+      self._fill()
+
+  def expect(self, expected):
+    actual = self.peek()
+    if actual != expected:
+      raise ValueError('Expected %r but found %r' % (expected, actual))
+    self._pos += 1
+
+  def read_value(self):
+    self.peek()
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        # A number at the end of the buffer may continue in the next chunk.
+        if end < len(self._buffer) or self._eof:
+          self._pos = end
+          return value
+      except ValueError:
+        if self._eof:
+          raise
+      self._fill()
+
+
+def _iterate_array(reader):
+  reader.expect('[')
+  if reader.peek() == ']':
+    reader.expect(']')
+    return
+  while True:
+    yield reader.read_value()
+    separator = reader.peek()
+    if separator == ',':
+      reader.expect(',')
+      # Chrome may leave the array unterminated, with a trailing comma.
+      if reader.peek() in (']', ''):
+        separator = reader.peek()
+    if separator == ']':
+      reader.expect(']')
+      return
+    if separator == '':
+      return
+
+
+def iterate_events(f):
+  """Yields the trace events in the file one by one.
+
+  Both the JSON object format, with the events in 'traceEvents', and the JSON
+  array format are accepted. Other values in the object are ignored.
+  """
+  reader = _JsonReader(f)
+  if reader.peek() == '[':
+    for event in _iterate_array(reader):
+      yield event
+    return
+
+  reader.expect('{')
+  while reader.peek() != '}':
+    key = reader.read_value()
+    reader.expect(':')
+    if key == _TRACE_EVENTS:
+      for event in _iterate_array(reader):
+        yield event
+    else:
+      reader.read_value()
+    if reader.peek() == ',':
+      reader.expect(',')
+
+
+def _write_run(run):
+  run_file = tempfile.TemporaryFile()
+  for key, index, event in run:
+    run_file.write(json.dumps([key, index, event]) + '\n')
+  run_file.seek(0)
+  return run_file
+
+
+def _read_run(run_file):
+  try:
+    for line in run_file:
+      yield tuple(json.loads(line))
+  finally:
+    run_file.close()
+
+
+def sort_events(events, key, max_events_in_memory=_MAX_EVENTS_IN_MEMORY):
+  """Returns an iterator of |events| stably sorted by |key|.
+
+  All the events are consumed before this returns. If there are more than
+  |max_events_in_memory| events, they are sorted in runs which are written to
+  temporary files and merged.
+  """
+  decorated = ((key(event), index, event)
+               for index, event in itertools.izip(itertools.count(), events))
+  run_files = []
+  while True:
+    run = sorted(itertools.islice(decorated, max_events_in_memory))
+    if len(run) < max_events_in_memory and not run_files:
+      return (event for _, _, event in run)
+    if not run:
+      break
+    run_files.append(_write_run(run))
+  return (event for _, _, event in
+          heapq.merge(*[_read_run(run_file) for run_file in run_files]))
+
+
+def write_events(events, output, key=_TRACE_EVENTS, separators=None):
+  """Writes the events as they come.
+
+  The output is the same as json.dump({key: list(events)}), or
+  json.dump(list(events)) if |key| is None.
+  """
+  item_separator = separators[0] if separators else ', '
+  key_separator = separators[1] if separators else ': '
+  if key is not None:
+    output.write('{%s%s' % (json.dumps(key), key_separator))
+  output.write('[')
+  for i, event in enumerate(events):
+    if i:
+      output.write(item_separator)
+    output.write(json.dumps(event, separators=separators))
+  output.write(']')
+  if key is not None:
+    output.write('}')
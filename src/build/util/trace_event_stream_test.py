@@ -0,0 +1,73 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for trace_event_stream.py."""
+
+import cStringIO
+import json
+import unittest
+
+import mock
+
+from src.build.util import trace_event_stream
+
+_EVENTS = [
+    {'name': 'foo', 'ph': 'B', 'ts': 300, 'args': {'x': [1, 2.5, None]}},
+    {'name': 'bar', 'ph': 'E', 'ts': 100},
+    {'name': 'process_name', 'ph': 'M', 'ts': 0},
+    {'name': u'\u3042', 'ph': 'B', 'ts': 100},
+]
+
+
+def _iterate(text):
+  return list(trace_event_stream.iterate_events(cStringIO.StringIO(text)))
+
+
+class TraceEventStreamTest(unittest.TestCase):
+  def test_object_format(self):
+    text = json.dumps({'metadata': {'a': [1, {}]}, 'traceEvents': _EVENTS,
+                       'displayTimeUnit': 'ns'})
+    self.assertEquals(_EVENTS, _iterate(text))
+
+  def test_array_format(self):
+    self.assertEquals(_EVENTS, _iterate(json.dumps(_EVENTS)))
+    self.assertEquals([], _iterate(' [ ] '))
+
+  def test_unterminated_array(self):
+    text = json.dumps(_EVENTS)[:-1]
+    self.assertEquals(_EVENTS, _iterate(text))
+    self.assertEquals(_EVENTS, _iterate(text + ',\n'))
+
+  @mock.patch('src.build.util.trace_event_stream._READ_SIZE', 3)
+  def test_small_chunks(self):
+    text = json.dumps({'traceEvents': [{'ts': 123456}, {'ts': 7}]})
+    self.assertEquals([{'ts': 123456}, {'ts': 7}], _iterate(text))
+
+  def test_broken_trace(self):
+    with self.assertRaises(ValueError):
+      _iterate('[{"ts": 1}, {"ts"')
+
+  def test_sort_events(self):
+    expected = sorted(_EVENTS, key=lambda event: event['ts'])
+    for max_events_in_memory in (1, 2, 3, 100):
+      self.assertEquals(
+          expected,
+          list(trace_event_stream.sort_events(
+              iter(_EVENTS), lambda event: event['ts'],
+              max_events_in_memory=max_events_in_memory)))
+
+  def test_write_events(self):
+    output = cStringIO.StringIO()
+    trace_event_stream.write_events(iter(_EVENTS), output)
+    self.assertEquals(json.dumps({'traceEvents': _EVENTS}), output.getvalue())
+
+    output = cStringIO.StringIO()
+    trace_event_stream.write_events(iter(_EVENTS), output, key=None,
+                                    separators=(',', ':'))
+    self.assertEquals(json.dumps(_EVENTS, separators=(',', ':')),
+                      output.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
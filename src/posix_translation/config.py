@@ -15,6 +15,8 @@ from src.build.util import python_deps
 
 _CREATE_READONLY_FS_IMAGE_SCRIPT = (
     'src/posix_translation/scripts/create_readonly_fs_image.py')
+# The module create_readonly_fs_image.py imports.
+_READONLY_FS_IMAGE_MODULE = 'src/posix_translation/scripts/readonly_fs_image.py'
 
 
 # Mount points for directories.
@@ -206,6 +208,7 @@ def generate_test_ninjas():
           # The script calls create_readonly_fs_image.py.
           implicit=[script_path,
                     _CREATE_READONLY_FS_IMAGE_SCRIPT,
+                    _READONLY_FS_IMAGE_MODULE,
                     ])
   all_files = n.find_all_contained_test_sources()
 
@@ -245,6 +248,9 @@ def generate_test_ninjas():
   all_files = ['src/posix_translation/test_util/mock_virtual_file_system.cc']
   n.build_default(all_files).archive()
 
+  ninja_generator.generate_python_test_ninjas_for_path(
+      'src/posix_translation/scripts')
+
 
 def generate_binaries_depending_ninjas(root_dir_install_all_targets):
   n = ninja_generator.NinjaGenerator('readonly_fs_image')
@@ -266,6 +272,7 @@ def generate_binaries_depending_ninjas(root_dir_install_all_targets):
   # The configure options file is a dependency as symlinks in the read-only
   # file system image changes per the configure options.
   implicit = [_CREATE_READONLY_FS_IMAGE_SCRIPT,
+              _READONLY_FS_IMAGE_MODULE,
               OPTIONS.get_configure_options_file()]
   n.build([gen_img], rule_name, my_dependencies,
           implicit=implicit)
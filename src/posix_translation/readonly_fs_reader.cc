@@ -60,8 +60,6 @@ Dir* ReadonlyFsReader::OpenDirectory(const std::string& name) {
 }
 
 void ReadonlyFsReader::ParseImage(const unsigned char* image_metadata) {
-  // The padding in the image is always for the 64k-page environment.
-  static const size_t kNaCl64PageSize = 64 * 1024;
   // FS image must be aligned to the (native) page size. Otherwise, mmap() will
   // return unaligned address.
   ALOG_ASSERT(AlignTo(image_metadata, util::GetPageSize()) == image_metadata);
@@ -69,6 +67,13 @@ void ReadonlyFsReader::ParseImage(const unsigned char* image_metadata) {
   const unsigned char* p = image_metadata;
   size_t num_files = 0;
   p = ReadUInt32BE(p, &num_files);
+  // The beginning of the content, which is always padded for the 64k-page
+  // environment.
+  uint32_t metadata_size = 0;
+  p = ReadUInt32BE(p, &metadata_size);
+  // Skip the name index. It is for looking up a file without parsing the
+  // whole metadata, but we parse all of it here anyway.
+  p += num_files * sizeof(uint32_t);
 
   std::vector<struct FileInfo_> files;
   files.reserve(num_files);
@@ -95,12 +100,7 @@ void ReadonlyFsReader::ParseImage(const unsigned char* image_metadata) {
     files.push_back(f);
   }
 
-  // Find the beginning of the content.
-  ptrdiff_t metadata_size = p - image_metadata;
-  size_t pad_len = 0;
-  if (metadata_size % kNaCl64PageSize)
-    pad_len = kNaCl64PageSize - (metadata_size % kNaCl64PageSize);
-  metadata_size += pad_len;
+  ALOG_ASSERT(static_cast<uint32_t>(p - image_metadata) <= metadata_size);
 
   for (size_t i = 0; i < files.size(); ++i) {
 #if defined(DEBUG_POSIX_TRANSLATION)
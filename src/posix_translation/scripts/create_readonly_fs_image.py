@@ -9,6 +9,14 @@
 Image file format:
 
 [Number of files]     ; 32bit unsigned, big endian
+[Content offset]      ; 32bit unsigned, big endian, offset of the content of
+                      ; file #1 from the beginning of the image
+[Name index #1]       ; 32bit unsigned, big endian, offset of the metadata of
+                      ; the file with the smallest name from the beginning of
+                      ; the image
+...
+[Name index #n]       ; 32bit unsigned, big endian, offset of the metadata of
+                      ; the file with the largest name
 [Offset of file #1]   ; 32bit unsigned, big endian (always 0x00000000)
 [Size of file #1]     ; 32bit unsigned, big endian
 [mtime of file #1]    ; 32bit unsigned, big endian
@@ -38,7 +46,10 @@ Image file format:
 [Content of file #n]  ; Variable length, page aligned
 EOF
 
-* All offset values are relative to the beginning of the content of file #1.
+* All offset values of files are relative to the beginning of the content of
+  file #1.
+* The name index is sorted by the file names as byte strings, so a file can be
+  looked up with a binary search. See readonly_fs_image.py.
 * Each file's content is aligned to a 64k page so our mmap() implementation
   can return page aligned address on both 4k-page and 64k-page environments.
 * The image file itself should be mapped on a native (4k or 64k) page
@@ -47,20 +58,37 @@ EOF
 
 import argparse
 import array
+import errno
 import os
 import re
 import struct
 import sys
+import tempfile
 import time
 
+import readonly_fs_image
+from readonly_fs_image import EMPTY_DIRECTORY
+from readonly_fs_image import PAGE_SIZE
+from readonly_fs_image import REGULAR_FILE
+from readonly_fs_image import SYMBOLIC_LINK
+
+
+# The size of the chunks to copy file contents into the image.
+_COPY_BUFFER_SIZE = 1024 * 1024
 
-_PAGE_SIZE = 64 * 1024  # NaCl uses 64k page.
 
-# File type constants, which should be consistent with ones in
-# readonly_fs_reader.h.
-_REGULAR_FILE = 0
-_SYMBOLIC_LINK = 1
-_EMPTY_DIRECTORY = 2
+class _Entry(object):
+  """Holds the metadata of a file stored in the image."""
+
+  def __init__(self, filename, file_type, link_target, size, mtime):
+    self.filename = filename
+    self.name = _normalize_path(filename)
+    self.file_type = file_type
+    self.link_target = link_target
+    self.size = size
+    self.mtime = int(mtime)
+    # The offset of the content relative to the content of file #1.
+    self.offset = None
 
 
 def _normalize_path(input_filename):
@@ -71,27 +99,40 @@ def _normalize_path(input_filename):
   return input_filename
 
 
-def _update_metadata(metadata, content, filename, file_size, file_mtime,
-                     file_type, link_target):
-  """Adds name, size, and offset of the |filename| to |metadata|."""
-  # |content| is all the content up to this point.
-  padded_content_size = content.buffer_info()[1]
+def _update_metadata(metadata, entry):
+  """Adds name, size, and offset of the |entry| to |metadata|."""
   _pad_array(metadata, 4)
-  metadata.fromstring(struct.pack('>iiii',
-                                  padded_content_size,
-                                  file_size,
-                                  file_mtime,
-                                  file_type)
-                      + _normalize_path(filename).encode('utf_8')
+  metadata.fromstring(readonly_fs_image.FILE_HEADER.pack(entry.offset,
+                                                         entry.size,
+                                                         entry.mtime,
+                                                         entry.file_type)
+                      + entry.name.encode('utf_8')
                       + '\0')
-  if link_target:
-    metadata.fromstring(link_target.encode('utf_8') + '\0')
+  if entry.link_target:
+    metadata.fromstring(entry.link_target.encode('utf_8') + '\0')
+
 
+def _copy_stream(input_file, size, output, name):
+  """Copies |size| bytes from |input_file| to |output| chunk by chunk."""
+  remaining = size
+  while remaining:
+    data = input_file.read(min(remaining, _COPY_BUFFER_SIZE))
+    if not data:
+      raise EOFError('%s is shorter than %d bytes' % (name, size))
+    output.write(data)
+    remaining -= len(data)
 
-def _update_content(content, filename, size):
-  """Adds the content of the |filename| to |content|."""
-  with open(filename, 'r') as f:
-    content.fromfile(f, size)
+
+def _copy_content(filename, size, output):
+  """Copies the content of the |filename| to |output| chunk by chunk."""
+  with open(filename, 'rb') as f:
+    _copy_stream(f, size, output, filename)
+
+
+def _copy_previous_content(previous_image, offset, size, output):
+  """Copies the content at |offset| in the previous image to |output|."""
+  previous_image.seek(offset)
+  _copy_stream(previous_image, size, output, previous_image.name)
 
 
 def _pad_array(array, boundary):
@@ -104,51 +145,54 @@ def _pad_array(array, boundary):
     array.append(0)
 
 
-def _write_image(image, output_filename):
-  with open(output_filename, 'w') as f:
-    image.tofile(f)
-
-
-def _format_message(i, num_files, size, mtime, file_type, filename,
-                    link_target):
-  if file_type == _REGULAR_FILE:
+def _format_message(i, num_files, entry):
+  if entry.file_type == REGULAR_FILE:
     file_type_name = 'file'
-  elif file_type == _SYMBOLIC_LINK:
+  elif entry.file_type == SYMBOLIC_LINK:
     file_type_name = 'symlink'
-  elif file_type == _EMPTY_DIRECTORY:
+  elif entry.file_type == EMPTY_DIRECTORY:
     file_type_name = 'empty_dir'
   message = 'VERBOSE: [%d/%d] [%s] %s: %d bytes (stored as %s)' % (
-      i + 1, num_files, file_type_name, filename, size,
-      _normalize_path(filename))
-  if file_type == _SYMBOLIC_LINK:
-    message += '-> %s' % link_target
+      i + 1, num_files, file_type_name, entry.filename, entry.size,
+      entry.name)
+  if entry.file_type == SYMBOLIC_LINK:
+    message += '-> %s' % entry.link_target
   return message
 
 
-def _get_metadata(filename, input_filenames, symlink_map, empty_dirs,
+def _get_parent_directories(filenames):
+  """Returns a set of all the ancestor directories of |filenames|."""
+  parent_dirs = set()
+  for filename in filenames:
+    parent_dir = os.path.dirname(filename)
+    while parent_dir and parent_dir not in parent_dirs:
+      parent_dirs.add(parent_dir)
+      parent_dir = os.path.dirname(parent_dir)
+  return parent_dirs
+
+
+def _get_metadata(filename, parent_dirs, symlink_map, empty_dirs,
                   empty_files):
   if filename in symlink_map:
-    file_type = _SYMBOLIC_LINK
+    file_type = SYMBOLIC_LINK
     link_target = symlink_map[filename]
     size = 0
     mtime = time.time()  # Using the current time for a symlink.
   elif filename in empty_dirs:
-    file_type = _EMPTY_DIRECTORY
-    children = filter(lambda x: x.startswith(filename + '/'),
-                      input_filenames)
-    if children:
+    file_type = EMPTY_DIRECTORY
+    if filename in parent_dirs:
       print '%s is not empty' % filename
       sys.exit(1)
     link_target = None
     size = 0
     mtime = time.time()  # Using the current time for an empty directory.
   elif filename in empty_files:
-    file_type = _REGULAR_FILE
+    file_type = REGULAR_FILE
     link_target = None
     size = 0
     mtime = time.time()  # Using the current time for an empty file.
   else:
-    file_type = _REGULAR_FILE
+    file_type = REGULAR_FILE
     link_target = None
     try:
       size = os.stat(filename).st_size
@@ -158,37 +202,145 @@ def _get_metadata(filename, input_filenames, symlink_map, empty_dirs,
   return file_type, link_target, size, mtime
 
 
-def _generate_readonly_image(input_filenames, symlink_map, empty_dirs,
-                             empty_files, verbose, output_filename):
+def _layout_content(entries):
+  """Assigns the content offset to each entry, and returns the content size.
+
+  Each content except the last one is padded to a page boundary.
+  """
+  offset = 0
+  for i, entry in enumerate(entries):
+    entry.offset = offset
+    if entry.file_type == REGULAR_FILE:
+      offset += entry.size
+    if i < len(entries) - 1:
+      offset = readonly_fs_image.align(offset, PAGE_SIZE)
+  return offset
+
+
+def _read_previous_regions(image_filename):
+  """Returns the regions of the regular files in the previous image.
+
+  The result is a dict from the stored name to a tuple of the file offset,
+  size, and mtime. An empty dict is returned if the previous image does not
+  exist, is broken, or is in an old format. The regions which are not
+  entirely in the image, e.g. because it is truncated, are not returned.
+  """
+  try:
+    image_size = os.path.getsize(image_filename)
+    with readonly_fs_image.Reader(image_filename) as reader:
+      if not reader.is_valid():
+        return {}
+      return dict((entry.name, (entry.offset, entry.size, entry.mtime))
+                  for entry in reader
+                  if entry.file_type == REGULAR_FILE and entry.size and
+                  entry.offset + entry.size <= image_size)
+  except (IOError, OSError) as e:
+    if e.errno == errno.ENOENT:
+      return {}
+    raise
+  except (struct.error, ValueError):
+    # The image is too small to have a header, or empty.
+    return {}
+
+
+def _build_metadata(entries):
+  """Returns the metadata of the image, padded to a page boundary."""
+  index_size = (readonly_fs_image.HEADER.size +
+                len(entries) * readonly_fs_image.INDEX_ENTRY.size)
+  # As |index_size| is a multiple of 4, |files| is padded in the same way as
+  # in the image.
+  files = array.array('B')
+  metadata_offsets = []
+  for entry in entries:
+    _pad_array(files, 4)
+    metadata_offsets.append(index_size + files.buffer_info()[1])
+    _update_metadata(files, entry)
+  content_offset = readonly_fs_image.align(
+      index_size + files.buffer_info()[1], PAGE_SIZE)
+
   metadata = array.array('B')
-  content = array.array('B')
+  metadata.fromstring(
+      readonly_fs_image.HEADER.pack(len(entries), content_offset))
+  for i in sorted(xrange(len(entries)),
+                  key=lambda i: entries[i].name.encode('utf_8')):
+    metadata.fromstring(
+        readonly_fs_image.INDEX_ENTRY.pack(metadata_offsets[i]))
+  metadata.extend(files)
+  _pad_array(metadata, PAGE_SIZE)
+  return metadata
+
+
+def _write_image(entries, metadata, content_size, verbose, output_filename):
+  """Writes the image, copying the contents directly into their offsets.
+
+  The image is written to a temporary file which is renamed to the output, so
+  that the previous image is never modified while it may be read. The contents
+  of the files whose name, size and mtime are the same as in the previous image
+  are copied from the previous image, which is read sequentially and is likely
+  in the page cache, rather than from the source files.
+  """
+  previous_regions = _read_previous_regions(output_filename)
+  content_start = metadata.buffer_info()[1]
+  num_reused = 0
+  fd, temp_filename = tempfile.mkstemp(
+      dir=os.path.dirname(os.path.abspath(output_filename)),
+      prefix=os.path.basename(output_filename) + '.')
+  os.close(fd)
+  # mkstemp() creates the file only readable by the owner.
+  os.chmod(temp_filename, 0644)
+  succeeded = False
+  previous_image = open(output_filename, 'rb') if previous_regions else None
+  try:
+    with open(temp_filename, 'wb') as f:
+      metadata.tofile(f)
+      for entry in entries:
+        if entry.file_type != REGULAR_FILE or not entry.size:
+          continue
+        position = content_start + entry.offset
+        f.seek(position)
+        region = previous_regions.get(entry.name)
+        if region and region[1:] == (entry.size, entry.mtime):
+          _copy_previous_content(previous_image, region[0], entry.size, f)
+          num_reused += 1
+        else:
+          _copy_content(entry.filename, entry.size, f)
+        end = position + entry.size
+        f.write('\0' * (readonly_fs_image.align(end, PAGE_SIZE) - end))
+      f.truncate(content_start + content_size)
+    os.rename(temp_filename, output_filename)
+    succeeded = True
+  finally:
+    if previous_image:
+      previous_image.close()
+    if not succeeded:
+      # Do not leave a partially written image. The previous image is kept.
+      os.remove(temp_filename)
+  if verbose:
+    print 'VERBOSE: Reused %d files in the previous image' % num_reused
 
+
+def _generate_readonly_image(input_filenames, symlink_map, empty_dirs,
+                             empty_files, verbose, output_filename):
   input_filenames.extend(symlink_map.keys())
   input_filenames.extend(empty_dirs)
   input_filenames.extend(empty_files)
 
   num_files = len(input_filenames)
-  _pad_array(metadata, 4)
-  metadata.fromstring(struct.pack('>i', num_files))
+  parent_dirs = _get_parent_directories(input_filenames)
+  entries = []
   for i in xrange(num_files):
     filename = input_filenames[i]
     if filename.endswith('/'):
       print '%s should not end with /' % filename
       sys.exit(1)
-    file_type, link_target, size, mtime = _get_metadata(
-        filename, input_filenames, symlink_map, empty_dirs, empty_files)
+    entry = _Entry(filename, *_get_metadata(
+        filename, parent_dirs, symlink_map, empty_dirs, empty_files))
     if verbose:
-      print _format_message(i, num_files, size, mtime, file_type, filename,
-                            link_target)
-    _update_metadata(metadata, content, filename, size, mtime, file_type,
-                     link_target)
-    if file_type == _REGULAR_FILE and size > 0:
-      _update_content(content, filename, size)
-    if i < num_files - 1:
-      _pad_array(content, _PAGE_SIZE)
-  _pad_array(metadata, _PAGE_SIZE)
-  image = metadata + content
-  _write_image(image, output_filename)
+      print _format_message(i, num_files, entry)
+    entries.append(entry)
+  content_size = _layout_content(entries)
+  metadata = _build_metadata(entries)
+  _write_image(entries, metadata, content_size, verbose, output_filename)
 
 
 def main(args):
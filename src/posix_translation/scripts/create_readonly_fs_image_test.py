@@ -0,0 +1,130 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for create_readonly_fs_image.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import create_readonly_fs_image
+import readonly_fs_image
+from readonly_fs_image import EMPTY_DIRECTORY
+from readonly_fs_image import PAGE_SIZE
+from readonly_fs_image import REGULAR_FILE
+from readonly_fs_image import SYMBOLIC_LINK
+
+
+class CreateReadonlyFsImageTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._image = os.path.join(self._tmpdir, 'readonly_fs_image.img')
+    self._foo = self._write('foo', 'foo')
+    self._bar = self._write('bar', 'b' * (PAGE_SIZE + 1))
+    patcher = mock.patch.object(create_readonly_fs_image, '_copy_content',
+                                wraps=create_readonly_fs_image._copy_content)
+    self._copy_content = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def _write(self, name, content, mtime=100):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    os.utime(path, (mtime, mtime))
+    return path
+
+  def _build(self, extra_files=None):
+    create_readonly_fs_image._generate_readonly_image(
+        (extra_files or []) + [self._foo, self._bar], {'/link': '/target'},
+        ['/empty_dir'], ['/empty_file'], False, self._image)
+
+  def _read_image(self):
+    with readonly_fs_image.Reader(self._image) as reader:
+      self.assertTrue(reader.is_valid())
+      return dict((entry.name, reader.read(entry)) for entry in reader)
+
+  def test_round_trip(self):
+    self._build()
+    with readonly_fs_image.Reader(self._image) as reader:
+      self.assertTrue(reader.is_valid())
+      entries = list(reader)
+      self.assertEquals(
+          [(self._foo, REGULAR_FILE, 3, 100, None),
+           (self._bar, REGULAR_FILE, PAGE_SIZE + 1, 100, None),
+           ('/link', SYMBOLIC_LINK, 0, None, '/target'),
+           ('/empty_dir', EMPTY_DIRECTORY, 0, None, None),
+           ('/empty_file', REGULAR_FILE, 0, None, None)],
+          [(entry.name, entry.file_type, entry.size,
+            entry.mtime if entry.file_type == REGULAR_FILE and entry.size
+            else None, entry.link_target) for entry in entries])
+      for entry in entries:
+        self.assertEquals(0, entry.offset % PAGE_SIZE)
+      self.assertEquals('foo', reader.read(entries[0]))
+      self.assertEquals('b' * (PAGE_SIZE + 1), reader.read(entries[1]))
+
+  def test_reuse_unchanged_files(self):
+    self._build()
+    self.assertEquals(2, self._copy_content.call_count)
+    self._build()
+    self.assertEquals(2, self._copy_content.call_count)
+    contents = self._read_image()
+    self.assertEquals('foo', contents[self._foo])
+    self.assertEquals('b' * (PAGE_SIZE + 1), contents[self._bar])
+
+  def test_reuse_moved_files(self):
+    self._build()
+    # The contents of the other files are moved by the new file.
+    baz = self._write('baz', 'baz')
+    self._build(extra_files=[baz])
+    self.assertEquals(3, self._copy_content.call_count)
+    contents = self._read_image()
+    self.assertEquals('baz', contents[baz])
+    self.assertEquals('foo', contents[self._foo])
+    self.assertEquals('b' * (PAGE_SIZE + 1), contents[self._bar])
+
+  def test_same_size_change(self):
+    self._build()
+    self._write('foo', 'baz', mtime=200)
+    self._build()
+    self.assertEquals(3, self._copy_content.call_count)
+    self.assertEquals('baz', self._read_image()[self._foo])
+
+  def test_truncated_previous_image(self):
+    self._build()
+    with readonly_fs_image.Reader(self._image) as reader:
+      bar_end = reader.find(self._bar).offset + PAGE_SIZE + 1
+    with open(self._image, 'r+b') as f:
+      f.truncate(bar_end - 1)
+    self._build()
+    # Only the truncated file is copied from the source again.
+    self.assertEquals(3, self._copy_content.call_count)
+    self.assertEquals('b' * (PAGE_SIZE + 1), self._read_image()[self._bar])
+
+  def test_previous_image_is_not_modified(self):
+    self._build()
+    with readonly_fs_image.Reader(self._image) as reader:
+      self._write('foo', 'baz', mtime=200)
+      self._build()
+      self.assertEquals('foo', reader.read(reader.find(self._foo)))
+    self.assertEquals('baz', self._read_image()[self._foo])
+
+  def test_previous_image_is_kept_on_error(self):
+    self._build()
+    self._write('foo', 'baz', mtime=200)
+    self._copy_content.side_effect = EOFError
+    with self.assertRaises(EOFError):
+      self._build()
+    self.assertEquals('foo', self._read_image()[self._foo])
+    self.assertEquals(['bar', 'foo', 'readonly_fs_image.img'],
+                      sorted(os.listdir(self._tmpdir)))
+
+
+if __name__ == '__main__':
+  unittest.main()
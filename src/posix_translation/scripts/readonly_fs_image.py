@@ -0,0 +1,128 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Reads a read-only file system image generated by create_readonly_fs_image.py.
+
+See create_readonly_fs_image.py for the image file format. The image is mapped
+with mmap, and a file is looked up with a binary search over the name index,
+so that the whole metadata is not parsed.
+
+Usage:
+
+  with readonly_fs_image.Reader(image_filename) as reader:
+    entry = reader.find('/system/build.prop')
+    content = reader.read(entry)
+"""
+
+import collections
+import mmap
+import struct
+
+
+PAGE_SIZE = 64 * 1024  # NaCl uses 64k page.
+
+# File type constants, which should be consistent with ones in
+# readonly_fs_reader.h.
+REGULAR_FILE = 0
+SYMBOLIC_LINK = 1
+EMPTY_DIRECTORY = 2
+
+# [Number of files] and [Offset of the content of file #1].
+HEADER = struct.Struct('>II')
+# [Metadata offset of the file with the i-th smallest name].
+INDEX_ENTRY = struct.Struct('>I')
+# [Offset], [Size], [mtime] and [Type] of a file.
+FILE_HEADER = struct.Struct('>iiii')
+
+# |offset| is the offset of the content in the image file.
+Entry = collections.namedtuple(
+    'Entry', ['name', 'offset', 'size', 'mtime', 'file_type', 'link_target'])
+
+
+def align(size, boundary):
+  """Rounds up the size to a next boundary."""
+  return (size + boundary - 1) & ~(boundary - 1)
+
+
+class Reader(object):
+  """Provides random access to the files in an image."""
+
+  def __init__(self, image_filename):
+    with open(image_filename, 'rb') as f:
+      self._image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.num_files, self.content_offset = HEADER.unpack_from(self._image, 0)
+
+  def close(self):
+    self._image.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def _read_string(self, offset):
+    end = self._image.find('\0', offset)
+    if end < 0:
+      raise ValueError('Unterminated string at %d' % offset)
+    return self._image[offset:end], end + 1
+
+  def _read_entry(self, offset):
+    """Returns the entry at |offset| in the metadata, and the next offset."""
+    offset = align(offset, 4)
+    content_offset, size, mtime, file_type = FILE_HEADER.unpack_from(
+        self._image, offset)
+    name, offset = self._read_string(offset + FILE_HEADER.size)
+    link_target = None
+    if file_type == SYMBOLIC_LINK:
+      link_target, offset = self._read_string(offset)
+    entry = Entry(name, self.content_offset + content_offset, size, mtime,
+                  file_type, link_target)
+    return entry, offset
+
+  def _iterate_entries(self):
+    offset = HEADER.size + self.num_files * INDEX_ENTRY.size
+    for _ in xrange(self.num_files):
+      entry, offset = self._read_entry(offset)
+      yield entry, offset
+
+  def __iter__(self):
+    """Yields the entries in the order stored in the image."""
+    for entry, _ in self._iterate_entries():
+      yield entry
+
+  def is_valid(self):
+    """Returns True if the metadata ends right before the content.
+
+    This parses the whole metadata, and is useful to reject an image which is
+    broken or in another format.
+    """
+    offset = HEADER.size + self.num_files * INDEX_ENTRY.size
+    try:
+      for _, offset in self._iterate_entries():
+        pass
+    except (struct.error, ValueError):
+      return False
+    return align(offset, PAGE_SIZE) == self.content_offset
+
+  def find(self, name):
+    """Returns the entry of |name|, or None if it is not in the image."""
+    low = 0
+    high = self.num_files
+    while low < high:
+      middle = (low + high) // 2
+      metadata_offset = INDEX_ENTRY.unpack_from(
+          self._image, HEADER.size + middle * INDEX_ENTRY.size)[0]
+      entry, _ = self._read_entry(metadata_offset)
+      if entry.name < name:
+        low = middle + 1
+      elif entry.name > name:
+        high = middle
+      else:
+        return entry
+    return None
+
+  def read(self, entry):
+    """Returns the content of the file of |entry|."""
+    return self._image[entry.offset:entry.offset + entry.size]
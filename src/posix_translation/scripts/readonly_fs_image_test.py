@@ -0,0 +1,65 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittest for readonly_fs_image.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import create_readonly_fs_image
+import readonly_fs_image
+
+
+class ReaderTest(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._image = os.path.join(self._tmpdir, 'readonly_fs_image.img')
+    # The names are stored in a different order from the sorted one.
+    create_readonly_fs_image._generate_readonly_image(
+        [], {'/system/link': '/system/b'}, ['/system/a', '/z'], ['/b'], False,
+        self._image)
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def test_find(self):
+    with readonly_fs_image.Reader(self._image) as reader:
+      self.assertEquals(4, reader.num_files)
+      # The first and the last entries in the name index.
+      self.assertEquals('/b', reader.find('/b').name)
+      self.assertEquals('/z', reader.find('/z').name)
+      entry = reader.find('/system/link')
+      self.assertEquals(readonly_fs_image.SYMBOLIC_LINK, entry.file_type)
+      self.assertEquals('/system/b', entry.link_target)
+      self.assertEquals(readonly_fs_image.EMPTY_DIRECTORY,
+                        reader.find('/system/a').file_type)
+      # Missing entries before, between and after the existing names.
+      self.assertIsNone(reader.find('/a'))
+      self.assertIsNone(reader.find('/system'))
+      self.assertIsNone(reader.find('/zz'))
+
+  def test_is_valid(self):
+    with readonly_fs_image.Reader(self._image) as reader:
+      self.assertTrue(reader.is_valid())
+
+    # The content does not start right after the metadata.
+    with open(self._image, 'r+b') as f:
+      f.write(readonly_fs_image.HEADER.pack(
+          4, 2 * readonly_fs_image.PAGE_SIZE))
+    with readonly_fs_image.Reader(self._image) as reader:
+      self.assertFalse(reader.is_valid())
+
+    # The metadata is truncated.
+    with open(self._image, 'r+b') as f:
+      f.truncate(64)
+      f.seek(0)
+      f.write(readonly_fs_image.HEADER.pack(4, readonly_fs_image.PAGE_SIZE))
+    with readonly_fs_image.Reader(self._image) as reader:
+      self.assertFalse(reader.is_valid())
+
+
+if __name__ == '__main__':
+  unittest.main()